@@ -0,0 +1,117 @@
+"""
+Mede o efeito da separação quente/fria (details.py) no tamanho da
+collection de scoring e no custo de uma varredura de scoring.
+
+Popula uma collection com findings sintéticos (bench_scoring) com descrição
+e payload de origem de tamanho realista, mede collStats e o tempo de uma
+leitura com a projeção do batch_score_and_update, migra com
+details.migrate e mede de novo. Com --uri usa um MongoDB real (collStats
+do servidor); sem, usa mongomock e estima os tamanhos somando o BSON dos
+documentos.
+
+Uso:
+    python bench_hotcold.py [--size 5000] [--uri mongodb://localhost:27017/] [--out bench_hotcold.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict
+
+import bson
+
+from bench_scoring import _git_commit, synth_population
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCAN_PROJECTION = {"_id": 1, "name": 1, "date": 1, "cve_id": 1, "cvss": 1, "cve": 1, "epss": 1,
+                   "companyCriticality": 1, "tags": 1, "environments": 1}
+_WORDS = ("buffer overflow remote attacker crafted request parser memory corruption denial service "
+          "authentication bypass injection library version upgrade patch vendor advisory").split()
+
+
+def _populate(coll, size: int, desc_words: int) -> None:
+    rnd = random.Random(7)
+    batch = []
+    for doc in synth_population(size):
+        doc["description"] = " ".join(rnd.choice(_WORDS) for _ in range(desc_words))
+        doc["raw"] = {"definition": {"name": doc["name"], "description": doc["description"],
+                                     "solution": " ".join(rnd.choice(_WORDS) for _ in range(desc_words // 2))},
+                      "asset": {"criticality": doc["companyCriticality"], "tags": doc["environments"]}}
+        batch.append(doc)
+        if len(batch) >= 5000:
+            coll.insert_many(batch)
+            batch = []
+    if batch:
+        coll.insert_many(batch)
+
+
+def coll_stats(coll) -> Dict[str, Any]:
+    try:
+        st = coll.database.command("collStats", coll.name)
+        return {"count": st["count"], "size": st["size"], "avgObjSize": st.get("avgObjSize", 0),
+                "storageSize": st.get("storageSize"), "totalIndexSize": st.get("totalIndexSize")}
+    except Exception:
+        n = size = 0
+        for d in coll.find({}):
+            n += 1
+            size += len(bson.encode(d))
+        return {"count": n, "size": size, "avgObjSize": round(size / n, 1) if n else 0, "estimated": True}
+
+
+def _scan(coll) -> float:
+    t0 = time.perf_counter()
+    for _ in coll.find({}, SCAN_PROJECTION, batch_size=5000):
+        pass
+    return round(time.perf_counter() - t0, 4)
+
+
+def run(size: int, uri: str = None, desc_words: int = 80) -> Dict[str, Any]:
+    sys.path.insert(0, ROOT)
+    from details import DETAILS_COLLECTION, migrate
+    if uri:
+        from pymongo import MongoClient
+        db = MongoClient(uri)["bench_hotcold"]
+        db.drop_collection("vulnerability")
+        db.drop_collection(DETAILS_COLLECTION)
+    else:
+        import mongomock
+        db = mongomock.MongoClient()["bench_hotcold"]
+    coll = db["vulnerability"]
+    _populate(coll, size, desc_words)
+    before = {"stats": coll_stats(coll), "scan_s": _scan(coll)}
+    t0 = time.perf_counter()
+    res = migrate(coll)
+    migrate_s = round(time.perf_counter() - t0, 4)
+    after = {"stats": coll_stats(coll), "details": coll_stats(db[DETAILS_COLLECTION]), "scan_s": _scan(coll)}
+    b, a = before["stats"]["size"], after["stats"]["size"]
+    return {
+        "size": size,
+        "backend": "mongodb" if uri else "mongomock",
+        "migrated": res["moved"],
+        "migrate_s": migrate_s,
+        "before": before,
+        "after": after,
+        "hot_size_ratio": round(a / b, 4) if b else None,
+    }
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=5_000)
+    ap.add_argument("--uri")
+    ap.add_argument("--desc-words", type=int, default=80)
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+    out = {"commit": _git_commit(), "python": sys.version.split()[0],
+           "result": run(args.size, args.uri, args.desc_words)}
+    text = json.dumps(out, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Throughput da geração de texto dos tickets contra um servidor mock
+compatível com a API da OpenAI (/v1/chat/completions, com e sem stream).
+
+O mock simula o custo de um servidor local: um overhead fixo por
+requisição (prefill do prompt de sistema), um atraso por token gerado e
+um limite de requisições simultâneas (slots). Compara:
+
+  - sequential: gen_title_desc, um finding por vez, sem streaming
+  - concurrent: llm_engine, 1 finding por prompt, até --slots em paralelo
+  - packed:     llm_engine, --pack findings por prompt, até --slots em paralelo
+
+Uso:
+    python bench_llm.py [--items 32] [--slots 4] [--pack 4] [--out bench_llm.json]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+
+
+def _fake_item(item_id=None):
+    obj = {
+        "titulo": "Atualizar componente vulnerável",
+        "descricao": "Atualize o pacote para a versão corrigida e valide em homologação. "
+                     "Possíveis soluções: talvez rodando o update do pacote resolva; "
+                     "talvez aplicar o patch do fornecedor resolva.",
+    }
+    if item_id is not None:
+        obj = {"id": item_id, **obj}
+    return obj
+
+
+def make_mock_handler(request_latency: float, token_delay: float, slots: int):
+    sem = threading.BoundedSemaphore(slots)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except ConnectionResetError:
+                # cliente fechou a conexão keep-alive no fim do benchmark
+                pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            user = body["messages"][-1]["content"]
+            if user.startswith("Objetos recebidos:"):
+                items = json.loads(user.split("\n", 1)[1])
+                content = json.dumps([_fake_item(it.get("id")) for it in items], ensure_ascii=False)
+            else:
+                content = json.dumps(_fake_item(), ensure_ascii=False)
+            tokens = [content[i:i + CHARS_PER_TOKEN] for i in range(0, len(content), CHARS_PER_TOKEN)]
+            with sem:
+                time.sleep(request_latency)
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for tok in tokens:
+                        time.sleep(token_delay)
+                        chunk = {"choices": [{"delta": {"content": tok}}]}
+                        self._chunk(f"data: {json.dumps(chunk)}\n\n")
+                    self._chunk("data: [DONE]\n\n")
+                    self._chunk("")
+                else:
+                    time.sleep(token_delay * len(tokens))
+                    raw = json.dumps({"choices": [{"message": {"content": content}}]}).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(raw)))
+                    self.end_headers()
+                    self.wfile.write(raw)
+
+        def _chunk(self, text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_mock(request_latency: float, token_delay: float, slots: int):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_mock_handler(request_latency, token_delay, slots))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+
+def _objs(n):
+    return [
+        {"name": f"pkg-{i}", "description": "Buffer overflow no parser", "cve_id": f"CVE-2024-{1000 + i}",
+         "cvss": 7.5, "epss": 0.12, "companyCriticality": 5}
+        for i in range(n)
+    ]
+
+
+def run(items: int, slots: int, pack: int, request_latency: float, token_delay: float) -> dict:
+    server, url = start_mock(request_latency, token_delay, slots)
+    os.environ["LM_STUDIO_URL"] = url
+    # importados depois de apontar LM_STUDIO_URL para o mock
+    from jira_api import gen_title_desc
+    from llm_engine import generate_stream
+
+    objs = _objs(items)
+    out = {"items": items, "slots": slots, "pack": pack,
+           "request_latency_s": request_latency, "token_delay_s": token_delay, "modes": {}}
+
+    t0 = time.perf_counter()
+    first = None
+    for obj in objs:
+        gen_title_desc(obj)
+        first = first or time.perf_counter() - t0
+    total = time.perf_counter() - t0
+    out["modes"]["sequential"] = {"total_s": round(total, 3), "first_s": round(first, 3), "items_per_s": round(items / total, 2)}
+
+    for name, size in (("concurrent", 1), ("packed", pack)):
+        t0 = time.perf_counter()
+        first = None
+        ok = 0
+        for _key, text, err in generate_stream(list(enumerate(objs)), batch_size=size, concurrency=slots):
+            first = first or time.perf_counter() - t0
+            ok += 1 if text is not None else 0
+        total = time.perf_counter() - t0
+        out["modes"][name] = {"total_s": round(total, 3), "first_s": round(first, 3),
+                              "items_per_s": round(items / total, 2), "ok": ok}
+    server.shutdown()
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=32)
+    ap.add_argument("--slots", type=int, default=4)
+    ap.add_argument("--pack", type=int, default=4)
+    ap.add_argument("--request-latency", type=float, default=0.3)
+    ap.add_argument("--token-delay", type=float, default=0.005)
+    ap.add_argument("--out")
+    args = ap.parse_args()
+    res = run(args.items, args.slots, args.pack, args.request_latency, args.token_delay)
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
@@ -0,0 +1,141 @@
+"""
+Compara a exportação em Parquet (parquet_io) com o caminho antigo de
+find() + JSON (um documento por linha) sobre populações sintéticas em
+mongomock: tempo de exportação, tamanho em disco, releitura de colunas
+para análise e importação.
+
+O mongomock domina o tempo de leitura/escrita nos dois lados; a diferença
+entre as linhas mede a serialização e o volume gravado.
+
+Uso:
+    python bench_parquet.py [--sizes 10k,100k] [--batch-rows 10000] [--out bench_parquet.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+from bench_scoring import SIZES, _git_commit, _peak_rss_mb, synth_population
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for base, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(base, f)) for f in files)
+    return total
+
+
+def _populate(coll, size: int) -> None:
+    classes = ("baixa", "media", "alta", "gravissima")
+    batch = []
+    for i, doc in enumerate(synth_population(size)):
+        doc["base_score"] = round((i * 7919 % 1000) / 100.0, 4)
+        doc["priority_class"] = classes[i % 4]
+        batch.append(doc)
+        if len(batch) >= 10_000:
+            coll.insert_many(batch)
+            batch = []
+    if batch:
+        coll.insert_many(batch)
+
+
+def run_one(size: int, batch_rows: int) -> Dict[str, Any]:
+    sys.path.insert(0, ROOT)
+    import mongomock
+    import pyarrow.dataset as ds
+    from bson import json_util
+    from parquet_io import export_parquet, import_parquet, read_dataset
+
+    stages: Dict[str, Dict[str, float]] = {}
+
+    def _stage(name: str, t0: float, **extra) -> None:
+        dt = time.perf_counter() - t0
+        stages[name] = {"seconds": round(dt, 4), "items_per_s": round(size / dt, 1) if dt > 0 else None, **extra}
+
+    coll = mongomock.MongoClient().bench.vulnerabilities
+    _populate(coll, size)
+    work = tempfile.mkdtemp(prefix="bench_pq_")
+    try:
+        pq_dir = os.path.join(work, "parquet")
+        json_path = os.path.join(work, "export.jsonl")
+
+        t0 = time.perf_counter()
+        export_parquet(pq_dir, collection=coll, batch_rows=batch_rows)
+        _stage("export_parquet", t0, bytes=_dir_bytes(pq_dir))
+
+        t0 = time.perf_counter()
+        with open(json_path, "w", encoding="utf-8") as f:
+            for doc in coll.find({}):
+                f.write(json_util.dumps(doc))
+                f.write("\n")
+        _stage("export_json", t0, bytes=os.path.getsize(json_path))
+
+        # consulta analítica típica: score e mês das gravíssimas (2 colunas, 1 partição por mês)
+        t0 = time.perf_counter()
+        table = read_dataset(pq_dir).to_table(
+            columns=["month", "base_score"], filter=ds.field("priority_class") == "gravissima",
+        )
+        _stage("scan_parquet", t0, rows=table.num_rows)
+
+        t0 = time.perf_counter()
+        rows = 0
+        with open(json_path, encoding="utf-8") as f:
+            for line in f:
+                doc = json_util.loads(line)
+                if doc.get("priority_class") == "gravissima":
+                    rows += 1
+        _stage("scan_json", t0, rows=rows)
+
+        target = mongomock.MongoClient().bench_pq.vulnerabilities
+        t0 = time.perf_counter()
+        # rollups ficam de fora: o caminho JSON também não os mantém
+        import_parquet(pq_dir, collection=target, rollups=False)
+        _stage("import_parquet", t0)
+
+        target = mongomock.MongoClient().bench_json.vulnerabilities
+        t0 = time.perf_counter()
+        batch = []
+        with open(json_path, encoding="utf-8") as f:
+            for line in f:
+                batch.append(json_util.loads(line))
+                if len(batch) >= 5000:
+                    target.insert_many(batch)
+                    batch = []
+        if batch:
+            target.insert_many(batch)
+        _stage("import_json", t0)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return {"size": size, "batch_rows": batch_rows, "stages": stages, "peak_rss_mb": _peak_rss_mb()}
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10k,100k")
+    ap.add_argument("--batch-rows", type=int, default=10_000)
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+
+    out: Dict[str, Any] = {"commit": _git_commit(), "python": sys.version.split()[0], "results": []}
+    for label in args.sizes.split(","):
+        size = SIZES.get(label.strip().lower()) or int(label)
+        res = run_one(size, args.batch_rows)
+        out["results"].append(res)
+        print(json.dumps(res), file=sys.stderr)
+
+    text = json.dumps(out, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
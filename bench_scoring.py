@@ -0,0 +1,281 @@
+"""
+Benchmark do pipeline de scoring sobre populações sintéticas.
+
+Mede cada etapa separadamente (leitura, normalize_item,
+compute_raw_scores_dynamic, _kmeans_1d_thresholds, triage_select_raw,
+carga e scoring pelo feature store e write-back) contra dois backends:
+
+  - memory:    dict em memória (custo puro do Python)
+  - mongomock: API do pymongo em memória (custo do driver/BSON simulado)
+
+Cada (tamanho, backend) roda em um subprocesso próprio para que o pico de
+RSS seja só daquela execução. O resultado é um JSON com throughput por
+etapa e o commit atual, para comparar entre commits (--compare).
+
+Uso:
+    python bench_scoring.py [--sizes 10k,100k,1m] [--backends memory,mongomock]
+                            [--capacity 100] [--out bench_scoring.json]
+                            [--compare bench_scoring_anterior.json]
+
+10m é aceito em --sizes, mas precisa de vários GB de RAM. O mongomock
+resolve cada update varrendo a collection (write-back O(n²): ~2 min em
+10k), por isso é limitado por --mongomock-max (padrão 10k); acima disso a
+execução é pulada.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from typing import Any, Dict, Iterator, List
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+WRITE_BATCH_SIZE = 1000
+WEIGHTS = {"cve": 1, "epss": 2, "companyCriticality": 1, "date_norm": 1}
+
+_ENVS = ["PRODUCAO", "HOMOLOGACAO", "DESENVOLVIMENTO"]
+_FAMILIES = ["Web", "OS", "Database", "Network", "Container", None]
+_DATE_FMTS = ("%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d", "%Y-%m")
+
+
+def synth_population(n: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """
+    Findings com distribuições parecidas com as reais: cvss concentrado entre
+    5 e 9, epss com cauda longa (a maioria < 0.05), criticidade 1..5 com mais
+    peso no meio, datas dos últimos 6 anos em formatos variados, ~10% sem
+    cvss/epss e ~5% marcados como OK.
+    """
+    rnd = random.Random(seed)
+    today = date.today()
+    for i in range(n):
+        cvss = None if rnd.random() < 0.1 else round(min(10.0, max(0.0, rnd.gauss(6.8, 1.8))), 1)
+        epss = None if rnd.random() < 0.1 else round(min(1.0, rnd.lognormvariate(-4.0, 1.6)), 5)
+        months_ago = int(rnd.expovariate(1 / 14.0)) % 72
+        y, m = divmod(today.year * 12 + today.month - 1 - months_ago, 12)
+        d = date(y, m + 1, rnd.randint(1, 28)).strftime(rnd.choice(_DATE_FMTS))
+        envs = [rnd.choice(_ENVS)]
+        if rnd.random() < 0.05:
+            envs.append("OK")
+        yield {
+            "_id": i,
+            "name": f"pkg-{rnd.randint(0, n // 10 + 1)}",
+            "cve_id": f"CVE-{y}-{rnd.randint(1000, 99999)}",
+            "cvss": cvss,
+            "epss": epss,
+            "companyCriticality": rnd.choices([1, 2, 3, 4, 5], weights=[1, 2, 4, 2, 1])[0],
+            "date": d,
+            "environments": envs,
+            "family": rnd.choice(_FAMILIES),
+        }
+
+
+class MemoryBackend:
+    """Backend mínimo: dict _id -> documento, com find/bulk_write por $set."""
+
+    def __init__(self):
+        self.docs: Dict[Any, Dict[str, Any]] = {}
+
+    def insert_many(self, docs: List[Dict[str, Any]]) -> None:
+        for d in docs:
+            self.docs[d["_id"]] = d
+
+    def find(self, query=None, projection=None):
+        keep = [k for k, v in (projection or {}).items() if v]
+        for d in self.docs.values():
+            yield {k: d.get(k) for k in keep} if keep else dict(d)
+
+    def bulk_write(self, ops, ordered: bool = False) -> None:
+        for op in ops:
+            doc = op._filter["_id"]
+            self.docs[doc].update(op._doc["$set"])
+
+
+def _make_backend(name: str):
+    if name == "memory":
+        return MemoryBackend()
+    import mongomock
+    return mongomock.MongoClient().bench.vulnerabilities
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_one(size: int, backend: str, capacity: int) -> Dict[str, Any]:
+    sys.path.insert(0, ROOT)
+    from pymongo import UpdateOne
+    from calculator import normalize_item, weights_to_params
+    from calculator_helper import ScoringPlan, compute_raw_scores_dynamic, _kmeans_1d_thresholds, triage_select_raw
+    from feature_store import FeatureStore, score_store
+
+    stages: Dict[str, Dict[str, float]] = {}
+
+    def _stage(name: str, t0: float, count: int) -> None:
+        dt = time.perf_counter() - t0
+        stages[name] = {"seconds": round(dt, 4), "items_per_s": round(count / dt, 1) if dt > 0 else None}
+
+    coll = _make_backend(backend)
+    batch: List[Dict[str, Any]] = []
+    t0 = time.perf_counter()
+    for doc in synth_population(size):
+        batch.append(doc)
+        if len(batch) >= 10_000:
+            coll.insert_many(batch)
+            batch = []
+    if batch:
+        coll.insert_many(batch)
+    _stage("load", t0, size)
+
+    proj = {"_id": 1, "name": 1, "date": 1, "cve_id": 1, "cvss": 1, "epss": 1,
+            "companyCriticality": 1, "environments": 1}
+    t0 = time.perf_counter()
+    docs = list(coll.find({}, proj))
+    _stage("read", t0, size)
+
+    t0 = time.perf_counter()
+    items = [normalize_item(d) for d in docs]
+    _stage("normalize_item", t0, size)
+
+    # feature store: carga (uma vez, como faria o build) e scoring vetorizado sem Mongo
+    store_dir = tempfile.mkdtemp(prefix="bench_fs_")
+    try:
+        store = FeatureStore(os.path.join(store_dir, "v"))
+        t0 = time.perf_counter()
+        for start in range(0, size, 50_000):
+            store.upsert(docs[start:start + 50_000])
+        _stage("feature_store_load", t0, size)
+        plan = ScoringPlan(weights_to_params(WEIGHTS), cut_mode="kmeans")
+        t0 = time.perf_counter()
+        score_store(plan, store)
+        _stage("feature_store_score", t0, size)
+        del store
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+    del docs
+
+    params = weights_to_params(WEIGHTS)
+    t0 = time.perf_counter()
+    scored = compute_raw_scores_dynamic(items, params=params)
+    _stage("compute_raw_scores_dynamic", t0, size)
+
+    scores = [r["_raw_score"] for r in scored]
+    t0 = time.perf_counter()
+    t1, t2, t3 = _kmeans_1d_thresholds(scores, k=4)
+    _stage("_kmeans_1d_thresholds", t0, size)
+
+    # triage_select_raw refaz score + cortes internamente: mede a chamada completa
+    t0 = time.perf_counter()
+    triage = triage_select_raw(items, capacity=capacity, params=params)
+    _stage("triage_select_raw", t0, size)
+    del items
+
+    t0 = time.perf_counter()
+    ops = []
+    for r in scored:
+        s = r["_raw_score"]
+        cls = "baixa" if s <= t1 else "media" if s <= t2 else "alta" if s <= t3 else "gravissima"
+        ops.append(UpdateOne({"_id": r["_id"]}, {"$set": {"base_score": s, "priority_class": cls}}))
+        if len(ops) >= WRITE_BATCH_SIZE:
+            coll.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        coll.bulk_write(ops, ordered=False)
+    _stage("write_back", t0, size)
+
+    return {
+        "size": size,
+        "backend": backend,
+        "capacity": capacity,
+        "selected": len(triage["selected"]),
+        "stages": stages,
+        "total_s": round(sum(s["seconds"] for s in stages.values()), 4),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _spawn(size: int, backend: str, capacity: int) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", str(size), backend, "--capacity", str(capacity)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"size": size, "backend": backend, "error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> List[str]:
+    """Linhas 'backend/tamanho/etapa: antes -> agora (x)' para as execuções em comum."""
+    prev = {(r["backend"], r["size"]): r for r in previous.get("results", []) if "stages" in r}
+    lines = []
+    for r in current.get("results", []):
+        old = prev.get((r.get("backend"), r.get("size")))
+        if not old or "stages" not in r:
+            continue
+        for stage, cur in r["stages"].items():
+            before = old["stages"].get(stage, {}).get("seconds")
+            if before:
+                lines.append(f"{r['backend']}/{r['size']}/{stage}: {before:.3f}s -> {cur['seconds']:.3f}s "
+                             f"(x{cur['seconds'] / before:.2f})")
+        lines.append(f"{r['backend']}/{r['size']}/peak_rss_mb: {old.get('peak_rss_mb')} -> {r.get('peak_rss_mb')}")
+    return lines
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10k,100k,1m")
+    ap.add_argument("--backends", default="memory,mongomock")
+    ap.add_argument("--capacity", type=int, default=100)
+    ap.add_argument("--mongomock-max", default="10k")
+    ap.add_argument("--out")
+    ap.add_argument("--compare")
+    ap.add_argument("--worker", nargs=2, metavar=("SIZE", "BACKEND"), help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_one(int(args.worker[0]), args.worker[1], args.capacity)))
+        return
+
+    mongomock_max = SIZES.get(args.mongomock_max.lower()) or int(args.mongomock_max)
+    out: Dict[str, Any] = {"commit": _git_commit(), "python": sys.version.split()[0], "results": []}
+    for label in args.sizes.split(","):
+        size = SIZES.get(label.strip().lower()) or int(label)
+        for backend in args.backends.split(","):
+            backend = backend.strip()
+            if backend == "mongomock" and size > mongomock_max:
+                out["results"].append({"size": size, "backend": backend, "skipped": "acima de --mongomock-max"})
+                continue
+            res = _spawn(size, backend, args.capacity)
+            out["results"].append(res)
+            print(json.dumps(res), file=sys.stderr)
+
+    text = json.dumps(out, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(out, json.load(f)):
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
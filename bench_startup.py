@@ -0,0 +1,54 @@
+"""
+Mede o custo de import dos módulos de entrada (cold start do Streamlit).
+Cada módulo é importado em um processo novo; o tempo do interpretador
+vazio é descontado. Uso:
+
+    python bench_startup.py [--repeat 5] [--out bench_startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = ["db", "calculator", "functions", "main"]
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _time_import(stmt: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", stmt], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def run(repeat: int = 5) -> dict:
+    baseline = _time_import("pass", repeat)
+    # dependências de terceiros pagam o próprio import; descontadas separadamente
+    deps = _time_import("import pymongo, requests", repeat)
+    out = {"python": sys.version.split()[0], "baseline_s": round(baseline, 4), "deps_s": round(deps, 4), "modules": {}}
+    for mod in MODULES:
+        t = _time_import(f"import {mod}", repeat)
+        out["modules"][mod] = {
+            "total_s": round(t, 4),
+            "own_s": round(max(0.0, t - deps), 4),
+        }
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out")
+    args = ap.parse_args()
+    res = run(args.repeat)
+    text = json.dumps(res, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
@@ -0,0 +1,105 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import streamlit as st
+
+from functions import get_all_vulnerabilities_paginated, get_vulnerabilities_filtered
+from calculator_helper import select_top_gravissima
+from rollups import load_rollups, load_histogram
+from score_meta import get_versions
+from db import vulnerabilities_collection
+from whatif import build_feature_columns, build_feature_columns_from_store, what_if
+
+# Cache das consultas da UI. Toda chave inclui as versões do score_meta: a
+# dos scores, que batch_score_and_update incrementa, e a dos dados, que as
+# escritas de rollups e do feature store incrementam (ingestão,
+# enriquecimento, dedup, arquivo). Qualquer mudança gera chaves novas e as
+# entradas antigas expiram por TTL / max_entries.
+CACHE_TTL = int(os.environ.get("VULN_CACHE_TTL", "600"))
+CACHE_MAX_ENTRIES = int(os.environ.get("VULN_CACHE_MAX_ENTRIES", "64"))
+# janela em que uma versão publicada por outro processo pode demorar a ser vista
+VERSION_TTL = int(os.environ.get("VULN_CACHE_VERSION_TTL", "2"))
+
+
+@st.cache_data(ttl=VERSION_TTL, show_spinner=False)
+def current_versions() -> Tuple[int, int]:
+    return get_versions(vulnerabilities_collection)
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _page(versions: Tuple[int, int], page: int, page_size: int) -> List[Dict[str, Any]]:
+    return get_all_vulnerabilities_paginated(page=page, page_size=page_size)
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _filtered(versions: Tuple[int, int], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return get_vulnerabilities_filtered(**filters)
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _top_gravissima(versions: Tuple[int, int], weights: Dict[str, float], limit: int) -> Dict[str, Any]:
+    res = select_top_gravissima(collection=vulnerabilities_collection, weights=weights, limit=limit)
+    # 'items' é a população inteira; não vale a pena manter em memória
+    return {"thresholds_raw": res.get("thresholds_raw"), "selected": res.get("selected", [])}
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _rollups(versions: Tuple[int, int]) -> List[Dict[str, Any]]:
+    return load_rollups()
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _histogram(versions: Tuple[int, int], metric: str) -> List[Dict[str, Any]]:
+    return load_histogram(metric)
+
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=2, show_spinner=False)
+def _feature_columns(versions: Tuple[int, int]) -> Dict[str, Any]:
+    # objeto grande e somente leitura: compartilhado entre sessões, sem cópia
+    from feature_store import open_store
+    store = open_store(vulnerabilities_collection)
+    if store.exists:
+        return build_feature_columns_from_store(store, collection=vulnerabilities_collection)
+    return build_feature_columns(vulnerabilities_collection)
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _what_if(versions: Tuple[int, int], weights: Dict[str, float], top_n: int) -> Dict[str, Any]:
+    return what_if(_feature_columns(versions), weights, top_n=top_n)
+
+
+def cached_vulnerabilities_page(page: int = 1, page_size: int = 20) -> List[Dict[str, Any]]:
+    return _page(current_versions(), page, page_size)
+
+
+def cached_vulnerabilities_filtered(**filters) -> List[Dict[str, Any]]:
+    return _filtered(current_versions(), filters)
+
+
+def cached_top_gravissima(weights: Dict[str, float], limit: int = 30) -> Dict[str, Any]:
+    return _top_gravissima(current_versions(), dict(weights), int(limit))
+
+
+def cached_rollups() -> List[Dict[str, Any]]:
+    return _rollups(current_versions())
+
+
+def cached_histogram(metric: str) -> List[Dict[str, Any]]:
+    return _histogram(current_versions(), metric)
+
+
+def cached_what_if(weights: Dict[str, float], top_n: int = 20) -> Dict[str, Any]:
+    """Resultado por vetor de pesos; as colunas robust-z são reaproveitadas."""
+    return _what_if(current_versions(), dict(weights), int(top_n))
+
+
+def invalidate() -> None:
+    """Descarta tudo; chamado por quem acabou de disparar um re-score neste processo."""
+    current_versions.clear()
+    _page.clear()
+    _filtered.clear()
+    _top_gravissima.clear()
+    _rollups.clear()
+    _histogram.clear()
+    _feature_columns.clear()
+    _what_if.clear()
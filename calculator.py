@@ -1,16 +1,36 @@
 from __future__ import annotations
+import argparse
 import os
 import sys
 import json
-from typing import Any, Dict, List, Optional
+import shutil
+import tempfile
+from array import array
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
 from bson import ObjectId
+from pymongo import UpdateOne
 
 from db import vulnerabilities_collection as DEFAULT_COLLECTION
 
 from calculator_helper import (
-    compute_scores_and_clusters_free,
-    date_score_months,
+    CLASSES,
+    ScoringPlan,
+    ensure_score_indexes,
+    normalize_item,
+    weights_to_params,
 )
+from rollups import refresh_score_rollups
+from score_meta import (
+    allocate_generation,
+    bump_score_version,
+    gc_generations,
+    generation_fields,
+    resolve_scores,
+    score_fields,
+    score_projection,
+)
+import instrumentation
+import order_stats
 
 
 def _as_object_id(_id: Any) -> ObjectId:
@@ -21,53 +41,34 @@ def _as_object_id(_id: Any) -> ObjectId:
     return ObjectId(str(_id))
 
 
-def _clamp01_to_010(x: Any) -> float:
-    try:
-        v = float(x)
-    except Exception:
-        v = 0.0
-    if v < 0:
-        v = 0.0
-    if v > 1:
-        if v <= 10:
-            return v
-        return 10.0
-    return v * 10.0
-
-
-def _clamp_010(x: Any) -> float:
+def _carry_scores(
+    coll,
+    match: Dict[str, Any],
+    src: Dict[str, str],
+    dst: Dict[str, str],
+    batch_size: int,
+) -> int:
+    """Copia score/classe de `src` para `dst` nos documentos de `match` (re-score parcial)."""
+    ops: List[UpdateOne] = []
+    copied = 0
+    cursor = coll.find(match, score_projection(src), no_cursor_timeout=True)
     try:
-        v = float(x)
-    except Exception:
-        v = 0.0
-    if v < 0:
-        return 0.0
-    if v > 10:
-        return 10.0
-    return v
-
-
-def normalize_item(it: Dict[str, Any]) -> Dict[str, Any]:
-    o = dict(it)
-    if "epss" in o:
-        o["epss"] = _clamp01_to_010(o.get("epss"))
-    if "cvss" in o and "cve" not in o:
-        o["cve"] = _clamp_010(o.get("cvss"))
-    else:
-        o["cve"] = _clamp_010(o.get("cve", 0))
-    o["companyCriticality"] = _clamp_010(o.get("companyCriticality", 0))
-    o["date_norm"] = date_score_months(o.get("date"), horizon_months=60, mode="exp", k=3.0)
-    return o
-
-
-def weights_to_params(weights: Dict[str, float]) -> Dict[str, Any]:
-    fields = {}
-    for k, w in (weights or {}).items():
-        try:
-            fields[k] = {"weight": float(w)}
-        except Exception:
-            fields[k] = {"weight": 1.0}
-    return {"fields": fields}
+        for doc in cursor:
+            resolve_scores(doc, src)
+            if doc.get("base_score") is None and doc.get("priority_class") is None:
+                continue
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+                dst["score"]: doc.get("base_score"), dst["class"]: doc.get("priority_class")}}))
+            if len(ops) >= batch_size:
+                coll.bulk_write(ops, ordered=False)
+                copied += len(ops)
+                ops = []
+    finally:
+        cursor.close()
+    if ops:
+        coll.bulk_write(ops, ordered=False)
+        copied += len(ops)
+    return copied
 
 
 def batch_score_and_update(
@@ -76,8 +77,24 @@ def batch_score_and_update(
     weights: Dict[str, float],
     query: Optional[Dict[str, Any]] = None,
     projection: Optional[Dict[str, int]] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    write_batch_size: int = 1000,
+    store=None,
 ) -> Dict[str, Any]:
-    coll = DEFAULT_COLLECTION
+    """
+    Re-score de toda a collection (ou de `query`). `progress`, se informado,
+    recebe {'stage', 'processed', 'written', 'total'} a cada lote lido/gravado.
+    Com `store` (feature_store.FeatureStore) e sem `query`, as features vêm
+    do store local em vez de uma varredura do Mongo. Com `query`, os documentos
+    fora dela levam para a geração nova o score que tinham na corrente — só
+    se a corrente foi calculada com os mesmos pesos; senão o re-score vira
+    completo (`query_ignored` no retorno), para a geração não misturar pesos.
+
+    Os scores vão para uma geração nova (gen_scores.g<N>); leitores continuam
+    vendo a geração anterior até o switchover no score_meta, feito só depois
+    de todas as escritas. Um re-score interrompido não aparece para ninguém.
+    """
+    coll = collection if collection is not None else DEFAULT_COLLECTION
     q = query or {}
     proj = projection or {
         "_id": 1,
@@ -91,33 +108,111 @@ def batch_score_and_update(
         "tags": 1,
         "environments": 1,
     }
-    total = coll.count_documents(q)
-    cursor = coll.find(q, proj, no_cursor_timeout=True)
-    items_norm: List[Dict[str, Any]] = []
-    ids: List[Any] = []
+    def _report(stage: str, processed: int, written: int) -> None:
+        if progress is not None:
+            progress({"stage": stage, "processed": processed, "written": written, "total": total})
+
+    with instrumentation.span("score.batch") as root:
+        # plano compilado uma vez; cada documento vira só uma linha nas colunas
+        plan = ScoringPlan(weights_to_params(weights), cut_mode="kmeans")
+        query_ignored = bool(q) and not order_stats.weights_match(coll, plan)
+        if query_ignored:
+            # pesos mudaram: carregar scores antigos deixaria a geração com pesos misturados
+            q = {}
+            root.set(query_ignored=True)
+        if store is not None and not q:
+            # features do store local: nada é lido do Mongo (o store precisa estar em dia)
+            from feature_store import score_store
+            res = score_store(plan, store)
+            ids = store.ids_at(res["rows"])
+            total = len(ids)
+            root.set(total=total, read=total, source="feature_store")
+            if not ids:
+                return {"updated": 0, "skipped": 0, "total": 0, "thresholds_raw": {"t1": 0, "t2": 0, "t3": 0}}
+            scores = res["scores"].tolist()
+            thresholds_raw = res["thresholds_raw"]
+            classes = [CLASSES[c] for c in res["classes"].tolist()]
+            del res
+        else:
+            total = coll.count_documents(q)
+            cursor = coll.find(q, proj, no_cursor_timeout=True)
+            columns = plan.new_columns()
+            ids = []
+            # leitura do cursor e normalização são intercaladas: o timer separa as duas
+            norm = instrumentation.timer("score.normalize")
+            try:
+                with instrumentation.span("score.read"):
+                    for doc in cursor:
+                        ids.append(doc.get("_id"))
+                        with norm:
+                            plan.append(columns, doc)
+                        if len(ids) % write_batch_size == 0:
+                            _report("reading", len(ids), 0)
+            finally:
+                cursor.close()
+                norm.close()
+            root.set(total=total, read=len(ids))
+            _report("scoring", len(ids), 0)
+            if not ids:
+                return {"updated": 0, "skipped": 0, "total": total, "thresholds_raw": {"t1": 0, "t2": 0, "t3": 0}}
+            with instrumentation.span("scores.raw", n=len(ids)):
+                scores = plan.score_batch(columns)
+            del columns
+            thresholds_raw, classes = plan.classify(scores)
+        generation = allocate_generation(coll)
+        fields = generation_fields(generation)
+        f_score, f_class = fields["score"], fields["class"]
+        root.set(generation=generation)
+        updated = 0
+        skipped = 0
+        ops: List[UpdateOne] = []
+        with instrumentation.span("score.write"):
+            for _id, base_score, priority_class in zip(ids, scores, classes):
+                ops.append(UpdateOne({"_id": _id}, {"$set": {f_score: float(base_score), f_class: priority_class}}))
+                if len(ops) >= write_batch_size:
+                    coll.bulk_write(ops, ordered=False)
+                    updated += len(ops)
+                    ops = []
+                    _report("writing", len(ids), updated)
+            if ops:
+                coll.bulk_write(ops, ordered=False)
+                updated += len(ops)
+        instrumentation.count("score.updated", updated)
+        _report("writing", len(ids), updated)
+        if q:
+            # re-score parcial: o resto da collection não pode sumir no switchover
+            with instrumentation.span("score.carry") as sp:
+                sp.set(copied=_carry_scores(coll, {"$nor": [q]}, score_fields(coll), fields, write_batch_size))
+        ensure_score_indexes(coll, fields)
+        # switchover: geração corrente e versão mudam na mesma escrita
+        version = bump_score_version(coll, weights=weights, thresholds_raw=thresholds_raw, generation=generation)
+        with instrumentation.span("score.rollups"):
+            refresh_score_rollups(coll, fields)
+        gc_generations(coll)
+    return {
+        "updated": updated,
+        "score_version": version,
+        "generation": generation,
+        "skipped": skipped,
+        "total": total,
+        "thresholds_raw": thresholds_raw,
+        "query_ignored": query_ignored,
+    }
+
+
+def _score_full(coll, plan: ScoringPlan, oid: ObjectId, doc: Dict[str, Any]) -> Tuple[float, str, Dict[str, float]]:
+    """Score de `doc` com uma varredura da população (com `doc` no lugar da versão persistida)."""
+    columns = plan.new_columns()
+    cursor = coll.find({"_id": {"$ne": oid}}, {f: 1 for f in order_stats.source_fields(plan)}, batch_size=5000)
     try:
-        for doc in cursor:
-            ids.append(doc.get("_id"))
-            items_norm.append(normalize_item(doc))
+        for other in cursor:
+            plan.append(columns, other)
     finally:
         cursor.close()
-    if not items_norm:
-        return {"updated": 0, "skipped": 0, "total": total, "thresholds_raw": {"t1": 0, "t2": 0, "t3": 0}}
-    params = weights_to_params(weights)
-    res = compute_scores_and_clusters_free(items_norm, params=params, cut_mode="kmeans")
-    by_id: Dict[str, Dict[str, Any]] = {str(it.get("_id")): it for it in res["items"]}
-    updated = 0
-    skipped = 0
-    for _id in ids:
-        it = by_id.get(str(_id))
-        if not it:
-            skipped += 1
-            continue
-        base_score = float(it.get("_raw_score", 0.0))
-        priority_class = str(it.get("_class", "media"))
-        coll.update_one({"_id": _id}, {"$set": {"base_score": base_score, "priority_class": priority_class}})
-        updated += 1
-    return {"updated": updated, "skipped": skipped, "total": total, "thresholds_raw": res.get("thresholds_raw")}
+    plan.append(columns, doc)
+    scores = plan.score_batch(columns)
+    thresholds_raw, classes = plan.classify(scores)
+    return float(scores[-1]), classes[-1], thresholds_raw
 
 
 def score_and_update(
@@ -125,58 +220,183 @@ def score_and_update(
     params: Dict[str, Any],
     *,
     collection=None,
-    sample_size: int = 1000,
 ) -> Dict[str, Any]:
-    coll = collection or DEFAULT_COLLECTION
+    """
+    Score de um finding existente contra a população inteira, sem reler a
+    collection: mediana/MAD por campo e cortes vêm das estatísticas de ordem
+    incrementais (order_stats), atualizadas com a troca das features e do
+    score do documento. `doc` pode ser parcial: os campos ausentes vêm do
+    documento persistido. Com pesos diferentes dos scores persistidos a série
+    de scores não serve: cai no cálculo completo, numa varredura.
+
+    Os cortes são aproximados: os scores dos demais documentos foram
+    calculados contra as medianas do último re-score em lote e se afastam
+    de uma varredura completa à medida que findings são atualizados um a um.
+    As features e o score são gravados juntos; rollups e feature store acompanham.
+    """
+    import feature_store
+    from rollups import RollupDelta
+
+    coll = collection if collection is not None else DEFAULT_COLLECTION
 
     if "_id" not in doc:
         raise ValueError("Documento precisa conter _id para atualizar no Mongo.")
     oid = _as_object_id(doc["_id"])
 
-    sample: List[Dict[str, Any]] = list(coll.find({}, limit=sample_size))
-    found = any(str(x.get("_id")) == str(oid) for x in sample)
-    if not found:
-        sample.append(doc)
+    plan = ScoringPlan(params, cut_mode="kmeans")
+    fields = score_fields(coll)
+    old = coll.find_one({"_id": oid})
+    if old is None:
+        raise ValueError(f"Finding {oid} não existe na collection.")
+    resolve_scores(old, fields)
+    merged = {**old, **doc, "_id": oid}
+    features = {f: merged[f] for f in order_stats.source_fields(plan) if f in merged}
+    with instrumentation.span("score.single") as sp:
+        if not order_stats.weights_match(coll, plan):
+            sp.set(path="full")
+            base_score, priority_class, thresholds_raw = _score_full(coll, plan, oid, merged)
+            stats = None
+        else:
+            stats = order_stats.get_stats(coll, plan)
+            stats.replace_doc(plan, old, merged)
+            base_score = stats.score(plan, merged)
+            stats.replace_score(old.get("base_score"), base_score)
+            thresholds_raw = stats.thresholds(plan)
+            priority_class = order_stats.classify(base_score, thresholds_raw)
 
-    items_norm = [normalize_item(x) for x in sample]
-
-    res = compute_scores_and_clusters_free(
-        items_norm,
-        params=params,
-        cut_mode="kmeans",
-    )
-
-    target = None
-    for r in res["items"]:
-        if str(r.get("_id")) == str(oid):
-            target = r
-            break
-    if target is None:
-        for r in res["items"]:
-            if all(r.get(k) == doc.get(k) for k in ("name", "date", "cve_id")):
-                target = r
-                break
-    if target is None:
-        target = res["items"][0]
-
-    base_score = float(target.get("_raw_score", 0.0))
-    priority_class = str(target.get("_class", "media"))
-
-    update = {"$set": {"base_score": base_score, "priority_class": priority_class}}
-    coll.update_one({"_id": oid}, update)
+        # features e score na mesma escrita: o snapshot não se afasta da collection
+        update = {"$set": {**features, fields["score"]: base_score, fields["class"]: priority_class}}
+        coll.update_one({"_id": oid}, update)
+        if stats is not None:
+            order_stats.save(coll, stats)
+        else:
+            # as features do documento mudaram: o snapshot é remontado na próxima consulta
+            order_stats.invalidate(coll)
+        delta = RollupDelta(coll)
+        delta.change(old, {**merged, "base_score": base_score, "priority_class": priority_class})
+        delta.flush()
+        feature_store.sync(coll, [merged], insert=False)
 
     return {
         "_id": str(oid),
         "base_score": base_score,
         "priority_class": priority_class,
-        "thresholds_raw": res.get("thresholds_raw"),
+        "thresholds_raw": thresholds_raw,
+    }
+
+
+def _jsonl_docs(f: IO[bytes]) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """(número da linha, documento) por linha não vazia; documento None se a linha não for um objeto JSON."""
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            doc = json.loads(line)
+        except ValueError:
+            doc = None
+        yield lineno, doc if isinstance(doc, dict) else None
+
+
+def score_jsonl(
+    src: str,
+    out: IO[str],
+    *,
+    weights: Dict[str, float],
+    cut_mode: str = "kmeans",
+) -> Dict[str, Any]:
+    """
+    Scoring offline de um arquivo JSONL de findings (um documento por linha),
+    sem Mongo. `src` é um caminho ou '-' (stdin, copiado para um temporário).
+
+    Duas passadas: a primeira guarda só as features 0..10 em arrays compactos
+    (8 bytes por campo e finding) e calcula scores e cortes sobre a população
+    inteira; a segunda relê o arquivo e escreve cada documento com
+    base_score / priority_class em `out`, linha a linha. Os documentos nunca
+    ficam todos em memória. Linhas inválidas são puladas e contadas.
+    """
+    plan = ScoringPlan(weights_to_params(weights), cut_mode=cut_mode)
+    spool = None
+    if src == "-":
+        spool = tempfile.NamedTemporaryFile(prefix="calculator_", suffix=".jsonl", delete=False)
+        with spool:
+            shutil.copyfileobj(sys.stdin.buffer, spool, 1 << 20)
+        src = spool.name
+    try:
+        with instrumentation.span("score.jsonl") as root:
+            columns = {f: array("d") for f in plan.fields}
+            invalid: List[int] = []
+            with instrumentation.span("score.read"), open(src, "rb") as f:
+                for lineno, doc in _jsonl_docs(f):
+                    if doc is None:
+                        invalid.append(lineno)
+                    else:
+                        plan.append(columns, doc)
+            n = len(columns[plan.fields[0]])
+            root.set(total=n, invalid=len(invalid))
+            if not n:
+                return {"scored": 0, "invalid": len(invalid), "thresholds_raw": {"t1": 0, "t2": 0, "t3": 0}}
+            with instrumentation.span("scores.raw", n=n):
+                scores = array("d", plan.score_batch(columns))
+            del columns
+            thresholds_raw, class_list = plan.classify(scores)
+            classes = array("b", (CLASSES.index(c) for c in class_list))
+            del class_list
+            i = 0
+            with instrumentation.span("score.write"), open(src, "rb") as f:
+                for _, doc in _jsonl_docs(f):
+                    if doc is None:
+                        continue
+                    doc["base_score"] = scores[i]
+                    doc["priority_class"] = CLASSES[classes[i]]
+                    out.write(json.dumps(doc, ensure_ascii=False, default=str))
+                    out.write("\n")
+                    i += 1
+            out.flush()
+    finally:
+        if spool is not None:
+            os.unlink(spool.name)
+    return {
+        "scored": n,
+        "invalid": len(invalid),
+        "invalid_lines": invalid[:20],
+        "weights": weights,
+        "thresholds_raw": thresholds_raw,
     }
 
 
+def _main_jsonl(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(
+        prog="calculator.py --jsonl",
+        description="Scoring offline de findings em JSONL (sem Mongo); resumo vai para o stderr.",
+    )
+    ap.add_argument("--jsonl", metavar="PATH", nargs="?", const="-", required=True,
+                    help="arquivo JSONL de entrada; '-' ou omitido lê do stdin")
+    ap.add_argument("--weights", required=True, help="JSON com os pesos, ex.: '{\"cve\": 1, \"epss\": 2}'")
+    ap.add_argument("--out", help="arquivo JSONL de saída (padrão: stdout)")
+    ap.add_argument("--cut-mode", choices=["kmeans", "quantiles"], default="kmeans")
+    args = ap.parse_args(argv)
+    try:
+        weights = json.loads(args.weights)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as out:
+                summary = score_jsonl(args.jsonl, out, weights=weights, cut_mode=args.cut_mode)
+        else:
+            summary = score_jsonl(args.jsonl, sys.stdout, weights=weights, cut_mode=args.cut_mode)
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+    return 0
+
+
 if __name__ == "__main__":
+    if "--jsonl" in sys.argv[1:]:
+        sys.exit(_main_jsonl(sys.argv[1:]))
+
     data = sys.stdin.read().strip()
     if not data:
         print("Passe o DOC JSON no stdin. Exemplo: cat doc.json | python calculator.py")
+        print("Offline (sem Mongo): python calculator.py --jsonl findings.jsonl --weights '{\"cve\": 1}'")
         sys.exit(1)
 
     try:
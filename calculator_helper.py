@@ -5,6 +5,23 @@ from datetime import datetime
 # Data -> score 0..10 (idade em meses)
 # ==============================
 
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d", "%Y-%m", "%Y/%m", "%Y")
+
+
+def parse_year_month(s: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Retorna (ano, mes) de uma data em um dos DATE_FORMATS, ou None."""
+    if not s:
+        return None
+    s = str(s).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            dt = datetime.strptime(s, fmt)
+            return dt.year, (dt.month if "%m" in fmt else 1)
+        except Exception:
+            continue
+    return None
+
+
 def date_score_months(
     date_str: Optional[str],
     ref_year: Optional[int] = None,
@@ -21,18 +38,7 @@ def date_score_months(
     if not date_str:
         return 0.0
 
-    def _parse(s: str) -> Optional[Tuple[int, int]]:
-        s = s.strip()
-        fmts = ("%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d", "%Y-%m", "%Y/%m", "%Y")
-        for fmt in fmts:
-            try:
-                dt = datetime.strptime(s, fmt)
-                return dt.year, (dt.month if "%m" in fmt else 1)
-            except Exception:
-                continue
-        return None
-
-    ym = _parse(str(date_str))
+    ym = parse_year_month(str(date_str))
     if ym is None:
         return 0.0
 
@@ -90,8 +96,9 @@ def compute_scores_and_dynamic_classes(
     if not items:
         return {'thresholds': {'t1': 0.0, 't2': 0.0, 't3': 0.0}, 'items': []}
 
-    # 1) Reaproveita o pipeline de compute_scores_and_classes para obter _score_0_100
-    base = compute_scores_and_classes(
+    # 1) Score cru (caminho cve/epss/criticidade/date) reescalado para 0..100
+    #    pelos quantis q_low/q_high da base (min-max robusto)
+    base = compute_raw_scores(
         items,
         weights=weights,
         ref_year=ref_year,
@@ -99,10 +106,14 @@ def compute_scores_and_dynamic_classes(
         horizon_months=horizon_months,
         date_mode=date_mode,
         date_k=date_k,
-        q_low=q_low,
-        q_high=q_high,
-        cuts=(25.0, 50.0, 85.0),  # cortes serão recalculados abaixo (dinâmicos)
     )
+    raw = [row['_raw_score'] for row in base]
+    lo, hi = _percentile(raw, q_low), _percentile(raw, q_high)
+    for row in base:
+        if hi - lo < 1e-9:
+            row['_score_0_100'] = 50.0
+        else:
+            row['_score_0_100'] = round(clamp((row['_raw_score'] - lo) / (hi - lo) * 100.0, 0.0, 100.0), 2)
 
     scores = [row['_score_0_100'] for row in base]
 
@@ -125,6 +136,16 @@ def compute_scores_and_dynamic_classes(
             row['_class'] = 'gravissima'
         row['_is_critical'] = (row['_class'] == 'gravissima')
 
+    # 4) Garante um topo mínimo de gravíssimas (base já está ordenada desc)
+    min_top = 0
+    if ensure_top_frac:
+        min_top = int(math.ceil(clamp(ensure_top_frac, 0.0, 1.0) * len(base)))
+    if ensure_min_n:
+        min_top = max(min_top, int(ensure_min_n))
+    for row in base[:min_top]:
+        row['_class'] = 'gravissima'
+        row['_is_critical'] = True
+
     return {
         'thresholds': {'t1': round(t1, 2), 't2': round(t2, 2), 't3': round(t3, 2)},
         'items': base,
@@ -163,10 +184,12 @@ def final_value(item: Dict[str, Any], population: List[Dict[str, Any]], **kwargs
 # Robust + Clustering (SEM reescalar para 0..100)
 # =============================================
 from typing import List, Dict, Any, Optional, Tuple
+from bisect import bisect_right
+import heapq
 import math
 
-# Assumimos que já existem: to_features_0_10, _percentile, _robust_z_list,
-# date_score_months, clamp, _kmeans_1d_thresholds, _degenerate.
+import instrumentation
+
 
 # ---- Generic helpers ----
 def clamp(x: float, lo: float, hi: float) -> float:
@@ -204,18 +227,34 @@ def _robust_z_list(values: List[float], cap: float = 3.0) -> List[float]:
 
 
 def _kmeans_1d_thresholds(values: List[float], k: int = 4, max_iter: int = 100) -> Tuple[float, float, float]:
-    """Simple 1D k-means to derive 3 thresholds between 4 cluster centers."""
+    """Simple 1D k-means to derive 3 thresholds between 4 cluster centers.
+
+    Em 1D com centros ordenados cada cluster é um intervalo contíguo dos
+    valores ordenados: as fronteiras saem por bisect e as médias por somas
+    prefixadas, O(k log n) por iteração em vez de O(n k).
+    """
     xs = sorted(values)
     n = len(xs)
-    if n < k or len(set(xs)) <= 1:
+    if n < k or xs[0] == xs[-1]:
         return (_percentile(xs, 0.50), _percentile(xs, 0.80), _percentile(xs, 0.95))
     centers = [xs[int((i+1)*n/(k+1))] for i in range(k)]
+    prefix = [0.0]
+    for v in xs:
+        prefix.append(prefix[-1] + v)
     for _ in range(max_iter):
-        clusters = [[] for _ in range(k)]
-        for v in xs:
-            j = min(range(k), key=lambda j: abs(v - centers[j]))
-            clusters[j].append(v)
-        new_centers = [ (sum(c)/len(c) if c else centers[i]) for i, c in enumerate(clusters) ]
+        if all(centers[j] < centers[j+1] for j in range(k - 1)):
+            # empate no ponto médio fica com o cluster de menor índice (bisect_right)
+            bounds = [0] + [bisect_right(xs, 0.5 * (centers[j] + centers[j+1])) for j in range(k - 1)] + [n]
+            new_centers = [
+                ((prefix[bounds[i+1]] - prefix[bounds[i]]) / (bounds[i+1] - bounds[i]) if bounds[i+1] > bounds[i] else centers[i])
+                for i in range(k)
+            ]
+        else:
+            clusters = [[] for _ in range(k)]
+            for v in xs:
+                j = min(range(k), key=lambda j: abs(v - centers[j]))
+                clusters[j].append(v)
+            new_centers = [ (sum(c)/len(c) if c else centers[i]) for i, c in enumerate(clusters) ]
         if all(abs(a-b) < 1e-9 for a,b in zip(new_centers, centers)):
             centers = new_centers
             break
@@ -270,6 +309,278 @@ def _extract_fields_cfg(params: Optional[Dict[str, Any]]) -> Tuple[List[str], Di
     return names, weights
 
 
+# ==============================
+# Plano de scoring (compilado uma vez por execução)
+# ==============================
+
+CLASSES = ("baixa", "media", "alta", "gravissima")
+# idades (em meses) pré-calculadas; acima disso a fórmula é aplicada direto
+DATE_LUT_MONTHS = 1200
+DATE_CACHE_MAX = 100_000
+
+
+def _clamp_010(x: Any) -> float:
+    try:
+        v = float(x)
+    except Exception:
+        v = 0.0
+    if v < 0:
+        return 0.0
+    if v > 10:
+        return 10.0
+    return v
+
+
+def _clamp01_to_010(x: Any) -> float:
+    try:
+        v = float(x)
+    except Exception:
+        v = 0.0
+    if v < 0:
+        v = 0.0
+    if v > 1:
+        if v <= 10:
+            return v
+        return 10.0
+    return v * 10.0
+
+
+def weights_to_params(weights: Dict[str, float]) -> Dict[str, Any]:
+    fields = {}
+    for k, w in (weights or {}).items():
+        try:
+            fields[k] = {"weight": float(w)}
+        except Exception:
+            fields[k] = {"weight": 1.0}
+    return {"fields": fields}
+
+
+def _validate_fields(params: Optional[Dict[str, Any]]) -> Tuple[List[str], Dict[str, float]]:
+    """Como _extract_fields_cfg, mas recusa configuração inválida em vez de assumir peso 1."""
+    if not isinstance(params, dict) or not isinstance(params.get("fields"), dict) or not params["fields"]:
+        raise ValueError("params precisa de 'fields': {campo: {'weight': w}} com ao menos um campo")
+    names: List[str] = []
+    weights: Dict[str, float] = {}
+    for fname, cfg in params["fields"].items():
+        if not isinstance(fname, str) or not fname:
+            raise ValueError(f"nome de campo inválido: {fname!r}")
+        w = cfg.get("weight", 1.0) if isinstance(cfg, dict) else 1.0
+        try:
+            w = float(w)
+        except (TypeError, ValueError):
+            raise ValueError(f"peso inválido para {fname!r}: {w!r}") from None
+        if math.isnan(w):
+            raise ValueError(f"peso inválido para {fname!r}: NaN")
+        names.append(fname)
+        weights[fname] = clamp(w, -2.0, 2.0)
+    return names, weights
+
+
+class ScoringPlan:
+    """
+    Tudo o que não depende dos itens, resolvido uma vez por execução:
+    campos e pesos validados, mês de referência fixo, tabela idade em
+    meses -> date_norm e modo de corte. Os itens entram como colunas
+    (columns / append) e score_batch devolve os scores crus.
+    """
+
+    def __init__(
+        self,
+        params: Optional[Dict[str, Any]] = None,
+        *,
+        weights: Optional[Dict[str, float]] = None,
+        ref_year: Optional[int] = None,
+        ref_month: Optional[int] = None,
+        horizon_months: int = 60,
+        date_mode: str = "exp",
+        date_k: float = 3.0,
+        cut_mode: str = "kmeans",
+        quantile_cuts: Tuple[float, float, float] = (0.50, 0.80, 0.95),
+    ):
+        if params is None and weights is not None:
+            params = weights_to_params(weights)
+        self.fields, self.weights = _validate_fields(params)
+        if date_mode not in ("exp", "linear"):
+            raise ValueError(f"date_mode inválido: {date_mode!r}")
+        if cut_mode not in ("kmeans", "quantiles"):
+            raise ValueError(f"cut_mode inválido: {cut_mode!r}")
+        if int(horizon_months) < 1:
+            raise ValueError("horizon_months precisa ser >= 1")
+        qc = tuple(float(q) for q in quantile_cuts)
+        if len(qc) != 3 or not (0.0 <= qc[0] <= qc[1] <= qc[2] <= 1.0):
+            raise ValueError(f"quantile_cuts inválido: {quantile_cuts!r}")
+        if ref_year is None or ref_month is None:
+            today = datetime.today()
+            ref_year, ref_month = today.year, today.month
+        self.ref_year, self.ref_month = int(ref_year), int(ref_month)
+        self.horizon_months = int(horizon_months)
+        self.date_mode = date_mode
+        self.date_k = float(date_k)
+        self.cut_mode = cut_mode
+        self.quantile_cuts = qc
+        self._date_lut = [self._age_score(m) for m in range(DATE_LUT_MONTHS + 1)]
+        self._date_cache: Dict[str, float] = {}
+
+    # ---- features ----
+
+    def _age_score(self, months: int) -> float:
+        # mesma conta de date_score_months
+        x = months / float(max(1, self.horizon_months))
+        if self.date_mode == "linear":
+            score = 10.0 * (x if x < 1.0 else 1.0)
+        else:
+            score = 10.0 * (1.0 - math.exp(-self.date_k * x))
+        return round(clamp(score, 0.0, 10.0), 6)
+
+    def date_norm(self, date_str: Any) -> float:
+        """date_score_months com o mês de referência fixo e cache por texto de data."""
+        if not date_str:
+            return 0.0
+        key = str(date_str)
+        v = self._date_cache.get(key)
+        if v is None:
+            ym = parse_year_month(key)
+            if ym is None:
+                v = 0.0
+            else:
+                months = max(0, (self.ref_year - ym[0]) * 12 + (self.ref_month - ym[1]))
+                v = self._date_lut[months] if months <= DATE_LUT_MONTHS else self._age_score(months)
+            if len(self._date_cache) < DATE_CACHE_MAX:
+                self._date_cache[key] = v
+        return v
+
+    def normalize(self, it: Dict[str, Any]) -> Dict[str, Any]:
+        """Documento cru -> cópia com cve/epss/companyCriticality/date_norm em 0..10."""
+        o = dict(it)
+        if "epss" in o:
+            o["epss"] = _clamp01_to_010(o.get("epss"))
+        if "cvss" in o and "cve" not in o:
+            o["cve"] = _clamp_010(o.get("cvss"))
+        else:
+            o["cve"] = _clamp_010(o.get("cve", 0))
+        o["companyCriticality"] = _clamp_010(o.get("companyCriticality", 0))
+        o["date_norm"] = self.date_norm(o.get("date"))
+        return o
+
+    def _raw_feature(self, doc: Dict[str, Any], f: str) -> float:
+        # normaliza um campo direto do documento cru, sem copiar o dict
+        if f == "cve":
+            return _clamp_010(doc.get("cvss")) if "cvss" in doc and "cve" not in doc else _clamp_010(doc.get("cve", 0))
+        if f == "epss":
+            return _clamp01_to_010(doc.get("epss")) if "epss" in doc else 0.0
+        if f == "companyCriticality":
+            return _clamp_010(doc.get("companyCriticality", 0))
+        if f == "date_norm":
+            return self.date_norm(doc.get("date"))
+        return _clamp_010(doc.get(f))
+
+    def new_columns(self) -> Dict[str, List[float]]:
+        return {f: [] for f in self.fields}
+
+    def append(self, columns: Dict[str, List[float]], doc: Dict[str, Any], *, normalized: bool = False) -> None:
+        """Acrescenta um item às colunas; normalized=True quando o item já passou por normalize()."""
+        for f in self.fields:
+            if normalized:
+                v = doc.get(f, 0)
+                try:
+                    x = float(v if v is not None else 0)
+                except Exception:
+                    x = 0.0
+                columns[f].append(clamp(x, 0.0, 10.0))
+            else:
+                columns[f].append(self._raw_feature(doc, f))
+
+    def columns(self, items: List[Dict[str, Any]], *, normalized: bool = False) -> Dict[str, List[float]]:
+        cols = self.new_columns()
+        for it in items:
+            self.append(cols, it, normalized=normalized)
+        return cols
+
+    # ---- scores e classes ----
+
+    def robust_columns(self, columns: Dict[str, List[float]]) -> Dict[str, List[float]]:
+        with instrumentation.span("scores.robust_z", fields=len(self.fields)):
+            return {f: _robust_z_list(columns[f], cap=3.0) for f in self.fields}
+
+    def combine(self, rz: Dict[str, List[float]], n: Optional[int] = None) -> List[float]:
+        """Soma ponderada das colunas robust-z, campo a campo (mesma ordem de soma do laço por item)."""
+        if n is None:
+            n = len(rz[self.fields[0]]) if self.fields else 0
+        with instrumentation.span("scores.combine", n=n):
+            scores = [0.0] * n
+            for f in self.fields:
+                w = self.weights[f]
+                scores = [s + z * w for s, z in zip(scores, rz[f])]
+            return [round(s, 6) for s in scores]
+
+    def score_batch(self, columns: Dict[str, List[float]]) -> List[float]:
+        """_raw_score de cada posição das colunas (valores 0..10 por campo)."""
+        return self.combine(self.robust_columns(columns))
+
+    def classify(self, scores: List[float]) -> Tuple[Dict[str, float], List[str]]:
+        """(thresholds_raw, classe por posição) pelo modo de corte do plano."""
+        if _degenerate(scores):
+            s0 = scores[0] if scores else 0.0
+            return {"t1": s0, "t2": s0, "t3": s0}, ["media"] * len(scores)
+        with instrumentation.span("scores.cuts", mode=self.cut_mode, n=len(scores)):
+            if self.cut_mode == "kmeans":
+                t1, t2, t3 = _kmeans_1d_thresholds(scores, k=4)
+            else:
+                t1, t2, t3 = (_percentile(scores, q) for q in self.quantile_cuts)
+        with instrumentation.span("scores.classify", n=len(scores)):
+            baixa, media, alta, grav = CLASSES
+            classes = [
+                baixa if s <= t1 else media if s <= t2 else alta if s <= t3 else grav
+                for s in scores
+            ]
+        return {"t1": round(t1, 6), "t2": round(t2, 6), "t3": round(t3, 6)}, classes
+
+    def run(self, items: List[Dict[str, Any]], *, normalized: bool = True) -> Dict[str, Any]:
+        """
+        Mesmo contrato de compute_scores_and_clusters_free: cópias dos itens com
+        _raw_score/_class, ordenadas por score desc, e thresholds_raw.
+        """
+        if not items:
+            return {"thresholds_raw": {"t1": 0.0, "t2": 0.0, "t3": 0.0}, "items": []}
+        with instrumentation.span("scores.raw", n=len(items)):
+            scores = self.score_batch(self.columns(items, normalized=normalized))
+        thresholds, classes = self.classify(scores)
+        weights_used = {f: self.weights[f] for f in self.fields}
+        out: List[Dict[str, Any]] = []
+        for it, s, c in zip(items, scores, classes):
+            o = dict(it)
+            o["_raw_score"] = s
+            o["_fields_used"] = self.fields
+            o["_weights_used"] = weights_used
+            o["_class"] = c
+            out.append(o)
+        out.sort(key=lambda r: r["_raw_score"], reverse=True)
+        return {"thresholds_raw": thresholds, "items": out}
+
+
+_default_plans: Dict[Tuple[int, int], ScoringPlan] = {}
+
+
+def _default_plan() -> ScoringPlan:
+    # um plano por mês corrente, para quem normaliza sem ter um plano da execução
+    today = datetime.today()
+    key = (today.year, today.month)
+    plan = _default_plans.get(key)
+    if plan is None:
+        _default_plans.clear()
+        plan = _default_plans[key] = ScoringPlan(weights={"date_norm": 1}, ref_year=key[0], ref_month=key[1])
+    return plan
+
+
+def normalize_item(it: Dict[str, Any], plan: Optional[ScoringPlan] = None) -> Dict[str, Any]:
+    """Normalização 0..10 de um documento; sem `plan`, a data usa o mês corrente."""
+    return (plan if plan is not None else _default_plan()).normalize(it)
+
+
+# features do caminho antigo (pesos por cve/epss/criticidade/date) -> campos normalizados
+LEGACY_FIELDS = {"cve": "cve", "epss": "epss", "criticidade": "companyCriticality", "date": "date_norm"}
+
+
 def compute_raw_scores(
     items: List[Dict[str, Any]],
     *,
@@ -290,35 +601,24 @@ def compute_raw_scores(
     if not items:
         return []
 
-    # 1) extrai features normalizadas
-    feats_list = [to_features_0_10(it, ref_year=ref_year, ref_month=ref_month) for it in items]
-    # corrige score de data com os parâmetros escolhidos
-    for i, it in enumerate(items):
-        feats_list[i]["date"] = date_score_months(
-            it.get("date"),
-            ref_year=ref_year,
-            ref_month=ref_month,
-            horizon_months=horizon_months,
-            mode=date_mode,
-            k=date_k,
-        )
-
-    # 2) robust-z por coluna (cap em [-3,3])
-    cols = {k: [f[k] for f in feats_list] for k in ("cve", "epss", "criticidade", "date")}
-    rz = {k: _robust_z_list(cols[k], cap=3.0) for k in cols}
-
-    # 3) combina com pesos (sem reescalar)
     keys = ["cve", "epss", "criticidade", "date"]
     w = _safe_weights(keys, weights)
+    plan = ScoringPlan(
+        {"fields": {LEGACY_FIELDS[k]: {"weight": w[k]} for k in keys}},
+        ref_year=ref_year,
+        ref_month=ref_month,
+        horizon_months=horizon_months,
+        date_mode=date_mode,
+        date_k=date_k,
+    )
+    cols = plan.columns(items)
+    scores = plan.score_batch(cols)
 
     out = []
     for i, it in enumerate(items):
-        s = 0.0
-        for k in keys:
-            s += rz[k][i] * w[k]
         o = dict(it)
-        o["_features"] = feats_list[i]
-        o["_raw_score"] = round(s, 6)
+        o["_features"] = {k: cols[LEGACY_FIELDS[k]][i] for k in keys}
+        o["_raw_score"] = scores[i]
         out.append(o)
 
     # ordena desc por score cru
@@ -338,40 +638,10 @@ def compute_raw_scores_dynamic(
     """
     if not items:
         return []
-    field_names, weights = _extract_fields_cfg(params)
+    field_names, _weights = _extract_fields_cfg(params)
     if not field_names:
         return []
-
-    # collect per-field values
-    cols: Dict[str, List[float]] = {f: [] for f in field_names}
-    for it in items:
-        for f in field_names:
-            v = it.get(f, 0)
-            try:
-                x = float(v if v is not None else 0)
-            except Exception:
-                x = 0.0
-            # clamp to 0..10 as contract
-            x = clamp(x, 0.0, 10.0)
-            cols[f].append(x)
-
-    # per-field robust z-scores
-    rz_cols: Dict[str, List[float]] = {f: _robust_z_list(cols[f], cap=3.0) for f in field_names}
-
-    # combine with weights
-    out: List[Dict[str, Any]] = []
-    for i, it in enumerate(items):
-        s = 0.0
-        for f in field_names:
-            s += rz_cols[f][i] * weights[f]
-        o = dict(it)
-        o['_raw_score'] = round(s, 6)
-        o['_fields_used'] = field_names
-        o['_weights_used'] = {f: weights[f] for f in field_names}
-        out.append(o)
-
-    out.sort(key=lambda r: r['_raw_score'], reverse=True)
-    return out
+    return ScoringPlan(params).run(items)["items"]
 
 
 def compute_scores_and_clusters_free(
@@ -391,55 +661,42 @@ def compute_scores_and_clusters_free(
     Clusterização sobre o score CRU (não reescalado). Thresholds e classes
     são definidos diretamente sobre a distribuição de _raw_score.
     """
-    # If params with fields provided, use dynamic-fields pipeline; else fallback to default (cve/epss/criticidade/date)
+    # Com params['fields'] usa os campos dinâmicos (itens já normalizados);
+    # senão o caminho antigo (cve/epss/criticidade/date a partir do documento cru)
     field_names, _ws = _extract_fields_cfg(params)
     if field_names:
-        base = compute_raw_scores_dynamic(items, params=params)
-    else:
-        base = compute_raw_scores(
-            items,
-            weights=weights,
-            ref_year=ref_year,
-            ref_month=ref_month,
-            horizon_months=horizon_months,
-            date_mode=date_mode,
-            date_k=date_k,
-        )
-    if not base:
-        return {"thresholds_raw": {"t1": 0.0, "t2": 0.0, "t3": 0.0}, "items": []}
+        plan = ScoringPlan(params, cut_mode=cut_mode, quantile_cuts=quantile_cuts)
+        return plan.run(items)
 
-    scores = [r["_raw_score"] for r in base]
+    keys = ["cve", "epss", "criticidade", "date"]
+    w = _safe_weights(keys, weights)
+    plan = ScoringPlan(
+        {"fields": {LEGACY_FIELDS[k]: {"weight": w[k]} for k in keys}},
+        ref_year=ref_year,
+        ref_month=ref_month,
+        horizon_months=horizon_months,
+        date_mode=date_mode,
+        date_k=date_k,
+        cut_mode=cut_mode,
+        quantile_cuts=quantile_cuts,
+    )
+    return plan.run(items, normalized=False)
 
-    if _degenerate(scores):
-        t1 = t2 = t3 = scores[0]
-        for r in base:
-            r["_class"] = "media"
-        return {"thresholds_raw": {"t1": t1, "t2": t2, "t3": t3}, "items": base}
 
-    if cut_mode == "kmeans":
-        t1, t2, t3 = _kmeans_1d_thresholds(scores, k=4)
-    else:
-        q1, q2, q3 = quantile_cuts
-        t1 = _percentile(scores, q1)
-        t2 = _percentile(scores, q2)
-        t3 = _percentile(scores, q3)
-
-    # classifica por thresholds em _raw_score
-    for r in base:
-        s = r["_raw_score"]
-        if s <= t1:
-            r["_class"] = "baixa"
-        elif s <= t2:
-            r["_class"] = "media"
-        elif s <= t3:
-            r["_class"] = "alta"
-        else:
-            r["_class"] = "gravissima"
-
-    return {
-        "thresholds_raw": {"t1": round(t1, 6), "t2": round(t2, 6), "t3": round(t3, 6)},
-        "items": base,
-    }
+def has_ok_tag(it: Dict[str, Any]) -> bool:
+    """Finding marcado como OK (tag ou ambiente contendo 'ok'); a triagem o suprime."""
+    for key in ("tags", "environments"):
+        arr = it.get(key) or []
+        if isinstance(arr, list):
+            for t in arr:
+                v = None
+                if isinstance(t, dict):
+                    v = t.get("value") or t.get("status") or t.get("name")
+                elif isinstance(t, str):
+                    v = t
+                if isinstance(v, str) and "ok" in v.lower():
+                    return True
+    return False
 
 
 def triage_select_raw(
@@ -465,21 +722,7 @@ def triage_select_raw(
         return {"selected": [], "thresholds_raw": {"t1": 0.0, "t2": 0.0, "t3": 0.0}, "threshold_used": 0.0, "population": 0}
 
     # filtro opcional de itens com 'OK'
-    def _has_ok_tag_local(it: Dict[str, Any]) -> bool:
-        for key in ("tags", "environments"):
-            arr = it.get(key) or []
-            if isinstance(arr, list):
-                for t in arr:
-                    v = None
-                    if isinstance(t, dict):
-                        v = t.get("value") or t.get("status") or t.get("name")
-                    elif isinstance(t, str):
-                        v = t
-                    if isinstance(v, str) and "ok" in v.lower():
-                        return True
-        return False
-
-    pool = [it for it in items if not (_has_ok_tag_local(it) if suppress_ok else False)]
+    pool = [it for it in items if not (has_ok_tag(it) if suppress_ok else False)]
     if not pool:
         pool = items[:]
 
@@ -507,16 +750,14 @@ def triage_select_raw(
     t3 = res["thresholds_raw"]["t3"]
     T = max(T_cap, t3)  # prioriza topo/gravíssima
 
-    selected = [r for r in scored if r["_raw_score"] >= T]
-    selected.sort(key=lambda r: r["_raw_score"], reverse=True)
+    # seleção parcial (heap) em vez de ordenar a população; sobras por identidade (set)
+    score_key = lambda r: r["_raw_score"]
+    selected = heapq.nlargest(capacity, (r for r in scored if r["_raw_score"] >= T), key=score_key)
 
-    if len(selected) > capacity:
-        selected = selected[:capacity]
-    elif len(selected) < capacity:
-        leftover = [r for r in scored if r not in selected]
-        leftover.sort(key=lambda r: r["_raw_score"], reverse=True)
+    if len(selected) < capacity:
+        chosen = {id(r) for r in selected}
         need = capacity - len(selected)
-        selected += leftover[:need]
+        selected += heapq.nlargest(need, (r for r in scored if id(r) not in chosen), key=score_key)
 
     return {
         "selected": selected,
@@ -550,57 +791,145 @@ def final_value_free(
     return target["_raw_score"], target["_class"]
 
 
-# ==== Additional helpers and selection (gravissima) ====
-from typing import Any
+SCORE_INDEXES = (
+    [("priority_class", 1), ("base_score", -1)],
+    [("base_score", -1)],
+)
 
 
-def _clamp_010(x: Any) -> float:
-    try:
-        v = float(x)
-    except Exception:
-        v = 0.0
-    if v < 0:
-        return 0.0
-    if v > 10:
-        return 10.0
-    return v
+def ensure_score_indexes(collection, fields: Optional[Dict[str, str]] = None) -> None:
+    """
+    Índices dos scores persistidos: top-K por classe e cortes por posição.
+    `fields` ({'score', 'class'}) aponta os campos de uma geração de score.
+    """
+    rename = {"base_score": "score", "priority_class": "class"}
+    for keys in SCORE_INDEXES:
+        collection.create_index([(fields[rename[k]] if fields else k, d) for k, d in keys])
 
 
-def _clamp01_to_010(x: Any) -> float:
+def _same_weights(a: Optional[Dict[str, Any]], b: Optional[Dict[str, Any]]) -> bool:
     try:
-        v = float(x)
-    except Exception:
-        v = 0.0
-    if v < 0:
-        v = 0.0
-    if v > 1:
-        if v <= 10:
-            return v
-        return 10.0
-    return v * 10.0
+        fa = {k: float(v) for k, v in (a or {}).items()}
+        fb = {k: float(v) for k, v in (b or {}).items()}
+    except (TypeError, ValueError):
+        return False
+    return bool(fa) and fa == fb
 
 
-def _normalize_item_minimal(it: Dict[str, Any]) -> Dict[str, Any]:
-    o = dict(it)
-    if "epss" in o:
-        o["epss"] = _clamp01_to_010(o.get("epss"))
-    if "cvss" in o and "cve" not in o:
-        o["cve"] = _clamp_010(o.get("cvss"))
-    else:
-        o["cve"] = _clamp_010(o.get("cve", 0))
-    o["companyCriticality"] = _clamp_010(o.get("companyCriticality", 0))
-    o["date_norm"] = date_score_months(o.get("date"), horizon_months=60, mode="exp", k=3.0)
-    return o
+def _get_path(doc: Dict[str, Any], path: str) -> Any:
+    for part in path.split("."):
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return doc
 
 
-def _weights_to_params(weights: Dict[str, float]) -> Dict[str, Any]:
-    fields = {}
-    for k, w in (weights or {}).items():
-        try:
-            fields[k] = {"weight": float(w)}
-        except Exception:
-            fields[k] = {"weight": 1.0}
-    return {"fields": fields}
+def _persisted_percentile(collection, q: float, n: int, score_field: str = "base_score") -> float:
+    """Mesmo cálculo de _percentile, lendo só as posições necessárias pelo índice de score."""
+    idx = clamp(q, 0.0, 1.0) * (n - 1)
+    lo_i, hi_i = int(math.floor(idx)), int(math.ceil(idx))
+    cur = (collection.find({score_field: {"$type": "number"}}, {"_id": 0, score_field: 1})
+           .sort(score_field, 1).skip(lo_i).limit(hi_i - lo_i + 1))
+    vals = [float(_get_path(d, score_field)) for d in cur]
+    if not vals:
+        return 0.0
+    if len(vals) == 1:
+        return vals[0]
+    frac = idx - lo_i
+    return vals[0] * (1 - frac) + vals[-1] * frac
+
+
+_TOP_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "date": 1,
+    "cve_id": 1,
+    "cvss": 1,
+    "cve": 1,
+    "epss": 1,
+    "companyCriticality": 1,
+    "tags": 1,
+    "environments": 1,
+    "base_score": 1,
+    "priority_class": 1,
+}
+
+
+def select_top_gravissima_persisted(
+    *,
+    collection,
+    weights: Dict[str, float],
+    limit: int = 30,
+    projection: Optional[Dict[str, int]] = None,
+    cut_mode: str = "quantiles",
+    quantile_cuts: Tuple[float, float, float] = (0.60, 0.85, 0.97),
+) -> Optional[Dict[str, Any]]:
+    """
+    Top-K direto dos scores persistidos da geração corrente, sem re-score.
+    Só responde quando os pesos pedidos são os do último re-score
+    (score_meta) e todo documento já tem score; senão devolve None.
+    """
+    from score_meta import get_score_meta, resolve_scores, score_fields, score_projection
+
+    meta = get_score_meta(collection)
+    if not _same_weights(weights, meta.get("weights")):
+        return None
+    fields = score_fields(meta=meta)
+    f_score, f_class = fields["score"], fields["class"]
+    if collection.find_one({f_class: {"$in": [None, ""]}}, {"_id": 1}) is not None:
+        return None  # há documentos novos ainda sem score
+
+    with instrumentation.span("top.persisted", limit=limit, mode=cut_mode):
+        if cut_mode == "kmeans":
+            # as classes persistidas saem exatamente deste corte
+            th = meta.get("thresholds_raw") or {}
+            thresholds = {k: float(th.get(k, 0.0)) for k in ("t1", "t2", "t3")}
+            q = {f_class: "gravissima"}
+        else:
+            n = collection.count_documents({f_score: {"$type": "number"}})
+            if n == 0:
+                return {"thresholds_raw": {"t1": 0.0, "t2": 0.0, "t3": 0.0}, "items": [], "selected": []}
+            t1, t2, t3 = (_persisted_percentile(collection, c, n, f_score) for c in quantile_cuts)
+            thresholds = {"t1": round(t1, 6), "t2": round(t2, 6), "t3": round(t3, 6)}
+            q = {f_score: {"$gt": t3}}
+        proj = {**(projection or _TOP_PROJECTION), **score_projection(fields)}
+        cursor = collection.find(q, proj).sort(f_score, -1).limit(max(0, int(limit)))
+        selected = []
+        for doc in cursor:
+            it = normalize_item(resolve_scores(doc, fields))
+            it["_raw_score"] = float(it.get("base_score") or 0.0)
+            it["_class"] = "gravissima"
+            selected.append(it)
+    return {"thresholds_raw": thresholds, "items": selected, "selected": selected, "source": "persisted"}
+
+
+def _select_top_from_store(
+    store,
+    *,
+    collection,
+    weights: Dict[str, float],
+    limit: int,
+    projection: Dict[str, int],
+    cut_mode: str,
+    quantile_cuts: Tuple[float, float, float],
+) -> Dict[str, Any]:
+    """Score vetorizado sobre o feature store; só os `limit` selecionados são lidos do Mongo."""
+    from feature_store import score_store, top_rows
+
+    plan = ScoringPlan(weights_to_params(weights), cut_mode=cut_mode, quantile_cuts=quantile_cuts)
+    with instrumentation.span("top.feature_store", limit=limit):
+        res = score_store(plan, store)
+        pos = top_rows(res["scores"], limit, res["classes"] == CLASSES.index("gravissima"))
+        ids = store.ids_at(res["rows"][pos])
+        docs = {d["_id"]: d for d in collection.find({"_id": {"$in": ids}}, projection)}
+        selected = []
+        for _id, p in zip(ids, pos.tolist()):
+            doc = docs.get(_id)
+            if doc is None:
+                continue  # removido do Mongo depois da última sincronização do store
+            it = plan.normalize(doc)
+            it["_raw_score"] = float(res["scores"][p])
+            it["_class"] = "gravissima"
+            selected.append(it)
+    return {"thresholds_raw": res["thresholds_raw"], "items": selected, "selected": selected, "source": "feature_store"}
 
 
 def select_top_gravissima(
@@ -612,7 +941,23 @@ def select_top_gravissima(
     projection: Optional[Dict[str, int]] = None,
     cut_mode: str = "quantiles",
     quantile_cuts: Tuple[float, float, float] = (0.60, 0.85, 0.97),
+    use_persisted: bool = True,
+    store=None,
 ) -> Dict[str, Any]:
+    """
+    Top `limit` gravíssimas para `weights`. Sem `query`, tenta primeiro os
+    scores persistidos (select_top_gravissima_persisted) e depois o feature
+    store (`store`), se informado; caso contrário re-scoreia a população e
+    seleciona com heap, sem ordenar tudo.
+    Nos caminhos persistido e do store, 'items' traz só os selecionados.
+    """
+    if use_persisted and not query:
+        res = select_top_gravissima_persisted(
+            collection=collection, weights=weights, limit=limit, projection=projection,
+            cut_mode=cut_mode, quantile_cuts=quantile_cuts,
+        )
+        if res is not None:
+            return res
     q = query or {}
     proj = projection or {
         "_id": 1,
@@ -626,18 +971,23 @@ def select_top_gravissima(
         "tags": 1,
         "environments": 1,
     }
-    cursor = collection.find(q, proj)
-    items = [ _normalize_item_minimal(doc) for doc in cursor ]
-    if not items:
-        return {"thresholds_raw": {"t1": 0.0, "t2": 0.0, "t3": 0.0}, "items": [], "selected": []}
-    params = _weights_to_params(weights)
-    res = compute_scores_and_clusters_free(
-        items,
-        params=params,
-        cut_mode=cut_mode,
-        quantile_cuts=quantile_cuts,
-    )
-    grav = [r for r in res["items"] if r.get("_class") == "gravissima"]
-    grav.sort(key=lambda r: r.get("_raw_score", 0.0), reverse=True)
-    sel = grav[:max(0, int(limit))]
+    if store is not None and not q:
+        return _select_top_from_store(
+            store, collection=collection, weights=weights, limit=limit, projection=proj,
+            cut_mode=cut_mode, quantile_cuts=quantile_cuts,
+        )
+    with instrumentation.span("top.select_gravissima", limit=limit):
+        with instrumentation.span("top.read"):
+            cursor = collection.find(q, proj)
+            plan = ScoringPlan(weights_to_params(weights), cut_mode=cut_mode, quantile_cuts=quantile_cuts)
+            items = [plan.normalize(doc) for doc in cursor]
+        if not items:
+            return {"thresholds_raw": {"t1": 0.0, "t2": 0.0, "t3": 0.0}, "items": [], "selected": []}
+        res = plan.run(items)
+        with instrumentation.span("top.select"):
+            sel = heapq.nlargest(
+                max(0, int(limit)),
+                (r for r in res["items"] if r.get("_class") == "gravissima"),
+                key=lambda r: r.get("_raw_score", 0.0),
+            )
     return {"thresholds_raw": res.get("thresholds_raw"), "items": res["items"], "selected": sel}
\ No newline at end of file
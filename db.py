@@ -1,18 +1,75 @@
+import os
+import threading
+
 from pymongo import MongoClient
 
-try:
-    # conecta e define o database "db"
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["db"]
+# Configuração via ambiente (defaults compatíveis com o docker-compose)
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.environ.get("MONGO_DB", "db")
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_TIMEOUT_MS = int(os.environ.get("MONGO_TIMEOUT_MS", "5000"))
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """Cliente único (pool de conexões) criado no primeiro uso, não no import."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_TIMEOUT_MS,
+                )
+    return _client
+
+
+def get_db():
+    return get_client()[MONGO_DB]
+
+
+def get_collection(name: str):
+    return get_db()[name]
+
+
+def ping() -> bool:
+    try:
+        get_client().admin.command("ping")
+        print("Conexão com o MongoDB foi bem-sucedida!")
+        return True
+    except Exception as e:
+        print(f"Falha ao conectar ao MongoDB: {e}")
+        return False
+
+
+class LazyCollection:
+    """Proxy de uma collection que só resolve o cliente no primeiro acesso."""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def _resolve(self):
+        return get_collection(self._name)
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({MONGO_DB}.{self._name})"
 
-    # collections dentro de "db"
-    modelo1 = db["modelo1"]
-    modelo2 = db["modelo2"]
-    vulnerabilities_collection = db["vulnerability"]
 
-    # testando conexão
-    client.admin.command("ping")
-    print("Conexão com o MongoDB foi bem-sucedida!")
+# collections dentro de "db"
+modelo1 = LazyCollection("modelo1")
+modelo2 = LazyCollection("modelo2")
+vulnerabilities_collection = LazyCollection("vulnerability")
 
-except Exception as e:
-    print(f"Falha ao conectar ao MongoDB: {e}")
+# rollups materializados do dashboard (ver rollups.py)
+rollups_collection = LazyCollection("vulnerability_rollup")
+histogram_collection = LazyCollection("vulnerability_histogram")
@@ -0,0 +1,393 @@
+"""
+Deduplicação de findings entre scanners (modelo1 / modelo2).
+
+Dois findings são o mesmo problema quando estão no mesmo ativo
+(ticket_ledger.asset_key; findings sem ativo conhecido não são
+comparados a nenhum outro) e:
+
+  - têm um CVE em comum e o mesmo nome normalizado, ou
+  - não têm CVE e têm o mesmo nome normalizado, ou
+  - têm CVEs compatíveis (em comum, ou nenhum dos dois) e descrições
+    parecidas: Jaccard estimado por MinHash dos 3-gramas de palavras
+    >= DEDUP_THRESHOLD.
+
+Os candidatos saem de chaves exatas (ativo, CVE, nome) e de LSH em bandas
+sobre as assinaturas MinHash (numpy, uma matriz n x DEDUP_NUM_PERM uint32);
+dentro de cada balde só os DEDUP_WINDOW vizinhos são comparados, então o
+custo é linear em n. Os pares confirmados são agrupados por union-find.
+
+Em cada grupo fica um finding canônico, com `sources` (scanner de origem e
+id de cada finding agrupado) e os CVEs unidos; os demais vão para
+`vulnerability_duplicates` com `duplicate_of` (e a parte fria de
+vulnerability_details) e saem da collection; rollups, feature store,
+details, ticket_ledger e order_stats acompanham.
+
+    python main.py dedup [--dry-run] [--threshold 0.8]
+"""
+from __future__ import annotations
+import os
+import re
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import ReplaceOne, UpdateOne
+
+from details import attach_details, delete_details
+from rollups import RollupDelta
+from score_meta import resolve_scores, score_fields
+from ticket_ledger import asset_key, remap_findings
+from vulnerability import extract_cve_ids
+import instrumentation
+
+DUPLICATES_COLLECTION = "vulnerability_duplicates"
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.8"))
+DEDUP_NUM_PERM = int(os.environ.get("DEDUP_NUM_PERM", "64"))
+DEDUP_BANDS = int(os.environ.get("DEDUP_BANDS", "16"))
+# vizinhos comparados dentro de um balde (baldes grandes não viram O(m²))
+DEDUP_WINDOW = int(os.environ.get("DEDUP_WINDOW", "8"))
+WRITE_BATCH_SIZE = 1000
+
+_PRIME = (1 << 31) - 1
+_MAX_HASH = np.uint32(_PRIME)
+_WORD = re.compile(r"[a-z0-9]+")
+_VERSION = re.compile(r"\b(v(er(sion)?)?\s*)?\d+([._-]\w+)*\b")
+# campos lidos na varredura; a descrição só vira assinatura e é descartada
+SCAN_PROJECTION = {"_id": 1, "name": 1, "description": 1, "cve_id": 1, "cve_ids": 1,
+                   "environments": 1, "asset": 1}
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def normalize_name(name: Any) -> str:
+    """Nome do componente sem versões, pontuação e caixa: 'OpenSSL 1.1.1k' -> 'openssl'."""
+    s = _VERSION.sub(" ", str(name or "").lower())
+    return " ".join(_WORD.findall(s))
+
+
+def shingles(text: Any, k: int = 3) -> List[str]:
+    words = _WORD.findall(str(text or "").lower())
+    if len(words) <= k:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+
+
+class MinHasher:
+    """Assinaturas MinHash com permutações (a*x + b) mod (2^31 - 1) fixas pela semente."""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, seed: int = 1):
+        rnd = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rnd.randint(1, _PRIME, size=num_perm).astype(np.uint64)[:, None]
+        self.b = rnd.randint(0, _PRIME, size=num_perm).astype(np.uint64)[:, None]
+
+    def signature(self, text: Any) -> Optional[np.ndarray]:
+        sh = shingles(text)
+        if not sh:
+            return None
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) & _PRIME for s in set(sh)), dtype=np.uint64)
+        return ((self.a * x[None, :] + self.b) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i: int, j: int) -> bool:
+        ri, rj = self.find(i), self.find(j)
+        if ri == rj:
+            return False
+        # o menor índice vira raiz: resultado independe da ordem dos pares
+        if rj < ri:
+            ri, rj = rj, ri
+        self.parent[rj] = ri
+        return True
+
+
+def _cves_compatible(a: frozenset, b: frozenset) -> bool:
+    return (not a and not b) or bool(a & b)
+
+
+def scan(collection, hasher: Optional[MinHasher] = None, batch_size: int = 5000) -> Dict[str, Any]:
+    """Uma varredura: ids, ativo (como inteiro), nome normalizado, CVEs e assinaturas."""
+    hasher = hasher or MinHasher()
+    n_hint = max(1, collection.estimated_document_count())
+    sigs = np.full((n_hint, hasher.num_perm), _MAX_HASH, dtype=np.uint32)
+    has_sig = np.zeros(n_hint, dtype=bool)
+    ids: List[Any] = []
+    names: List[str] = []
+    cves: List[frozenset] = []
+    assets: List[int] = []
+    asset_ids: Dict[str, int] = {}
+    next_asset = 0
+    # a mesma descrição se repete por ativo: a assinatura é calculada uma vez
+    seen: Dict[int, int] = {}
+
+    def _process(doc: Dict[str, Any]) -> None:
+        nonlocal sigs, has_sig, next_asset
+        i = len(ids)
+        if i >= len(sigs):
+            grow = len(sigs)
+            sigs = np.vstack([sigs, np.full((grow, hasher.num_perm), _MAX_HASH, dtype=np.uint32)])
+            has_sig = np.concatenate([has_sig, np.zeros(grow, dtype=bool)])
+        ids.append(doc["_id"])
+        names.append(normalize_name(doc.get("name")))
+        cves.append(frozenset(doc.get("cve_ids") or extract_cve_ids(doc.get("cve_id"))))
+        # sem ativo: um id só dele, então nunca divide chave ou balde com outro finding
+        akey = asset_key(doc)
+        a = asset_ids.get(akey) if akey else None
+        if a is None:
+            a = next_asset
+            next_asset += 1
+            if akey:
+                asset_ids[akey] = a
+        assets.append(a)
+        desc = doc.get("description")
+        key = hash(desc) if isinstance(desc, str) else None
+        j = seen.get(key) if key is not None else None
+        if j is not None:
+            sigs[i] = sigs[j]
+            has_sig[i] = has_sig[j]
+            return
+        sig = hasher.signature(desc)
+        if sig is not None:
+            sigs[i] = sig
+            has_sig[i] = True
+        if key is not None and len(seen) < 500_000:
+            seen[key] = i
+
+    batch: List[Dict[str, Any]] = []
+    cursor = collection.find({}, SCAN_PROJECTION, batch_size=batch_size)
+    try:
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                # descrições migradas ficam em vulnerability_details
+                for d in attach_details(batch, collection):
+                    _process(d)
+                batch = []
+        for d in attach_details(batch, collection):
+            _process(d)
+    finally:
+        cursor.close()
+    n = len(ids)
+    return {"ids": ids, "names": names, "cves": cves, "assets": np.asarray(assets, dtype=np.int64),
+            "sigs": sigs[:n], "has_sig": has_sig[:n]}
+
+
+def _roots(uf: "_UnionFind") -> np.ndarray:
+    """Raiz de cada posição (pointer jumping vetorizado sobre uma cópia do union-find)."""
+    root = np.asarray(uf.parent, dtype=np.int64)
+    while True:
+        nxt = root[root]
+        if np.array_equal(nxt, root):
+            return root
+        root = nxt
+
+
+def _cve_keys(cves: List[frozenset]) -> np.ndarray:
+    """-1 sem CVE, id do CVE quando há um só, -2 quando há vários (verificação em Python)."""
+    ids: Dict[str, int] = {}
+    out = np.empty(len(cves), dtype=np.int64)
+    for i, c in enumerate(cves):
+        out[i] = -1 if not c else ids.setdefault(next(iter(c)), len(ids)) if len(c) == 1 else -2
+    return out
+
+
+def _lsh_merge(data: Dict[str, Any], uf: "_UnionFind", threshold: float, bands: int, window: int) -> Tuple[int, int]:
+    """
+    Une os pares que colidem numa banda dentro do mesmo ativo (vizinhos até
+    `window` na ordem da banda) e passam na verificação. Pares já no mesmo
+    grupo são descartados antes da verificação. Retorna (candidatos, uniões).
+    """
+    sigs, has_sig, assets, cves = data["sigs"], data["has_sig"], data["assets"], data["cves"]
+    rows = sigs.shape[1] // bands
+    idx = np.flatnonzero(has_sig)
+    mult = np.uint64(0x9E3779B97F4A7C15)
+    ckey = _cve_keys(cves)
+    candidates = merged = 0
+    for b in range(bands):
+        block = sigs[idx, b * rows:(b + 1) * rows].astype(np.uint64)
+        h = np.zeros(len(idx), dtype=np.uint64)
+        for c in range(rows):
+            h = (h ^ block[:, c]) * mult
+        del block
+        order = np.lexsort((idx, h, assets[idx]))
+        hs, as_, ii = h[order], assets[idx][order], idx[order]
+        for w in range(1, window + 1):
+            same = (hs[w:] == hs[:-w]) & (as_[w:] == as_[:-w])
+            if not same.any():
+                break
+            left, right = ii[:-w][same], ii[w:][same]
+            root = _roots(uf)
+            # já no mesmo grupo, ou CVEs sabidamente incompatíveis: nem verifica
+            ka, kb = ckey[left], ckey[right]
+            keep = (root[left] != root[right]) & ((ka == kb) | (ka == -2) | (kb == -2))
+            left, right = left[keep], right[keep]
+            candidates += len(left)
+            for start in range(0, len(left), 100_000):
+                li, ri = left[start:start + 100_000], right[start:start + 100_000]
+                sim = (sigs[li] == sigs[ri]).mean(axis=1)
+                ok = sim >= threshold
+                for i, j in zip(li[ok].tolist(), ri[ok].tolist()):
+                    if _cves_compatible(cves[i], cves[j]) and uf.union(i, j):
+                        merged += 1
+    return candidates, merged
+
+
+def find_clusters(
+    collection=None,
+    *,
+    threshold: float = DEDUP_THRESHOLD,
+    bands: int = DEDUP_BANDS,
+    window: int = DEDUP_WINDOW,
+    data: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], List[List[int]]]:
+    """(dados da varredura, grupos com 2+ posições), cada grupo ordenado."""
+    coll = collection if collection is not None else _default_collection()
+    with instrumentation.span("dedup.scan"):
+        data = data if data is not None else scan(coll)
+    n = len(data["ids"])
+    uf = _UnionFind(n)
+    names, cves, assets = data["names"], data["cves"], data["assets"]
+    with instrumentation.span("dedup.exact"):
+        first: Dict[Tuple, int] = {}
+        for i in range(n):
+            if not names[i]:
+                continue
+            keys = [(int(assets[i]), c, names[i]) for c in cves[i]] or [(int(assets[i]), None, names[i])]
+            for key in keys:
+                j = first.setdefault(key, i)
+                if j != i:
+                    uf.union(j, i)
+        del first
+    with instrumentation.span("dedup.lsh") as sp:
+        candidates, merged = _lsh_merge(data, uf, threshold, bands, window)
+        sp.set(candidates=candidates, merged=merged)
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(uf.find(i), []).append(i)
+    return data, [g for g in groups.values() if len(g) > 1]
+
+
+def _source_entries(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if doc.get("sources"):
+        return list(doc["sources"])
+    src = doc.get("source") or {}
+    return [{**src, "finding_id": str(doc["_id"]), "name": doc.get("name")}]
+
+
+def _canonical_rank(doc: Dict[str, Any]) -> Tuple:
+    # já canônico > com cvss/epss > mais CVEs > descrição mais longa; empate: primeiro da varredura
+    return (
+        bool(doc.get("sources")),
+        doc.get("cvss") is not None or doc.get("epss") is not None,
+        len(doc.get("cve_ids") or []),
+        len(str(doc.get("description") or "")),
+    )
+
+
+def merge_group(docs: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+    """(canônico, $set do canônico, duplicados) para os documentos de um grupo."""
+    canonical = max(docs, key=_canonical_rank)
+    dups = [d for d in docs if d is not canonical]
+    sources = _source_entries(canonical)
+    cve_ids = list(canonical.get("cve_ids") or extract_cve_ids(canonical.get("cve_id")))
+    for d in dups:
+        sources.extend(_source_entries(d))
+        for c in d.get("cve_ids") or extract_cve_ids(d.get("cve_id")):
+            if c not in cve_ids:
+                cve_ids.append(c)
+    return canonical, {"sources": sources, "cve_ids": cve_ids, "duplicate_count": len(sources) - 1}, dups
+
+
+def dedup(
+    collection=None,
+    *,
+    threshold: float = DEDUP_THRESHOLD,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """
+    Agrupa e mescla os duplicados. Com dry_run só conta os grupos. Idempotente:
+    uma nova execução junta findings novos aos canônicos já existentes.
+    """
+    import feature_store
+    import order_stats
+
+    coll = collection if collection is not None else _default_collection()
+    with instrumentation.span("dedup") as root:
+        data, groups = find_clusters(coll, threshold=threshold)
+        ids = data["ids"]
+        summary = {"scanned": len(ids), "groups": len(groups), "duplicates": sum(len(g) - 1 for g in groups)}
+        root.set(**summary)
+        if dry_run or not groups:
+            return {**summary, "sample": [[str(ids[i]) for i in g] for g in groups[:10]]}
+        del data
+        fields = score_fields(coll)
+        dup_coll = coll.database[DUPLICATES_COLLECTION]
+        dup_coll.create_index("duplicate_of")
+        delta = RollupDelta(coll)
+        store = feature_store.open_store(coll)
+        now = datetime.now(timezone.utc)
+        moved = 0
+        pending: List[List[int]] = []
+
+        def _flush() -> int:
+            wanted = [ids[i] for g in pending for i in g]
+            found = {d["_id"]: d for d in coll.find({"_id": {"$in": wanted}})}
+            attach_details(list(found.values()), coll, fields=("description", "raw"))
+            archive: List[ReplaceOne] = []
+            updates: List[UpdateOne] = []
+            removed: List[Any] = []
+            remap: Dict[Any, Any] = {}
+            for g in pending:
+                docs = [found[ids[i]] for i in g if ids[i] in found]
+                if len(docs) < 2:
+                    continue
+                canonical, fields_set, dups = merge_group(docs)
+                updates.append(UpdateOne({"_id": canonical["_id"]}, {"$set": fields_set}))
+                for d in dups:
+                    archive.append(ReplaceOne({"_id": d["_id"]}, {**d, "duplicate_of": canonical["_id"],
+                                                                  "merged_at": now}, upsert=True))
+                    removed.append(d["_id"])
+                    remap[d["_id"]] = canonical["_id"]
+                    delta.remove(resolve_scores(dict(d), fields))
+            # cópia antes da remoção: uma falha no meio não perde findings
+            if archive:
+                dup_coll.bulk_write(archive, ordered=False)
+            if updates:
+                coll.bulk_write(updates, ordered=False)
+            if removed:
+                coll.delete_many({"_id": {"$in": removed}})
+                delete_details(removed, coll)
+                # tickets já abertos para os duplicados passam a apontar para o canônico
+                remap_findings(remap, coll)
+                if store.exists:
+                    store.delete(removed)
+            pending.clear()
+            return len(removed)
+
+        with instrumentation.span("dedup.merge"):
+            size = 0
+            for g in groups:
+                pending.append(g)
+                size += len(g)
+                if size >= WRITE_BATCH_SIZE:
+                    moved += _flush()
+                    size = 0
+            moved += _flush()
+            delta.flush()
+        order_stats.invalidate(coll)
+    return {**summary, "moved": moved}
@@ -0,0 +1,152 @@
+"""
+Campos frios dos findings (descrição e payload bruto do scanner) numa
+collection à parte, `vulnerability_details`, com o mesmo _id.
+
+O documento em `vulnerability` fica só com o que scoring, filtros e
+dashboard leem; o texto é carregado sob demanda (attach_details) na
+geração de tickets e na visão de detalhe. Documentos ainda não migrados
+continuam funcionando: o que já está no documento tem precedência.
+
+    python main.py details migrate [--dry-run]
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+import instrumentation
+
+DETAILS_COLLECTION = "vulnerability_details"
+# description: texto do scanner; raw: documento de origem (modelo1 / modelo2)
+COLD_FIELDS = ("description", "raw")
+MIGRATE_BATCH_SIZE = 1000
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def details_collection(collection=None):
+    coll = collection if collection is not None else _default_collection()
+    return coll.database[DETAILS_COLLECTION]
+
+
+def split_doc(doc: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(parte quente, parte fria) de um documento; a fria só com os campos presentes."""
+    hot = {k: v for k, v in doc.items() if k not in COLD_FIELDS}
+    cold = {k: doc[k] for k in COLD_FIELDS if k in doc}
+    return hot, cold
+
+
+def save_details(collection, docs: Iterable[Dict[str, Any]]) -> int:
+    """Grava a parte fria de documentos com _id (upsert); retorna quantos."""
+    ops = []
+    for d in docs:
+        _, cold = split_doc(d)
+        if cold and d.get("_id") is not None:
+            ops.append(UpdateOne({"_id": d["_id"]}, {"$set": cold}, upsert=True))
+    if ops:
+        details_collection(collection).bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def load_details(
+    ids: Iterable[Any],
+    collection=None,
+    fields: Iterable[str] = COLD_FIELDS,
+) -> Dict[Any, Dict[str, Any]]:
+    wanted = list(set(ids))
+    if not wanted:
+        return {}
+    proj = {f: 1 for f in fields}
+    with instrumentation.span("details.load", n=len(wanted)):
+        return {d.pop("_id"): d for d in details_collection(collection).find({"_id": {"$in": wanted}}, proj)}
+
+
+def attach_details(
+    docs: List[Dict[str, Any]],
+    collection=None,
+    fields: Iterable[str] = ("description",),
+) -> List[Dict[str, Any]]:
+    """Completa os documentos (in place) com os campos frios, numa consulta só."""
+    fields = tuple(fields)
+    missing = [d["_id"] for d in docs if d.get("_id") is not None and any(f not in d for f in fields)]
+    if not missing:
+        return docs
+    found = load_details(missing, collection, fields)
+    for d in docs:
+        for k, v in (found.get(d.get("_id")) or {}).items():
+            d.setdefault(k, v)
+    return docs
+
+
+def delete_details(ids: Iterable[Any], collection=None) -> int:
+    wanted = list(ids)
+    if not wanted:
+        return 0
+    return details_collection(collection).delete_many({"_id": {"$in": wanted}}).deleted_count
+
+
+def migrate(collection=None, *, batch_size: int = MIGRATE_BATCH_SIZE, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Move description/raw dos documentos de `collection` para vulnerability_details.
+    Em lotes: copia primeiro e só então faz o $unset, então pode ser
+    interrompida e reexecutada.
+    """
+    coll = collection if collection is not None else _default_collection()
+    q = {"$or": [{f: {"$exists": True}} for f in COLD_FIELDS]}
+    pending = coll.count_documents(q)
+    if dry_run:
+        return {"pending": pending}
+    moved = 0
+    unset = {f: "" for f in COLD_FIELDS}
+    with instrumentation.span("details.migrate") as sp:
+        while True:
+            batch = list(coll.find(q, {"_id": 1, **{f: 1 for f in COLD_FIELDS}}).limit(batch_size))
+            if not batch:
+                break
+            save_details(coll, batch)
+            coll.update_many({"_id": {"$in": [d["_id"] for d in batch]}}, {"$unset": unset})
+            moved += len(batch)
+        sp.set(moved=moved)
+    return {"pending": pending, "moved": moved}
+
+
+def backfill_assets(collection=None, *, batch_size: int = MIGRATE_BATCH_SIZE, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Preenche `asset` dos findings ingeridos antes do campo existir, a partir do
+    documento de origem guardado em `raw`. Os que continuam sem ativo ficam
+    de fora da dedup e do arquivamento por substituição.
+    """
+    from vulnerability import ASSET_SUBKEYS, extract_asset
+
+    coll = collection if collection is not None else _default_collection()
+    q: Dict[str, Any] = {"asset": None}
+    pending = coll.count_documents(q)
+    if dry_run:
+        return {"pending": pending}
+    filled = 0
+    last = None
+    with instrumentation.span("details.backfill_assets") as sp:
+        while True:
+            page = dict(q, _id={"$gt": last}) if last is not None else q
+            batch = list(coll.find(page, {"_id": 1, "source": 1, "raw": 1}).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            last = batch[-1]["_id"]
+            attach_details(batch, coll, fields=("raw",))
+            ops = []
+            for d in batch:
+                raw = d.get("raw") or {}
+                if (d.get("source") or {}).get("model") == "modelo2":
+                    asset = extract_asset(raw.get("asset"), ASSET_SUBKEYS)
+                else:
+                    asset = extract_asset(raw)
+                if asset:
+                    ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"asset": asset}}))
+            if ops:
+                coll.bulk_write(ops, ordered=False)
+                filled += len(ops)
+        sp.set(filled=filled)
+    return {"pending": pending, "filled": filled}
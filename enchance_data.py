@@ -1,7 +1,17 @@
 from get_epss import get_epss
 from get_cve import get_cve
 from time import sleep
+from typing import Any, Dict, List, Optional
+import os
+
+from pymongo import ASCENDING, UpdateOne
+
 from db import vulnerabilities_collection
+import feature_store
+import instrumentation
+import order_stats
+from rollups import RollupDelta, ROLLUP_PROJECTION
+from vulnerability import extract_cve_ids
 
 query = {
     "$or": [
@@ -10,24 +20,112 @@ query = {
     ]
 }
 
-def enchance_data():
-    #cve_ids = vulnerabilities_collection.distinct("cve_id", {"cve_id": {"$ne": None}})
-    cve_ids = vulnerabilities_collection.distinct("cve_id", query)
-    cve_ids = [cve_id for cve_id in cve_ids if isinstance(cve_id, str) and cve_id.startswith("CVE")]
-    
-    print(cve_ids)
+# pausa entre CVEs para não estourar o rate limit público do NVD
+ENRICH_SLEEP_S = float(os.environ.get("ENRICH_SLEEP_S", "1"))
+WRITE_BATCH_SIZE = 1000
+
+
+def ensure_indexes(collection=None) -> None:
+    coll = collection if collection is not None else vulnerabilities_collection
+    coll.create_index([("cve_ids", ASCENDING)])
+
+
+def plan_enrichment(collection=None, match: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Explode os CVEs de cada finding pendente (lista, 'a, b' ou string única)
+    e monta o conjunto de trabalho: um fetch por CVE único e o índice
+    CVE -> findings para distribuir o resultado.
+    Retorna {'cves': [...], 'index': {cve: [_id, ...]}, 'findings': {_id: [cve, ...]}}.
+    """
+    coll = collection if collection is not None else vulnerabilities_collection
+    index: Dict[str, List[Any]] = {}
+    findings: Dict[Any, List[str]] = {}
+    for doc in coll.find(match if match is not None else query, {"cve_id": 1, "cve_ids": 1}):
+        cves = extract_cve_ids(doc.get("cve_ids") or doc.get("cve_id"))
+        if not cves:
+            continue
+        findings[doc["_id"]] = cves
+        for cve in cves:
+            index.setdefault(cve, []).append(doc["_id"])
+    return {"cves": sorted(index), "index": index, "findings": findings}
+
+
+def _to_float(v) -> Optional[float]:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _max(values) -> Optional[float]:
+    vals = [v for v in values if v is not None]
+    return max(vals) if vals else None
+
+
+def enchance_data(collection=None) -> Dict[str, int]:
+    coll = collection if collection is not None else vulnerabilities_collection
+    ensure_indexes(coll)
+    with instrumentation.span("enrich.plan") as sp:
+        plan = plan_enrichment(coll)
+        sp.set(cves=len(plan["cves"]), findings=len(plan["findings"]))
+    cve_ids = plan["cves"]
+
     total_cves = len(cve_ids)
+    print(f"{total_cves} CVEs únicos para {len(plan['findings'])} findings")
+    fetched: Dict[str, Dict[str, Optional[float]]] = {}
     for index, cve_id in enumerate(cve_ids, start=1):
-        if cve_id is not None:
+        print(f"Processing {index}/{total_cves}: {cve_id}")
+        with instrumentation.span("enrich.fetch_cve"):
             cve_data = get_cve(cve_id)
+        with instrumentation.span("enrich.fetch_epss"):
             epss_data = get_epss(cve_id)
-            print(f"Processing {index}/{total_cves}: {cve_id}")
-            sleep(1)
-            if cve_data and epss_data:
-                vulnerabilities_collection.update_many(
-                    {"cve_id": cve_id},
-                    {"$set": {
-                        "cvss": cve_data.get("baseScore", 0),
-                        "epss": epss_data.get("epss", 0)
-                }}
-            )
+        instrumentation.count("enrich.cve_found" if cve_data else "enrich.cve_missing")
+        instrumentation.count("enrich.epss_found" if epss_data else "enrich.epss_missing")
+        fetched[cve_id] = {
+            "cvss": _to_float(cve_data.get("baseScore")) if cve_data else None,
+            "epss": _to_float(epss_data.get("epss")) if epss_data else None,
+        }
+        if index < total_cves:
+            sleep(ENRICH_SLEEP_S)
+
+    # fan-out: cada finding recebe o pior cvss/epss entre os seus CVEs
+    delta = RollupDelta(coll)
+    ops: List[UpdateOne] = []
+    features: List[Dict[str, Any]] = []
+    updated = 0
+    ids = list(plan["findings"])
+    write_span = instrumentation.timer("enrich.write")
+    for start in range(0, len(ids), WRITE_BATCH_SIZE):
+        chunk = ids[start:start + WRITE_BATCH_SIZE]
+        olds = {d["_id"]: d for d in coll.find({"_id": {"$in": chunk}}, ROLLUP_PROJECTION)}
+        for _id in chunk:
+            cves = plan["findings"][_id]
+            cvss = _max(fetched.get(c, {}).get("cvss") for c in cves)
+            epss = _max(fetched.get(c, {}).get("epss") for c in cves)
+            fields: Dict[str, Any] = {"cve_ids": cves}
+            if cvss is not None:
+                fields["cvss"] = cvss
+            if epss is not None:
+                fields["epss"] = epss
+            ops.append(UpdateOne({"_id": _id}, {"$set": fields}))
+            if len(fields) > 1:
+                features.append({"_id": _id, **fields})
+            old = olds.get(_id)
+            if old is not None and epss is not None:
+                delta.change(old, {**old, "epss": epss})
+            if cvss is not None or epss is not None:
+                updated += 1
+        if ops:
+            with write_span:
+                coll.bulk_write(ops, ordered=False)
+            ops = []
+            # só cvss/epss mudam: o store atualiza essas colunas nas linhas existentes
+            feature_store.sync(coll, features, insert=False)
+            features = []
+    write_span.close()
+    with instrumentation.span("enrich.rollups"):
+        delta.flush()
+    if updated:
+        order_stats.invalidate(coll)
+    instrumentation.count("enrich.updated", updated)
+    return {"cves": total_cves, "findings": len(ids), "updated": updated}
@@ -0,0 +1,571 @@
+"""
+Feature store colunar local para scoring sem Mongo.
+
+Uma pasta por collection com um .npy por coluna, abertos como memmap:
+
+    ids          S24  _id como texto (ObjectId em hex, int ou str)
+    cve          f8   cvss/cve já normalizado 0..10
+    epss         f8   epss normalizado 0..10
+    criticality  f8   companyCriticality 0..10
+    month        i4   ano*12 + mês-1 da data (-1 = sem data)
+    tags         u8   bitmask: bit 0 = OK (has_ok_tag), demais pelo vocabulário do meta
+    live         u1   0 = removido
+
+e um meta.json com n, capacidade, tipo do _id, vocabulário de tags e o
+build_id da última reconstrução. build() reconstrói tudo numa varredura;
+ingestão e enriquecimento mantêm em dia por sync() (que não faz nada se o
+store nunca foi construído). Escritas (upsert/delete) seguram um lock de
+arquivo (<pasta>.lock) e releem o meta.json antes: API e worker podem
+escrever no mesmo store, e o índice _id -> linha de cada processo é
+estendido só com as linhas novas.
+Leitores usam as colunas sem cópia (memmap somente leitura) e score_store
+calcula scores/classes vetorizado, com a mesma conta do ScoringPlan.
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from calculator_helper import (
+    CLASSES,
+    DATE_LUT_MONTHS,
+    ScoringPlan,
+    _clamp01_to_010,
+    _clamp_010,
+    _kmeans_1d_thresholds,
+    has_ok_tag,
+    parse_year_month,
+)
+from score_meta import bump_data_version
+import instrumentation
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+FEATURE_STORE_DIR = os.environ.get("FEATURE_STORE_DIR", "feature_store")
+INITIAL_CAPACITY = 1024
+MAX_TAGS = 64
+
+COLUMNS = {
+    "ids": "S24",
+    "cve": "f8",
+    "epss": "f8",
+    "criticality": "f8",
+    "month": "i4",
+    "tags": "u8",
+    "live": "u1",
+}
+# campo do ScoringPlan -> coluna (date_norm sai de 'month' pela tabela do plano)
+FEATURE_COLUMNS = {"cve": "cve", "epss": "epss", "companyCriticality": "criticality"}
+OK_BIT = 1
+
+STORE_PROJECTION = {
+    "_id": 1,
+    "date": 1,
+    "cvss": 1,
+    "cve": 1,
+    "epss": 1,
+    "companyCriticality": 1,
+    "environments": 1,
+    "tags": 1,
+}
+
+
+def _id_type(_id: Any) -> str:
+    if isinstance(_id, ObjectId):
+        return "objectid"
+    if isinstance(_id, int):
+        return "int"
+    return "str"
+
+
+def _encode_id(_id: Any) -> bytes:
+    raw = str(_id).encode("utf-8")
+    if len(raw) > 24:
+        raise ValueError(f"_id longo demais para o feature store: {_id!r}")
+    return raw
+
+
+def _decode_id(raw: bytes, id_type: str) -> Any:
+    s = raw.decode("utf-8")
+    if id_type == "objectid":
+        return ObjectId(s)
+    if id_type == "int":
+        return int(s)
+    return s
+
+
+def _tag_tokens(doc: Dict[str, Any]) -> List[str]:
+    out: List[str] = []
+    for key in ("environments", "tags"):
+        arr = doc.get(key) or []
+        if isinstance(arr, str):
+            arr = [arr]
+        if not isinstance(arr, list):
+            continue
+        for t in arr:
+            v = t.get("value") or t.get("name") if isinstance(t, dict) else t
+            if isinstance(v, str) and v:
+                out.append(v.upper())
+    return out
+
+
+def _month_of(date_str: Any) -> int:
+    ym = parse_year_month(date_str) if date_str else None
+    return ym[0] * 12 + ym[1] - 1 if ym else -1
+
+
+class FeatureStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.meta: Dict[str, Any] = self._read_meta() or {
+            "n": 0, "capacity": 0, "id_type": None, "tags": [], "updated_at": None,
+        }
+        self._cols: Dict[str, np.memmap] = {}
+        self._index: Optional[Dict[bytes, int]] = None
+
+    # ---- arquivos ----
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.npy")
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self) -> None:
+        # meta por último e com rename: leitores nunca veem n maior que os dados gravados
+        self.meta["updated_at"] = datetime.now(timezone.utc).isoformat()
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Relê o meta.json (sob o lock): outro processo pode ter escrito ou reconstruído o store."""
+        meta = self._read_meta()
+        if meta is None:
+            return
+        old_n = self.n
+        if meta.get("build_id") != self.meta.get("build_id") or int(meta["n"]) < old_n:
+            # reconstruído: linhas renumeradas
+            self._index = None
+            self._cols.clear()
+        elif int(meta["capacity"]) != int(self.meta["capacity"]):
+            self._cols.clear()
+        self.meta = meta
+        if self._index is not None and self.n > old_n:
+            ids = self._column("ids")[old_n:self.n]
+            self._index.update((bytes(raw), old_n + i) for i, raw in enumerate(ids.tolist()))
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, "meta.json"))
+
+    @property
+    def n(self) -> int:
+        return int(self.meta["n"])
+
+    def _column(self, name: str, mode: str = "r") -> np.ndarray:
+        col = self._cols.get(name)
+        if col is None or (mode != "r" and not col.flags.writeable):
+            col = np.load(self._file(name), mmap_mode=mode)
+            self._cols[name] = col
+        return col
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Todas as colunas até n, sem cópia (memmap somente leitura)."""
+        n = self.n
+        return {name: self._column(name)[:n] for name in COLUMNS}
+
+    def _grow(self, needed: int) -> None:
+        cap = int(self.meta["capacity"])
+        if needed <= cap:
+            return
+        new_cap = max(INITIAL_CAPACITY, cap)
+        while new_cap < needed:
+            new_cap *= 2
+        os.makedirs(self.path, exist_ok=True)
+        n = self.n
+        for name, dtype in COLUMNS.items():
+            tmp = self._file(name) + ".tmp"
+            arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=(new_cap,))
+            if n:
+                arr[:n] = self._column(name)[:n]
+            arr.flush()
+            del arr
+            os.replace(tmp, self._file(name))
+        self._cols.clear()
+        self.meta["capacity"] = new_cap
+
+    # ---- escrita ----
+
+    def _tag_bits(self, doc: Dict[str, Any]) -> int:
+        bits = OK_BIT if has_ok_tag(doc) else 0
+        vocab: List[str] = self.meta["tags"]
+        for tok in _tag_tokens(doc):
+            if tok not in vocab:
+                if len(vocab) >= MAX_TAGS - 1:
+                    continue
+                vocab.append(tok)
+            bits |= 1 << (vocab.index(tok) + 1)
+        return bits
+
+    def _row_index(self) -> Dict[bytes, int]:
+        if self._index is None:
+            if not self.n:
+                self._index = {}
+            else:
+                ids = self._column("ids")[:self.n]
+                self._index = {bytes(raw): i for i, raw in enumerate(ids.tolist())}
+        return self._index
+
+    def upsert(self, docs: Iterable[Dict[str, Any]], *, insert: bool = True) -> Dict[str, int]:
+        """
+        Insere ou atualiza linhas por _id. Numa linha existente só mudam as
+        colunas cujos campos vieram no documento (ex.: {'_id', 'epss'}).
+        Com insert=False (documentos parciais) _ids fora do store, ou removidos
+        dele, são ignorados; com insert=True uma linha removida é regravada inteira.
+        """
+        docs = [d for d in docs if d.get("_id") is not None]
+        if not docs:
+            return {"inserted": 0, "updated": 0}
+        with self._locked():
+            self._refresh()
+            return self._upsert(docs, insert)
+
+    def _upsert(self, docs: List[Dict[str, Any]], insert: bool) -> Dict[str, int]:
+        if self.meta["id_type"] is None:
+            self.meta["id_type"] = _id_type(docs[0]["_id"])
+        index = self._row_index()
+        # linha removida (live = 0) é como ausente: não volta com um documento parcial
+        live = self._column("live") if index else None
+        dead = {key for key in {_encode_id(d["_id"]) for d in docs} if key in index and not live[index[key]]}
+        if not insert:
+            docs = [d for d in docs if (key := _encode_id(d["_id"])) in index and key not in dead]
+            if not docs:
+                return {"inserted": 0, "updated": 0}
+        new = sum(1 for d in {_encode_id(d["_id"]) for d in docs} if d not in index)
+        self._grow(self.n + new)
+        # valores acumulados por coluna e gravados de uma vez (atribuição elemento a elemento no memmap é lenta)
+        writes: Dict[str, Tuple[List[int], List[Any]]] = {name: ([], []) for name in COLUMNS}
+        months: Dict[Any, int] = {}
+
+        def put(name: str, row: int, value: Any) -> None:
+            writes[name][0].append(row)
+            writes[name][1].append(value)
+
+        inserted = updated = 0
+        n = self.n
+        for doc in docs:
+            key = _encode_id(doc["_id"])
+            row = index.get(key)
+            full = row is None or key in dead
+            if row is None:
+                row = index[key] = n
+                n += 1
+                put("ids", row, key)
+            if full:
+                dead.discard(key)
+                inserted += 1
+            else:
+                updated += 1
+            put("live", row, 1)
+            if full or "cvss" in doc or "cve" in doc:
+                put("cve", row, _clamp_010(doc.get("cvss")) if "cvss" in doc and "cve" not in doc else _clamp_010(doc.get("cve", 0)))
+            if full or "epss" in doc:
+                put("epss", row, _clamp01_to_010(doc.get("epss")) if "epss" in doc else 0.0)
+            if full or "companyCriticality" in doc:
+                put("criticality", row, _clamp_010(doc.get("companyCriticality", 0)))
+            if full or "date" in doc:
+                d = doc.get("date")
+                m = months.get(d) if isinstance(d, str) else None
+                if m is None:
+                    m = _month_of(d)
+                    if isinstance(d, str):
+                        months[d] = m
+                put("month", row, m)
+            if full or "environments" in doc or "tags" in doc:
+                put("tags", row, self._tag_bits(doc))
+        cols = {name: self._column(name, "r+") for name in COLUMNS}
+        for name, (rows, values) in writes.items():
+            if rows:
+                cols[name][np.asarray(rows, dtype="i8")] = np.asarray(values, dtype=COLUMNS[name])
+        for col in cols.values():
+            col.flush()
+        self.meta["n"] = n
+        self._write_meta()
+        return {"inserted": inserted, "updated": updated}
+
+    def delete(self, ids: Iterable[Any]) -> int:
+        """Marca as linhas como removidas (live = 0); build() compacta."""
+        with self._locked():
+            self._refresh()
+            return self._delete(ids)
+
+    def _delete(self, ids: Iterable[Any]) -> int:
+        index = self._row_index()
+        live = self._column("live", "r+")
+        removed = 0
+        for _id in ids:
+            row = index.get(_encode_id(_id))
+            if row is not None and live[row]:
+                live[row] = 0
+                removed += 1
+        live.flush()
+        if removed:
+            self._write_meta()
+        return removed
+
+    # ---- leitura ----
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._column("live")[:self.n])
+
+    def ids_at(self, rows: Iterable[int]) -> List[Any]:
+        ids = self._column("ids")
+        id_type = self.meta["id_type"] or "str"
+        return [_decode_id(bytes(ids[int(r)]), id_type) for r in rows]
+
+    def ok_mask(self) -> np.ndarray:
+        return (self._column("tags")[:self.n] & np.uint64(OK_BIT)) != 0
+
+    def feature_columns(self, plan: ScoringPlan, rows: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Colunas 0..10 dos campos do plano (mesmos valores de plan.append).
+        Sem `rows` e sem remoções, as colunas numéricas são views do memmap.
+        """
+        n = self.n
+        if rows is None:
+            live = self._column("live")[:n]
+            rows = None if bool(live.all()) else np.flatnonzero(live)
+        out: Dict[str, np.ndarray] = {}
+        for f in plan.fields:
+            if f == "date_norm":
+                out[f] = date_norm_column(plan, self._take("month", rows))
+            elif f in FEATURE_COLUMNS:
+                out[f] = self._take(FEATURE_COLUMNS[f], rows)
+            else:
+                raise ValueError(f"campo {f!r} não existe no feature store")
+        return out
+
+    def _take(self, name: str, rows: Optional[np.ndarray]) -> np.ndarray:
+        col = self._column(name)[:self.n]
+        return col if rows is None else col[rows]
+
+    # ---- reconstrução ----
+
+    def build(self, collection, *, query: Optional[Dict[str, Any]] = None, batch_size: int = 50_000) -> Dict[str, Any]:
+        """Reconstrói o store numa pasta temporária e troca de uma vez (leitores abertos seguem no antigo)."""
+        tmp = FeatureStore(self.path + ".building")
+        shutil.rmtree(tmp.path, ignore_errors=True)
+        os.makedirs(tmp.path)
+        tmp._grow(max(INITIAL_CAPACITY, collection.count_documents(query or {})))
+        batch: List[Dict[str, Any]] = []
+        cursor = collection.find(query or {}, STORE_PROJECTION, batch_size=batch_size)
+        with instrumentation.span("features.build") as sp:
+            try:
+                for doc in cursor:
+                    batch.append(doc)
+                    if len(batch) >= batch_size:
+                        # pasta temporária, só deste processo: sem lock
+                        tmp._upsert(batch, True)
+                        batch = []
+            finally:
+                cursor.close()
+            if batch:
+                tmp._upsert(batch, True)
+            tmp.meta["build_id"] = uuid.uuid4().hex
+            tmp._write_meta()
+            sp.set(n=tmp.n)
+        old = self.path + ".old"
+        with self._locked():
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.exists(self.path):
+                os.replace(self.path, old)
+            os.replace(tmp.path, self.path)
+            shutil.rmtree(old, ignore_errors=True)
+        self.meta = self._read_meta()
+        self._cols.clear()
+        self._index = None
+        bump_data_version(collection)
+        return {"n": self.n, "path": self.path, "tags": len(self.meta["tags"])}
+
+
+def store_path(collection=None) -> str:
+    if collection is None:
+        from db import vulnerabilities_collection as collection
+    return os.path.join(FEATURE_STORE_DIR, collection.name)
+
+
+def open_store(collection=None, *, path: Optional[str] = None) -> FeatureStore:
+    return FeatureStore(path or store_path(collection))
+
+
+# um store por pasta no processo: o índice _id -> linha é montado uma vez e
+# depois só estendido, em vez de refeito a cada lote da ingestão
+_sync_stores: Dict[str, FeatureStore] = {}
+
+
+def sync(collection, docs: Iterable[Dict[str, Any]], *, insert: bool = True) -> Optional[Dict[str, int]]:
+    """
+    Gancho da ingestão/enriquecimento: atualiza o store se ele já existe.
+    insert=False para documentos parciais (só atualiza linhas existentes).
+    """
+    docs = list(docs)
+    if docs:
+        # o que a UI mostra mudou mesmo sem store local (ex.: cvss do enriquecimento)
+        bump_data_version(collection)
+    path = store_path(collection)
+    store = _sync_stores.get(path)
+    if store is None:
+        store = _sync_stores[path] = open_store(collection, path=path)
+    if not store.exists:
+        return None
+    with instrumentation.span("features.sync"):
+        return store.upsert(docs, insert=insert)
+
+
+# ---- scoring vetorizado (mesma conta de ScoringPlan / _robust_z_list) ----
+
+def date_norm_column(plan: ScoringPlan, months: np.ndarray) -> np.ndarray:
+    lut = np.asarray(plan._date_lut, dtype="f8")
+    ref = plan.ref_year * 12 + plan.ref_month - 1
+    age = np.maximum(ref - months.astype("i8"), 0)
+    out = lut[np.minimum(age, DATE_LUT_MONTHS)]
+    far = age > DATE_LUT_MONTHS
+    if far.any():
+        out[far] = [plan._age_score(int(m)) for m in age[far]]
+    out[months < 0] = 0.0
+    return out
+
+
+def robust_z(col: np.ndarray, cap: float = 3.0) -> np.ndarray:
+    med = np.median(col)
+    mad = float(np.median(np.abs(col - med))) or 1e-9
+    return np.clip((col - med) / (1.4826 * mad), -cap, cap)
+
+
+def score_arrays(plan: ScoringPlan, cols: Dict[str, np.ndarray]) -> np.ndarray:
+    n = len(next(iter(cols.values()))) if cols else 0
+    scores = np.zeros(n, dtype="f8")
+    for f in plan.fields:
+        scores += robust_z(cols[f]) * plan.weights[f]
+    return np.round(scores, 6)
+
+
+def _percentile_sorted(xs: np.ndarray, q: float) -> float:
+    idx = min(max(q, 0.0), 1.0) * (len(xs) - 1)
+    lo_i, hi_i = int(np.floor(idx)), int(np.ceil(idx))
+    if lo_i == hi_i:
+        return float(xs[lo_i])
+    frac = idx - lo_i
+    return float(xs[lo_i]) * (1 - frac) + float(xs[hi_i]) * frac
+
+
+def kmeans_thresholds(xs: np.ndarray, k: int = 4, max_iter: int = 100) -> Tuple[float, float, float]:
+    """_kmeans_1d_thresholds sobre um array já ordenado (fronteiras por searchsorted, médias por cumsum)."""
+    n = len(xs)
+    if n < k or xs[0] == xs[-1]:
+        return (_percentile_sorted(xs, 0.50), _percentile_sorted(xs, 0.80), _percentile_sorted(xs, 0.95))
+    centers = [float(xs[int((i + 1) * n / (k + 1))]) for i in range(k)]
+    prefix = np.concatenate(([0.0], np.cumsum(xs)))
+    for _ in range(max_iter):
+        if not all(centers[j] < centers[j + 1] for j in range(k - 1)):
+            # centros empatados: caminho geral (raro)
+            return _kmeans_1d_thresholds(xs.tolist(), k=k, max_iter=max_iter)
+        mids = [0.5 * (centers[j] + centers[j + 1]) for j in range(k - 1)]
+        bounds = [0] + np.searchsorted(xs, mids, side="right").tolist() + [n]
+        new_centers = [
+            (float(prefix[bounds[i + 1]] - prefix[bounds[i]]) / (bounds[i + 1] - bounds[i]) if bounds[i + 1] > bounds[i] else centers[i])
+            for i in range(k)
+        ]
+        done = all(abs(a - b) < 1e-9 for a, b in zip(new_centers, centers))
+        centers = new_centers
+        if done:
+            break
+    centers.sort()
+    return tuple(0.5 * (centers[i] + centers[i + 1]) for i in range(k - 1))
+
+
+def classify_arrays(plan: ScoringPlan, scores: np.ndarray) -> Tuple[Dict[str, float], np.ndarray]:
+    """(thresholds_raw, índice da classe em CLASSES por posição)."""
+    if len(scores) == 0 or float(scores.max() - scores.min()) < 1e-9:
+        s0 = float(scores[0]) if len(scores) else 0.0
+        return {"t1": s0, "t2": s0, "t3": s0}, np.full(len(scores), CLASSES.index("media"), dtype="u1")
+    xs = np.sort(scores)
+    if plan.cut_mode == "kmeans":
+        t1, t2, t3 = kmeans_thresholds(xs)
+    else:
+        t1, t2, t3 = (_percentile_sorted(xs, q) for q in plan.quantile_cuts)
+    # s <= t1 -> 0, t1 < s <= t2 -> 1, ...
+    cls = np.searchsorted(np.array([t1, t2, t3]), scores, side="left").astype("u1")
+    return {"t1": round(t1, 6), "t2": round(t2, 6), "t3": round(t3, 6)}, cls
+
+
+def score_store(
+    plan: ScoringPlan,
+    store: FeatureStore,
+    *,
+    suppress_ok: bool = False,
+) -> Dict[str, Any]:
+    """
+    Scores e classes de todas as linhas vivas do store.
+    Retorna {'rows', 'scores', 'classes' (índices em CLASSES), 'thresholds_raw'}.
+    """
+    with instrumentation.span("features.score", n=store.n) as sp:
+        rows = None
+        live = store._column("live")[:store.n]
+        if suppress_ok or not bool(live.all()):
+            keep = live.astype(bool)
+            if suppress_ok:
+                keep &= ~store.ok_mask()
+            rows = np.flatnonzero(keep)
+        cols = store.feature_columns(plan, rows)
+        scores = score_arrays(plan, cols)
+        thresholds, classes = classify_arrays(plan, scores)
+        if rows is None:
+            rows = np.arange(len(scores))
+        sp.set(scored=len(scores))
+    return {"rows": rows, "scores": scores, "classes": classes, "thresholds_raw": thresholds}
+
+
+def top_rows(scores: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Posições dos `k` maiores scores (ordem desc). Empates ficam com a menor
+    posição, como heapq.nlargest.
+    """
+    idx = np.flatnonzero(mask) if mask is not None else np.arange(len(scores))
+    k = min(max(0, int(k)), len(idx))
+    if not k:
+        return idx[:0]
+    vals = scores[idx]
+    kth = np.partition(vals, len(vals) - k)[len(vals) - k]
+    above = idx[vals > kth]
+    sel = np.concatenate((above, idx[vals == kth][:k - len(above)]))
+    return sel[np.lexsort((sel, -scores[sel]))]
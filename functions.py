@@ -3,7 +3,11 @@
 from typing import Any, Dict, List, Optional
 from bson import ObjectId
 from db import vulnerabilities_collection
-from jira_api import gen_title_desc, create_issue
+from details import attach_details
+from jira_api import create_issue
+from llm_cache import cached_gen_title_desc
+from score_meta import map_projection, map_score_field, resolve_scores, score_fields
+import ticket_ledger
 
 
 def _to_oid(x: Any) -> ObjectId:
@@ -35,20 +39,37 @@ def create_issue_from_mongo_id(mongo_id: Any, project_key: str = "MFLP", issue_t
     doc = vulnerabilities_collection.find_one({"_id": oid})
     if not doc:
         return {"error": "not_found", "_id": str(oid)}
+    attach_details([doc], vulnerabilities_collection)
+    fp = ticket_ledger.fingerprint(doc)
+    known = ticket_ledger.lookup([fp]).get(fp)
+    if known:
+        # já existe ticket para este finding: não chama LLM nem Jira de novo
+        ticket_ledger.record([{"fingerprint": fp, "cve_id": known.get("cve_id"), "_id": oid}],
+                             jira_key=known["jira_key"], titulo=known.get("titulo", ""), descricao=known.get("descricao", ""))
+        return {"_id": str(oid), "titulo": known.get("titulo"), "descricao": known.get("descricao"),
+                "jira": {"key": known["jira_key"]}, "existing": True}
     obj = _extract_for_llm(doc)
-    titulo, descricao = gen_title_desc(obj)
+    titulo, descricao = cached_gen_title_desc(obj)
     jira = create_issue(project_key, titulo, descricao, issue_type)
+    ticket_ledger.record([{"fingerprint": fp, "cve_id": ticket_ledger.normalize_cve(doc.get("cve_id")), "_id": oid}],
+                         jira_key=jira.get("key"), titulo=titulo, descricao=descricao)
     return {"_id": str(oid), "titulo": titulo, "descricao": descricao, "jira": jira}
 
 
+def get_vulnerability_detail(mongo_id: Any) -> Optional[Dict[str, Any]]:
+    """Visão de detalhe: documento com score da geração corrente, descrição e payload de origem."""
+    oid = _to_oid(mongo_id)
+    doc = vulnerabilities_collection.find_one({"_id": oid})
+    if not doc:
+        return None
+    resolve_scores(doc, score_fields(vulnerabilities_collection))
+    return attach_details([doc], vulnerabilities_collection, fields=("description", "raw"))[0]
+
+
 def create_issues_for_ids(ids: List[Any], project_key: str = "MFLP", issue_type: str = "Task") -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    for x in ids:
-        try:
-            out.append(create_issue_from_mongo_id(x, project_key=project_key, issue_type=issue_type))
-        except Exception as e:
-            out.append({"_id": str(x), "error": str(e)})
-    return out
+    # lote: um $in no Mongo, LLM em paralelo e /issue/bulk no Jira (ver ticketing.py)
+    from ticketing import create_issues_batch
+    return create_issues_batch(ids, project_key=project_key, issue_type=issue_type)["results"]
 
 
 
@@ -81,10 +102,57 @@ def get_vulnerabilities_filtered(
     sort_by: str = "base_score",
     sort_dir: int = -1,
 ) -> List[Dict[str, Any]]:
+    # scores da geração corrente (blue/green): nomes físicos resolvidos uma vez por consulta
+    fields = score_fields(vulnerabilities_collection)
+    q = build_filter_query(priority_class=priority_class, ambientes=ambientes, tipos=tipos,
+                           class_field=fields["class"])
+    proj = projection or {
+        "_id": 1,
+        "name": 1,
+        "date": 1,
+        "cve_id": 1,
+        "cvss": 1,
+        "cve": 1,
+        "epss": 1,
+        "companyCriticality": 1,
+        "base_score": 1,
+        "priority_class": 1,
+        "environments": 1,
+        "tags": 1,
+    }
+    cur = (vulnerabilities_collection.find(q, map_projection(proj, fields))
+           .sort(map_score_field(sort_by, fields), sort_dir).skip(max(0, int(skip))).limit(max(0, int(limit))))
+    docs = [resolve_scores(d, fields) for d in cur]
+    if start_date or end_date:
+        sd = _parse_date_any(start_date) if start_date else None
+        ed = _parse_date_any(end_date) if end_date else None
+        docs = [d for d in docs if in_date_range(d, sd, ed)]
+    return docs
+
+
+def in_date_range(doc: Dict[str, Any], sd: Optional[datetime], ed: Optional[datetime]) -> bool:
+    """Datas ficam como texto em formatos variados: o filtro de período é feito no cliente."""
+    dt = _parse_date_any(doc.get("date"))
+    if dt is None:
+        return False
+    if sd and dt < sd:
+        return False
+    if ed and dt > ed:
+        return False
+    return True
+
+
+def build_filter_query(
+    *,
+    priority_class: Optional[List[str] | str] = None,
+    ambientes: Optional[List[str] | str] = None,
+    tipos: Optional[List[str] | str] = None,
+    class_field: str = "priority_class",
+) -> Dict[str, Any]:
     q = {"$and": []}
     if priority_class:
         pcs = priority_class if isinstance(priority_class, list) else [priority_class]
-        q["$and"].append({"priority_class": {"$in": pcs}})
+        q["$and"].append({class_field: {"$in": pcs}})
     ambs = None
     if ambientes:
         ambs = ambientes if isinstance(ambientes, list) else [ambientes]
@@ -106,37 +174,7 @@ def get_vulnerabilities_filtered(
         })
     if not q["$and"]:
         q = {}
-    proj = projection or {
-        "_id": 1,
-        "name": 1,
-        "date": 1,
-        "cve_id": 1,
-        "cvss": 1,
-        "cve": 1,
-        "epss": 1,
-        "companyCriticality": 1,
-        "base_score": 1,
-        "priority_class": 1,
-        "environments": 1,
-        "tags": 1,
-    }
-    cur = vulnerabilities_collection.find(q, proj).sort(sort_by, sort_dir).skip(max(0, int(skip))).limit(max(0, int(limit)))
-    docs = list(cur)
-    if start_date or end_date:
-        sd = _parse_date_any(start_date) if start_date else None
-        ed = _parse_date_any(end_date) if end_date else None
-        out = []
-        for d in docs:
-            dt = _parse_date_any(d.get("date"))
-            if dt is None:
-                continue
-            if sd and dt < sd:
-                continue
-            if ed and dt > ed:
-                continue
-            out.append(d)
-        docs = out
-    return docs
+    return q
 
 
 # New function: get_all_vulnerabilities_paginated
@@ -161,6 +199,7 @@ def get_all_vulnerabilities_paginated(
         "environments": 1,
         "tags": 1,
     }
-    cur = vulnerabilities_collection.find({}, proj).sort("base_score", -1).skip(skip).limit(page_size)
-    docs = list(cur)
-    return docs
\ No newline at end of file
+    fields = score_fields(vulnerabilities_collection)
+    cur = (vulnerabilities_collection.find({}, map_projection(proj, fields))
+           .sort(fields["score"], -1).skip(skip).limit(page_size))
+    return [resolve_scores(d, fields) for d in cur]
\ No newline at end of file
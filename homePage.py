@@ -3,8 +3,10 @@ import streamlit as st
 from enum import Enum
 import pandas as pd
 from dashboard_seguranca import exibir_dashboard
-from functions import create_issue_from_mongo_id, get_all_vulnerabilities_paginated
-from main import process_scores
+from functions import create_issue_from_mongo_id
+from cache import cached_vulnerabilities_page, cached_what_if, invalidate
+from main import DEFAULT_WEIGHTS
+from jobs import submit_score_job, get_job, DONE, FAILED
 
 
 tab1, tab2 = st.tabs(['Oráculo', 'Dashboard'])
@@ -17,8 +19,8 @@ with tab1:
     col1, col2 = st.columns(2)
 
     with col1:
-        company_criticality = st.slider('Criticidade para Empresa', min_value=-2.0, max_value=2.0, value=0.0, step=0.1)
-        date = st.slider('Data', min_value=-2.0, max_value=2.0, value=0.0, step=0.1)
+        company_criticality = st.slider('Criticidade para Empresa', min_value=-2.0, max_value=2.0, value=float(DEFAULT_WEIGHTS['companyCriticality']), step=0.1)
+        date = st.slider('Data', min_value=-2.0, max_value=2.0, value=float(DEFAULT_WEIGHTS['date_norm']), step=0.1)
 
 
     class EnvironmentEnum(Enum):
@@ -28,8 +30,15 @@ with tab1:
         INFRAESTRUTURA = 'Infraestrutura'
 
     with col2:
-        epss = st.slider('Epss', min_value=-2.0, max_value=2.0, value=0.0, step=0.1)
-        cve = st.slider('CVE', min_value=-2.0, max_value=2.0, value=0.0, step=0.1)
+        epss = st.slider('Epss', min_value=-2.0, max_value=2.0, value=float(DEFAULT_WEIGHTS['epss']), step=0.1)
+        cve = st.slider('CVE', min_value=-2.0, max_value=2.0, value=float(DEFAULT_WEIGHTS['cve']), step=0.1)
+
+    weights = {
+        "cve": cve,
+        "epss": epss,
+        "companyCriticality": company_criticality,
+        "date_norm": date,
+    }
         
     environment = st.selectbox(
             'Ambiente',
@@ -37,11 +46,52 @@ with tab1:
             index=0
         )
     
-    data =  get_all_vulnerabilities_paginated(page=1)
-
-    # Botão para calcular
+    # Botão para calcular: só enfileira o recálculo; o worker (python jobs.py) executa
     if st.button('Calcular', key='calcular', help='Clique para calcular', use_container_width=True):
-        process_scores()
+        job = submit_score_job(weights)
+        st.session_state['score_job_id'] = str(job['_id'])
+
+    job_id = st.session_state.get('score_job_id')
+    if job_id:
+        job = get_job(job_id)
+        if job is None:
+            st.session_state.pop('score_job_id', None)
+        elif job['status'] == DONE:
+            invalidate()
+            st.session_state.pop('score_job_id', None)
+            st.success('Recálculo concluído.')
+        elif job['status'] == FAILED:
+            st.session_state.pop('score_job_id', None)
+            st.error(f"Recálculo falhou: {job.get('error')}")
+        else:
+            prog = job.get('progress') or {}
+            total = prog.get('total') or 0
+            written = prog.get('written') or 0
+            st.progress(
+                min(1.0, written / total) if total else 0.0,
+                text=f"Recálculo {job['status']} ({prog.get('stage')}): "
+                     f"{prog.get('processed', 0)} lidos, {written} gravados de {total or '?'}",
+            )
+            st.button('Atualizar status', key='atualizar_job')
+
+    # prévia what-if: recalculada a cada slider, sem gravar no Mongo
+    preview = cached_what_if(weights, top_n=10)
+    if preview['population']:
+        st.write('### Prévia com os pesos selecionados')
+        counts = preview['counts']
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric('Gravíssima', counts.get('gravissima', 0))
+        c2.metric('Alta', counts.get('alta', 0))
+        c3.metric('Média', counts.get('media', 0))
+        c4.metric('Baixa', counts.get('baixa', 0))
+        st.dataframe(
+            pd.DataFrame(preview['top']).astype({'_id': str}),
+            column_config={"name": "Nome", "cve_id": "CVE ID", "date": "Data", "_raw_score": "Score", "_class": "Classe"},
+            hide_index=True,
+            use_container_width=True,
+        )
+
+    data = cached_vulnerabilities_page(page=1)
 
 
     # Converte os dados para um DataFrame do pandas
@@ -0,0 +1,199 @@
+"""
+Cliente HTTP único para as integrações (NVD, EPSS, LLM local, Jira).
+
+- uma requests.Session por host (keep-alive, pool de conexões)
+- timeouts padrão configuráveis
+- retry com backoff exponencial que respeita Retry-After
+- circuit breaker por host
+- métricas por endpoint: chamadas, status, retries, erros e latência
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "16"))
+HTTP_MAX_BACKOFF = float(os.environ.get("HTTP_MAX_BACKOFF", "60"))
+
+BREAKER_THRESHOLD = int(os.environ.get("HTTP_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("HTTP_BREAKER_COOLDOWN", "30"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.RequestException):
+    """O host acumulou falhas seguidas; chamadas são recusadas até o cooldown."""
+
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_breakers: Dict[str, Dict[str, Any]] = {}
+_metrics: Dict[str, Dict[str, Any]] = {}
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_session(url: str) -> requests.Session:
+    """Sessão compartilhada do host de `url`."""
+    host = _host(url)
+    with _lock:
+        s = _sessions.get(host)
+        if s is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            s.mount(host, adapter)
+            _sessions[host] = s
+        return s
+
+
+# ---- circuit breaker ----
+
+def _breaker_allow(host: str) -> bool:
+    with _lock:
+        b = _breakers.get(host)
+        if not b or b["state"] == "closed":
+            return True
+        if b["state"] == "open" and time.monotonic() >= b["open_until"]:
+            b["state"] = "half_open"
+        if b["state"] == "half_open" and not b.get("probing"):
+            b["probing"] = True  # deixa passar uma única chamada de teste
+            return True
+        return False
+
+
+def _breaker_open(host: str) -> bool:
+    with _lock:
+        b = _breakers.get(host)
+        return bool(b) and b["state"] == "open"
+
+
+def _breaker_record(host: str, ok: bool) -> None:
+    with _lock:
+        b = _breakers.setdefault(host, {"state": "closed", "failures": 0, "open_until": 0.0})
+        if ok:
+            b.update(state="closed", failures=0, probing=False)
+            return
+        b["failures"] += 1
+        if b["state"] == "half_open" or b["failures"] >= BREAKER_THRESHOLD:
+            b.update(state="open", open_until=time.monotonic() + BREAKER_COOLDOWN, probing=False)
+
+
+# ---- métricas ----
+
+def _observe(endpoint: str, *, status: Optional[int] = None, latency: float = 0.0,
+             retry: bool = False, error: bool = False) -> None:
+    with _lock:
+        m = _metrics.setdefault(endpoint, {
+            "calls": 0, "retries": 0, "errors": 0, "status": {},
+            "latency_sum_s": 0.0, "latency_max_s": 0.0,
+        })
+        if retry:
+            m["retries"] += 1
+            return
+        m["calls"] += 1
+        m["latency_sum_s"] += latency
+        m["latency_max_s"] = max(m["latency_max_s"], latency)
+        if error:
+            m["errors"] += 1
+        if status is not None:
+            key = str(status)
+            m["status"][key] = m["status"].get(key, 0) + 1
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        out = {}
+        for ep, m in _metrics.items():
+            row = dict(m, status=dict(m["status"]))
+            row["latency_avg_s"] = round(m["latency_sum_s"] / m["calls"], 4) if m["calls"] else 0.0
+            out[ep] = row
+        out["_breakers"] = {h: b["state"] for h, b in _breakers.items()}
+        return out
+
+
+def reset_metrics() -> None:
+    with _lock:
+        _metrics.clear()
+
+
+# ---- requisição ----
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    v = resp.headers.get("Retry-After")
+    if not v:
+        return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(v).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def request(
+    method: str,
+    url: str,
+    *,
+    endpoint: Optional[str] = None,
+    timeout: Optional[Any] = None,
+    retries: int = 3,
+    backoff: float = 1.5,
+    retry_statuses: Iterable[int] = RETRY_STATUSES,
+    **kwargs,
+) -> requests.Response:
+    """
+    Faz a chamada pela sessão do host. Repete em erro de conexão e nos
+    status de `retry_statuses` (até `retries` vezes, sem contar a primeira
+    chamada), esperando o Retry-After quando o servidor informa e
+    backoff**tentativa caso contrário. Para de repetir quando o circuito abre.
+    Devolve a última resposta (o chamador decide sobre raise_for_status);
+    erros de conexão esgotados e circuito aberto viram RequestException.
+    """
+    endpoint = endpoint or f"{method.upper()} {_host(url)}"
+    host = _host(url)
+    statuses = set(retry_statuses)
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    session = get_session(url)
+    attempt = 0
+    while True:
+        if not _breaker_allow(host):
+            _observe(endpoint, error=True)
+            raise CircuitOpenError(f"circuito aberto para {host}")
+        t0 = time.perf_counter()
+        try:
+            resp = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            _observe(endpoint, latency=time.perf_counter() - t0, error=True)
+            _breaker_record(host, ok=False)
+            # circuito recém-aberto: esperar o backoff só adiaria o CircuitOpenError
+            if attempt >= retries or _breaker_open(host):
+                raise
+            wait = None
+        else:
+            _observe(endpoint, status=resp.status_code, latency=time.perf_counter() - t0,
+                     error=resp.status_code >= 500)
+            # 429 é controle de vazão, não falha do host
+            _breaker_record(host, ok=resp.status_code < 500)
+            if resp.status_code not in statuses or attempt >= retries or _breaker_open(host):
+                return resp
+            wait = _retry_after(resp)
+            resp.close()
+        attempt += 1
+        _observe(endpoint, retry=True)
+        if wait is None:
+            wait = backoff ** attempt
+        time.sleep(min(wait, HTTP_MAX_BACKOFF))
@@ -0,0 +1,248 @@
+"""
+Spans e contadores leves para os caminhos quentes (scoring, top-K,
+enriquecimento, tickets).
+
+Desligado por padrão: span()/timer() devolvem um contexto nulo compartilhado
+e count() retorna na primeira linha. Liga com INSTRUMENTATION=1 ou enable().
+
+    with instrumentation.span("score.kmeans", n=len(scores)):
+        ...
+
+Ligado, cada span vira um registro {name, parent, start, duration_s, attrs}
+(guardado em memória e, se INSTRUMENTATION_LOG apontar um arquivo, também
+em JSON lines) e alimenta agregados por nome, exportados em JSON
+(export_json) ou no formato texto do Prometheus (prometheus_text /
+start_metrics_server).
+"""
+from __future__ import annotations
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+ENABLED = os.environ.get("INSTRUMENTATION", "").lower() in ("1", "true", "yes", "on")
+LOG_PATH = os.environ.get("INSTRUMENTATION_LOG") or None
+MAX_RECORDS = int(os.environ.get("INSTRUMENTATION_MAX_RECORDS", "10000"))
+
+_lock = threading.Lock()
+_local = threading.local()
+_records: "deque[Dict[str, Any]]" = deque(maxlen=MAX_RECORDS)
+_spans: Dict[str, Dict[str, float]] = {}
+_counters: Dict[str, float] = {}
+
+
+class _Noop:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+_NOOP = _Noop()
+
+
+def enable(flag: bool = True, *, log_path: Optional[str] = None) -> None:
+    global ENABLED, LOG_PATH
+    ENABLED = flag
+    if log_path is not None:
+        LOG_PATH = log_path
+
+
+def _stack() -> List[str]:
+    st = getattr(_local, "stack", None)
+    if st is None:
+        st = _local.stack = []
+    return st
+
+
+def _emit(name: str, parent: Optional[str], start: float, duration: float, attrs: Dict[str, Any]) -> None:
+    rec = {"name": name, "parent": parent, "start": start, "duration_s": round(duration, 6), "attrs": attrs}
+    with _lock:
+        _records.append(rec)
+        agg = _spans.setdefault(name, {"count": 0, "sum_s": 0.0, "max_s": 0.0})
+        agg["count"] += 1
+        agg["sum_s"] += duration
+        agg["max_s"] = max(agg["max_s"], duration)
+        if LOG_PATH:
+            with open(LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, default=str) + "\n")
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "_t0", "_wall", "_parent")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        st = _stack()
+        self._parent = st[-1] if st else None
+        st.append(self.name)
+        self._wall = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._t0
+        _stack().pop()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _emit(self.name, self._parent, self._wall, duration, self.attrs)
+        return False
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+def span(name: str, **attrs):
+    """Mede o bloco `with`. Spans aninhados registram o nome do pai."""
+    if not ENABLED:
+        return _NOOP
+    return _Span(name, attrs)
+
+
+class _Timer:
+    """Acumula o tempo de muitos blocos curtos e registra um único span no close()."""
+    __slots__ = ("name", "attrs", "total", "calls", "_t0", "_wall", "_parent")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.total = 0.0
+        self.calls = 0
+        st = _stack()
+        self._parent = st[-1] if st else None
+        self._wall = time.time()
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total += time.perf_counter() - self._t0
+        self.calls += 1
+        return False
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def close(self) -> None:
+        self.attrs["calls"] = self.calls
+        _emit(self.name, self._parent, self._wall, self.total, self.attrs)
+
+
+def timer(name: str, **attrs):
+    """Para etapas intercaladas num laço (ex.: normalização dentro da leitura do cursor)."""
+    if not ENABLED:
+        return _NOOP
+    return _Timer(name, attrs)
+
+
+def count(name: str, value: float = 1) -> None:
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def records() -> List[Dict[str, Any]]:
+    with _lock:
+        return list(_records)
+
+
+def summary() -> Dict[str, Any]:
+    with _lock:
+        spans = {
+            k: {"count": int(v["count"]), "sum_s": round(v["sum_s"], 6), "max_s": round(v["max_s"], 6),
+                "avg_s": round(v["sum_s"] / v["count"], 6) if v["count"] else 0.0}
+            for k, v in _spans.items()
+        }
+        return {"spans": spans, "counters": dict(_counters)}
+
+
+def export_json(path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**summary(), "records": records()}, f, ensure_ascii=False, indent=2, default=str)
+
+
+def reset() -> None:
+    with _lock:
+        _records.clear()
+        _spans.clear()
+        _counters.clear()
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text() -> str:
+    """Agregados no formato de exposição texto do Prometheus (inclui http_client, se carregado)."""
+    s = summary()
+    lines = [
+        "# TYPE vuln_span_seconds_total counter",
+        "# TYPE vuln_span_calls_total counter",
+        "# TYPE vuln_span_seconds_max gauge",
+    ]
+    for name, v in sorted(s["spans"].items()):
+        lbl = f'{{span="{name}"}}'
+        lines.append(f"vuln_span_seconds_total{lbl} {v['sum_s']}")
+        lines.append(f"vuln_span_calls_total{lbl} {v['count']}")
+        lines.append(f"vuln_span_seconds_max{lbl} {v['max_s']}")
+    for name, v in sorted(s["counters"].items()):
+        lines.append(f"# TYPE vuln_{_metric_name(name)}_total counter")
+        lines.append(f"vuln_{_metric_name(name)}_total {v}")
+    http = sys.modules.get("http_client")
+    if http is not None:
+        lines += [
+            "# TYPE vuln_http_requests_total counter",
+            "# TYPE vuln_http_retries_total counter",
+            "# TYPE vuln_http_latency_seconds_total counter",
+        ]
+        for ep, m in sorted(http.metrics().items()):
+            if ep.startswith("_"):
+                continue
+            for status, n in sorted(m["status"].items()):
+                lines.append(f'vuln_http_requests_total{{endpoint="{ep}",status="{status}"}} {n}')
+            lines.append(f'vuln_http_retries_total{{endpoint="{ep}"}} {m["retries"]}')
+            lines.append(f'vuln_http_latency_seconds_total{{endpoint="{ep}"}} {round(m["latency_sum_s"], 6)}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics em uma thread daemon; liga a instrumentação."""
+    enable(True)
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,5 +1,19 @@
-LM_STUDIO_URL = "http://localhost:1234/v1/chat/completions"
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+import http_client
+
+LM_STUDIO_URL = os.environ.get("LM_STUDIO_URL", "http://localhost:1234/v1/chat/completions")
 LM_MODEL_ID = "llama-3-8b-gpt-4o-ru1.0"
+# requisições simultâneas que o servidor local atende (parallel slots do LM Studio)
+LM_SLOTS = int(os.environ.get("LM_SLOTS", "4"))
+# incremente ao mudar SYSTEM_PROMPT ou os parâmetros de geração (invalida o llm_cache)
+PROMPT_VERSION = "1"
 SYSTEM_PROMPT = (
     "Voce é um PO senior da compania, você recebe um objeto JSON e deve gerar APENAS um JSON com as chaves 'titulo' e 'descricao' para abrir um card no Jira. "
     "Regras: não explique causas técnicas; se houver nulos, use o que existir (inclua name/cve_id no título se ajudar); "
@@ -19,10 +33,20 @@ def gen_title_desc(obj: dict) -> tuple[str, str]:
         "max_tokens": 256,
         "stream": False
     }
-    resp = requests.post(LM_STUDIO_URL, headers={"Content-Type": "application/json"}, json=payload, timeout=60)
+    resp = http_client.request(
+        "POST", LM_STUDIO_URL,
+        endpoint="llm.chat",
+        timeout=(http_client.HTTP_CONNECT_TIMEOUT, 60),
+        headers={"Content-Type": "application/json"},
+        json=payload,
+    )
     resp.raise_for_status()
     data = resp.json()
     content = data["choices"][0]["message"]["content"]
+    return parse_title_desc(content)
+
+
+def parse_title_desc(content: str) -> tuple[str, str]:
     s, e = content.find("{"), content.rfind("}")
     raw = content[s:e+1] if s != -1 and e != -1 else "{\"titulo\":\"\",\"descricao\":\"\"}"
     try:
@@ -34,21 +58,42 @@ def gen_title_desc(obj: dict) -> tuple[str, str]:
     return titulo, descricao
 
 
-
-import json
-import sys
-import requests
-from requests.auth import HTTPBasicAuth
-
 def resolve_issue_type(project_key: str, desired: str) -> str:
     return desired
 
-JIRA_URL = "https://hackathon-do-bem.atlassian.net"
-JIRA_EMAIL = "tr19496@gmail.com"
-JIRA_TOKEN = "ATATT3xFfGF0GRmD59MnyUcv-5i0H7m3jQAxT_5iBZVKweIGIPsetu6Q_nqtHeEfz71Dsf0iHDVRZ6o1dIy-tLCdGAopdwpA_YQLMUkpLqMXdMsoL-4NoQ-RUZULuijamMa_vS7JKHPRxjqCcVoyKNdDk3isUMiZE881dW17fQpG7Hoqpo_1ytM=AFE61DBC"
+JIRA_URL = os.environ.get("JIRA_URL", "https://hackathon-do-bem.atlassian.net")
+# credenciais só pelo ambiente (token de API do Atlassian); sem elas as chamadas falham em _auth()
+JIRA_EMAIL = os.environ.get("JIRA_EMAIL")
+JIRA_TOKEN = os.environ.get("JIRA_TOKEN")
+# limite do endpoint /issue/bulk do Jira Cloud
+JIRA_BULK_MAX = 50
 
-def create_issue(project_key, summary, description, issue_type="Task"):
-    adf_description = {
+_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+# criação não é idempotente: só repete quando o Jira recusou antes de processar
+_CREATE_RETRY_STATUSES = (429, 503)
+
+
+def _auth() -> HTTPBasicAuth:
+    if not JIRA_EMAIL or not JIRA_TOKEN:
+        raise RuntimeError("JIRA_EMAIL e JIRA_TOKEN precisam estar definidos no ambiente para chamar o Jira")
+    return HTTPBasicAuth(JIRA_EMAIL, JIRA_TOKEN)
+
+
+def _jira(method: str, path: str, *, endpoint: str, timeout: float = 30, **kwargs) -> requests.Response:
+    """Chamada autenticada ao Jira pelo cliente HTTP compartilhado."""
+    return http_client.request(
+        method,
+        f"{JIRA_URL.rstrip('/')}{path}",
+        endpoint=endpoint,
+        timeout=(http_client.HTTP_CONNECT_TIMEOUT, timeout),
+        auth=_auth(),
+        headers=_HEADERS,
+        **kwargs,
+    )
+
+
+def _adf(description: str) -> Dict[str, Any]:
+    return {
         "type": "doc",
         "version": 1,
         "content": [
@@ -60,25 +105,84 @@ def create_issue(project_key, summary, description, issue_type="Task"):
             }
         ]
     }
-    r = requests.post(
-        f"{JIRA_URL.rstrip('/')}/rest/api/3/issue",
-        auth=HTTPBasicAuth(JIRA_EMAIL, JIRA_TOKEN),
-        headers={"Content-Type": "application/json", "Accept": "application/json"},
-        json={
-            "fields": {
-                "project": {"key": project_key},
-                "summary": summary,
-                "description": adf_description,
-                "issuetype": {"name": issue_type}
-            }
-        },
-        timeout=30,
+
+
+def _issue_fields(project_key: str, summary: str, description: str, issue_type: str) -> Dict[str, Any]:
+    return {
+        "project": {"key": project_key},
+        "summary": summary,
+        "description": _adf(description),
+        "issuetype": {"name": issue_type}
+    }
+
+
+def create_issue(project_key, summary, description, issue_type="Task"):
+    r = _jira(
+        "POST", "/rest/api/3/issue",
+        endpoint="jira.issue.create",
+        json={"fields": _issue_fields(project_key, summary, description, issue_type)},
+        retry_statuses=_CREATE_RETRY_STATUSES,
     )
     if r.status_code not in (200, 201):
         print(r.text, file=sys.stderr)
         r.raise_for_status()
     return r.json()
 
+
+def update_issue(issue_key: str, summary: str, description: str) -> None:
+    r = _jira(
+        "PUT", f"/rest/api/3/issue/{issue_key}",
+        endpoint="jira.issue.update",
+        json={"fields": {"summary": summary, "description": _adf(description)}},
+    )
+    if r.status_code not in (200, 204):
+        print(r.text, file=sys.stderr)
+        r.raise_for_status()
+
+
+def create_issues_bulk(issues: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Cria várias issues via /rest/api/3/issue/bulk, em blocos de JIRA_BULK_MAX.
+    Cada item de `issues` tem project_key, summary, description e issue_type.
+    Retorna um resultado por item, na mesma ordem: {'jira': {...}} ou {'error': ...}.
+    """
+    out: List[Dict[str, Any]] = []
+    for start in range(0, len(issues), JIRA_BULK_MAX):
+        chunk = issues[start:start + JIRA_BULK_MAX]
+        body = {"issueUpdates": [
+            {"fields": _issue_fields(i["project_key"], i["summary"], i["description"], i.get("issue_type", "Task"))}
+            for i in chunk
+        ]}
+        try:
+            r = _jira("POST", "/rest/api/3/issue/bulk", endpoint="jira.issue.bulk", timeout=60,
+                      json=body, retry_statuses=_CREATE_RETRY_STATUSES)
+        except requests.RequestException as e:
+            out.extend({"error": str(e)} for _ in chunk)
+            continue
+        if r.status_code not in (200, 201):
+            print(r.text, file=sys.stderr)
+            try:
+                data = r.json()
+            except ValueError:
+                out.extend({"error": f"HTTP {r.status_code}"} for _ in chunk)
+                continue
+        else:
+            data = r.json()
+        # 'issues' traz apenas os criados, na ordem; falhas vêm em 'errors' pelo índice
+        failed = {}
+        for err in data.get("errors") or []:
+            idx = err.get("failedElementNumber")
+            if isinstance(idx, int):
+                failed[idx] = err.get("elementErrors") or err
+        created = iter(data.get("issues") or [])
+        for idx in range(len(chunk)):
+            if idx in failed:
+                out.append({"error": json.dumps(failed[idx], ensure_ascii=False)})
+                continue
+            issue = next(created, None)
+            out.append({"jira": issue} if issue is not None else {"error": f"HTTP {r.status_code}"})
+    return out
+
 if __name__ == "__main__":
     try:
         if not sys.stdin.isatty():
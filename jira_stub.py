@@ -0,0 +1,98 @@
+"""
+Servidor local que imita os endpoints de criação de issue do Jira
+(/rest/api/3/issue, /rest/api/3/issue/bulk e a edição via PUT), para rodar o fluxo de
+tickets sem tocar no Jira real:
+
+    python jira_stub.py --port 8089
+    JIRA_URL=http://localhost:8089 JIRA_EMAIL=stub JIRA_TOKEN=stub python ...
+
+Issues cujo summary contém "FAIL" são rejeitadas, para exercitar o
+tratamento de falhas por item.
+"""
+import argparse
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class _JiraStubHandler(BaseHTTPRequestHandler):
+    server_version = "JiraStub/1.0"
+
+    def log_message(self, fmt, *args):  # silencioso
+        pass
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _create(self, fields: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        summary = fields.get("summary") or ""
+        if not summary or "FAIL" in summary:
+            return None, {"errors": {"summary": "rejected by stub"}}
+        project = (fields.get("project") or {}).get("key", "STUB")
+        n = next(self.server.counter)
+        issue = {"id": str(10000 + n), "key": f"{project}-{n}", "self": f"http://stub/rest/api/3/issue/{10000 + n}"}
+        with self.server.lock:
+            self.server.issues.append({"issue": issue, "fields": fields})
+        return issue, None
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"errorMessages": ["invalid json"]})
+        self.server.requests += 1
+        if self.path == "/rest/api/3/issue":
+            issue, err = self._create(body.get("fields") or {})
+            return self._send(201, issue) if issue else self._send(400, err)
+        if self.path == "/rest/api/3/issue/bulk":
+            issues: List[Dict[str, Any]] = []
+            errors: List[Dict[str, Any]] = []
+            for idx, upd in enumerate(body.get("issueUpdates") or []):
+                issue, err = self._create(upd.get("fields") or {})
+                if issue:
+                    issues.append(issue)
+                else:
+                    errors.append({"status": 400, "elementErrors": err, "failedElementNumber": idx})
+            return self._send(201, {"issues": issues, "errors": errors})
+        self._send(404, {"errorMessages": [f"unknown path {self.path}"]})
+
+    def do_PUT(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        self.server.requests += 1
+        if self.path.startswith("/rest/api/3/issue/"):
+            self.send_response(204)
+            self.end_headers()
+            return
+        self._send(404, {"errorMessages": [f"unknown path {self.path}"]})
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Sobe o stub em uma thread; devolve (server, base_url). Encerre com server.shutdown()."""
+    server = ThreadingHTTPServer((host, port), _JiraStubHandler)
+    server.counter = itertools.count(1)
+    server.lock = threading.Lock()
+    server.issues = []
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8089)
+    args = ap.parse_args()
+    srv, url = start_stub(port=args.port)
+    print(f"Jira stub em {url} (Ctrl+C para sair)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,198 @@
+"""
+Fila de recálculo em background.
+
+A UI só enfileira (submit_score_job) e consulta o status (get_job); o
+worker (`python jobs.py`) consome a fila e roda batch_score_and_update,
+gravando o progresso no próprio documento do job.
+
+Enquanto roda, o worker renova heartbeat_at a cada JOB_HEARTBEAT_S. Um job
+RUNNING sem heartbeat há mais de JOB_STALE_AFTER_S (worker morto) é
+marcado como FAILED e deixa de ser o job ativo da sua chave; isso é
+verificado a cada claim e a cada submit.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db import get_collection, vulnerabilities_collection
+
+JOBS_COLLECTION = "score_jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+JOB_HEARTBEAT_S = float(os.environ.get("JOB_HEARTBEAT_S", "30"))
+JOB_STALE_AFTER_S = float(os.environ.get("JOB_STALE_AFTER_S", "600"))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _jobs(collection=None):
+    coll = collection if collection is not None else vulnerabilities_collection
+    return coll.database[JOBS_COLLECTION]
+
+
+def ensure_indexes(collection=None) -> None:
+    jobs = _jobs(collection)
+    # no máximo um job ativo (queued/running) por combinação de pesos
+    jobs.create_index(
+        [("key", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"active": True},
+        name="uniq_active_key",
+    )
+    jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    jobs.create_index([("status", ASCENDING), ("heartbeat_at", ASCENDING)])
+
+
+def weights_key(weights: Dict[str, float], collection_name: str) -> str:
+    norm = {str(k): round(float(v), 6) for k, v in (weights or {}).items()}
+    raw = json.dumps({"collection": collection_name, "weights": norm}, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def submit_score_job(weights: Dict[str, float], *, collection=None) -> Dict[str, Any]:
+    """
+    Enfileira um re-score. Se já existe um job ativo com os mesmos pesos,
+    devolve esse job em vez de criar outro.
+    """
+    coll = collection if collection is not None else vulnerabilities_collection
+    jobs = _jobs(coll)
+    ensure_indexes(coll)
+    key = weights_key(weights, coll.name)
+    # um job preso num worker morto não pode absorver os submits seguintes
+    reap_stale_jobs(collection=coll)
+    for _ in range(2):
+        try:
+            return jobs.find_one_and_update(
+                {"key": key, "active": True},
+                # key/active vêm do filtro no insert
+                {"$setOnInsert": {
+                    "status": QUEUED,
+                    "collection": coll.name,
+                    "weights": weights,
+                    "progress": {"stage": QUEUED, "processed": 0, "written": 0, "total": None},
+                    "created_at": _now(),
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # corrida com outro submit idêntico: o job dele vale
+            continue
+    return jobs.find_one({"key": key, "active": True})
+
+
+def get_job(job_id: Any, *, collection=None) -> Optional[Dict[str, Any]]:
+    oid = job_id if isinstance(job_id, ObjectId) else ObjectId(str(job_id))
+    return _jobs(collection).find_one({"_id": oid})
+
+
+def reap_stale_jobs(*, collection=None, stale_after_s: float = JOB_STALE_AFTER_S) -> int:
+    """Falha os jobs RUNNING sem heartbeat há mais de `stale_after_s` e libera a chave (active)."""
+    now = _now()
+    cutoff = now - timedelta(seconds=stale_after_s)
+    res = _jobs(collection).update_many(
+        {"status": RUNNING, "$or": [
+            {"heartbeat_at": {"$lt": cutoff}},
+            # jobs reclamados antes do heartbeat existir
+            {"heartbeat_at": {"$exists": False}, "started_at": {"$lt": cutoff}},
+        ]},
+        {"$set": {"status": FAILED, "error": "worker sem heartbeat (job abandonado)", "finished_at": now},
+         "$unset": {"active": ""}},
+    )
+    return res.modified_count
+
+
+def claim_next_job(*, collection=None, worker_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    reap_stale_jobs(collection=collection)
+    now = _now()
+    return _jobs(collection).find_one_and_update(
+        {"status": QUEUED},
+        {"$set": {"status": RUNNING, "started_at": now, "heartbeat_at": now, "worker": worker_id}},
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def run_job(job: Dict[str, Any], *, collection=None) -> Dict[str, Any]:
+    from calculator import batch_score_and_update
+
+    jobs = _jobs(collection)
+    name = job.get("collection")
+    if collection is not None:
+        # mesmo banco da collection recebida (testes, bancos alternativos)
+        target = collection if name in (None, collection.name) else collection.database[name]
+    else:
+        target = get_collection(name or "vulnerability")
+
+    def _progress(p: Dict[str, Any]) -> None:
+        jobs.update_one({"_id": job["_id"]}, {"$set": {"progress": p, "heartbeat_at": _now()}})
+
+    # heartbeat independente do progresso: fases longas sem lote (cortes, rollups) não parecem worker morto
+    stop = threading.Event()
+
+    def _beat() -> None:
+        while not stop.wait(JOB_HEARTBEAT_S):
+            jobs.update_one({"_id": job["_id"], "status": RUNNING}, {"$set": {"heartbeat_at": _now()}})
+
+    beat = threading.Thread(target=_beat, name=f"job-heartbeat-{job['_id']}", daemon=True)
+    beat.start()
+    try:
+        summary = batch_score_and_update(collection=target, weights=job["weights"], progress=_progress)
+    except Exception as e:
+        jobs.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": FAILED, "error": str(e), "finished_at": _now()}, "$unset": {"active": ""}},
+        )
+        return {"_id": str(job["_id"]), "status": FAILED, "error": str(e)}
+    finally:
+        stop.set()
+    jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": DONE, "result": summary, "finished_at": _now()}, "$unset": {"active": ""}},
+    )
+    return {"_id": str(job["_id"]), "status": DONE, "result": summary}
+
+
+def run_worker(*, poll_interval: float = 1.0, once: bool = False, collection=None) -> None:
+    ensure_indexes(collection)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"Worker {worker_id} aguardando jobs em '{JOBS_COLLECTION}'...")
+    while True:
+        job = claim_next_job(collection=collection, worker_id=worker_id)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        print(f"Job {job['_id']} iniciado (pesos={job.get('weights')})")
+        out = run_job(job, collection=collection)
+        print(f"Job {job['_id']} finalizado: {out.get('status')}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Worker da fila de recálculo")
+    ap.add_argument("--once", action="store_true", help="processa a fila e sai")
+    ap.add_argument("--poll-interval", type=float, default=1.0)
+    ap.add_argument("--metrics-port", type=int, help="serve /metrics (Prometheus) nesta porta")
+    args = ap.parse_args()
+    if args.metrics_port:
+        import instrumentation
+        instrumentation.start_metrics_server(args.metrics_port)
+    run_worker(poll_interval=args.poll_interval, once=args.once)
@@ -0,0 +1,223 @@
+"""
+Ciclo de vida dos findings: arquivamento dos que não representam mais
+risco aberto.
+
+Vão para `vulnerability_archive` (com archived_at e archive_reason):
+
+  - resolved:   status em RESOLVED_STATUSES ou com resolved_at;
+  - ok:         tag/ambiente exatamente "OK" (a triagem já os suprime;
+                aqui a regra é estrita porque o arquivo expira);
+  - superseded: mesma impressão digital do ticket_ledger (CVE + nome +
+                ativo) de um finding mais novo — re-ingestões do mesmo
+                problema; fica o mais recente. Só com ativo conhecido
+                (ticket_ledger.asset_key): sem ele não há como saber se é
+                o mesmo host.
+
+A varredura lê só uma projeção pequena; a movimentação é em lotes
+(cópia para o arquivo, com a parte fria de vulnerability_details, antes da
+remoção). Rollups, feature store, details e order_stats acompanham. O
+arquivo expira por índice TTL em archived_at (ARCHIVE_RETENTION_DAYS;
+0 mantém para sempre).
+
+    python main.py archive [--dry-run] [--reasons resolved,ok,superseded]
+"""
+from __future__ import annotations
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReplaceOne
+
+from details import attach_details, delete_details, save_details, split_doc
+from rollups import RollupDelta
+from score_meta import resolve_scores, score_fields
+from ticket_ledger import asset_key, fingerprint
+import instrumentation
+
+ARCHIVE_COLLECTION = "vulnerability_archive"
+ARCHIVE_RETENTION_DAYS = int(os.environ.get("ARCHIVE_RETENTION_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "1000"))
+RESOLVED_STATUSES = ("resolved", "fixed", "closed", "done", "false_positive")
+REASONS = ("resolved", "ok", "superseded")
+TTL_INDEX = "archived_at_ttl"
+
+SCAN_PROJECTION = {"_id": 1, "name": 1, "cve_id": 1, "environments": 1, "tags": 1, "asset": 1,
+                   "status": 1, "resolved_at": 1}
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def archive_collection(collection=None):
+    coll = collection if collection is not None else _default_collection()
+    return coll.database[ARCHIVE_COLLECTION]
+
+
+def ensure_archive_indexes(collection=None, retention_days: int = ARCHIVE_RETENTION_DAYS) -> None:
+    """Índice TTL em archived_at; recriado se a retenção mudou (0 = sem expiração)."""
+    arch = archive_collection(collection)
+    info = arch.index_information().get(TTL_INDEX)
+    ttl = int(retention_days) * 86400 if retention_days and retention_days > 0 else None
+    if info is not None and info.get("expireAfterSeconds") != ttl:
+        arch.drop_index(TTL_INDEX)
+        info = None
+    if info is None:
+        kwargs = {"expireAfterSeconds": ttl} if ttl is not None else {}
+        arch.create_index([("archived_at", ASCENDING)], name=TTL_INDEX, **kwargs)
+    arch.create_index([("archive_reason", ASCENDING)])
+
+
+def is_ok_tagged(doc: Dict[str, Any]) -> bool:
+    for key in ("tags", "environments"):
+        arr = doc.get(key) or []
+        if isinstance(arr, str):
+            arr = [arr]
+        if not isinstance(arr, list):
+            continue
+        for t in arr:
+            v = (t.get("value") or t.get("status") or t.get("name")) if isinstance(t, dict) else t
+            if isinstance(v, str) and v.strip().upper() == "OK":
+                return True
+    return False
+
+
+def is_resolved(doc: Dict[str, Any]) -> bool:
+    status = doc.get("status")
+    if isinstance(status, str) and status.strip().lower() in RESOLVED_STATUSES:
+        return True
+    return doc.get("resolved_at") is not None
+
+
+def _newer(a: Tuple[int, Any], b: Tuple[int, Any]) -> bool:
+    """(posição na varredura, _id): ObjectIds comparam pelo instante de criação; senão vale a ordem lida."""
+    if isinstance(a[1], ObjectId) and isinstance(b[1], ObjectId):
+        return a[1] > b[1]
+    return a[0] > b[0]
+
+
+def plan_archive(collection=None, reasons: Iterable[str] = REASONS) -> Dict[Any, str]:
+    """_id -> motivo, numa varredura com projeção pequena."""
+    coll = collection if collection is not None else _default_collection()
+    reasons = set(reasons)
+    unknown = reasons - set(REASONS)
+    if unknown:
+        raise ValueError(f"motivos desconhecidos: {sorted(unknown)}")
+    out: Dict[Any, str] = {}
+    latest: Dict[str, Tuple[int, Any]] = {}
+    scanned = 0
+    with instrumentation.span("archive.plan") as sp:
+        cursor = coll.find({}, SCAN_PROJECTION, batch_size=5000)
+        try:
+            for pos, doc in enumerate(cursor):
+                scanned += 1
+                _id = doc["_id"]
+                if "resolved" in reasons and is_resolved(doc):
+                    out[_id] = "resolved"
+                elif "ok" in reasons and is_ok_tagged(doc):
+                    out[_id] = "ok"
+                elif "superseded" in reasons and asset_key(doc):
+                    fp = fingerprint(doc)
+                    cur = (pos, _id)
+                    prev = latest.get(fp)
+                    if prev is None:
+                        latest[fp] = cur
+                    elif _newer(cur, prev):
+                        out[prev[1]] = "superseded"
+                        latest[fp] = cur
+                    else:
+                        out[_id] = "superseded"
+        finally:
+            cursor.close()
+        sp.set(scanned=scanned, selected=len(out))
+    return out
+
+
+def archive(
+    collection=None,
+    *,
+    reasons: Iterable[str] = REASONS,
+    dry_run: bool = False,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    retention_days: int = ARCHIVE_RETENTION_DAYS,
+) -> Dict[str, Any]:
+    """Move os findings selecionados por plan_archive para o arquivo."""
+    import feature_store
+    import order_stats
+
+    coll = collection if collection is not None else _default_collection()
+    selected = plan_archive(coll, reasons)
+    counts: Dict[str, int] = {}
+    for r in selected.values():
+        counts[r] = counts.get(r, 0) + 1
+    if dry_run or not selected:
+        return {"selected": len(selected), "by_reason": counts, "archived": 0}
+
+    ensure_archive_indexes(coll, retention_days)
+    arch = archive_collection(coll)
+    fields = score_fields(coll)
+    delta = RollupDelta(coll)
+    store = feature_store.open_store(coll)
+    now = datetime.now(timezone.utc)
+    ids = list(selected)
+    archived = 0
+    with instrumentation.span("archive.move") as sp:
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            docs = list(coll.find({"_id": {"$in": chunk}}))
+            if not docs:
+                continue
+            attach_details(docs, coll, fields=("description", "raw"))
+            # cópia antes da remoção: uma falha no meio deixa no máximo duplicado, nunca perdido
+            arch.bulk_write(
+                [ReplaceOne({"_id": d["_id"]}, {**d, "archived_at": now, "archive_reason": selected[d["_id"]]},
+                            upsert=True) for d in docs],
+                ordered=False,
+            )
+            moved = [d["_id"] for d in docs]
+            coll.delete_many({"_id": {"$in": moved}})
+            delete_details(moved, coll)
+            for d in docs:
+                delta.remove(resolve_scores(split_doc(d)[0], fields))
+            if store.exists:
+                store.delete(moved)
+            archived += len(moved)
+        delta.flush()
+        sp.set(archived=archived)
+    order_stats.invalidate(coll)
+    return {"selected": len(selected), "by_reason": counts, "archived": archived}
+
+
+def restore(ids: Iterable[Any], collection=None) -> Dict[str, int]:
+    """
+    Devolve findings arquivados à collection ativa (parte fria de volta para
+    details). Voltam sem score da geração corrente: o próximo re-score os inclui.
+    """
+    import feature_store
+    import order_stats
+
+    coll = collection if collection is not None else _default_collection()
+    arch = archive_collection(coll)
+    wanted = list(ids)
+    docs = list(arch.find({"_id": {"$in": wanted}}))
+    if not docs:
+        return {"restored": 0}
+    delta = RollupDelta(coll)
+    hot: List[Dict[str, Any]] = []
+    for d in docs:
+        d.pop("archived_at", None)
+        d.pop("archive_reason", None)
+        h, _ = split_doc(d)
+        hot.append(h)
+    coll.bulk_write([ReplaceOne({"_id": h["_id"]}, h, upsert=True) for h in hot], ordered=False)
+    save_details(coll, docs)
+    arch.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+    fields = score_fields(coll)
+    for h in hot:
+        delta.add(resolve_scores(dict(h), fields))
+    delta.flush()
+    feature_store.sync(coll, hot)
+    order_stats.invalidate(coll)
+    return {"restored": len(docs)}
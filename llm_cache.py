@@ -0,0 +1,194 @@
+"""
+Cache endereçado por conteúdo para gen_title_desc.
+
+Chave = sha256(payload normalizado de _extract_for_llm + PROMPT_VERSION + modelo).
+Duas camadas: LRU em memória (com TTL) e collection `llm_cache` no Mongo
+(com índice TTL), de modo que findings idênticos nunca geram texto duas vezes.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ASCENDING
+
+from jira_api import gen_title_desc, LM_MODEL_ID, PROMPT_VERSION
+
+CACHE_COLLECTION = "llm_cache"
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+_WS = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_lru: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+_stats = {"memory_hits": 0, "store_hits": 0, "misses": 0, "fallbacks": 0, "evictions": 0}
+_indexed = False
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def _store(collection=None):
+    coll = collection if collection is not None else _default_collection()
+    return coll.database[CACHE_COLLECTION]
+
+
+def ensure_indexes(collection=None) -> None:
+    global _indexed
+    if _indexed:
+        return
+    _store(collection).create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=LLM_CACHE_TTL_SECONDS,
+        name="ttl_created_at",
+    )
+    _indexed = True
+
+
+def _normalize(v: Any) -> Any:
+    if isinstance(v, str):
+        return _WS.sub(" ", v).strip()
+    if isinstance(v, dict):
+        return {str(k): _normalize(x) for k, x in v.items() if x is not None}
+    if isinstance(v, (list, tuple)):
+        items = [_normalize(x) for x in v if x is not None]
+        if all(isinstance(x, (str, int, float)) for x in items):
+            return sorted(items, key=lambda x: (str(type(x)), x))
+        return items
+    if isinstance(v, float):
+        return round(v, 6)
+    return v
+
+
+def cache_key(obj: Dict[str, Any], *, model: str = LM_MODEL_ID, prompt_version: str = PROMPT_VERSION) -> str:
+    raw = json.dumps(
+        {"payload": _normalize(obj), "model": model, "prompt_version": prompt_version},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def template_title_desc(obj: Dict[str, Any]) -> Tuple[str, str]:
+    """Texto determinístico usado quando o LLM não responde."""
+    name = obj.get("name") or "componente"
+    cve = obj.get("cve_id")
+    cve_txt = ", ".join(cve) if isinstance(cve, list) else cve
+    titulo = f"Corrigir vulnerabilidade em {name}" + (f" ({cve_txt})" if cve_txt else "")
+    partes = []
+    if obj.get("description"):
+        partes.append(str(obj["description"]).strip()[:500])
+    detalhes = [f"{k}: {obj[k]}" for k in ("cvss", "epss", "companyCriticality", "family", "date") if obj.get(k) is not None]
+    if detalhes:
+        partes.append("; ".join(detalhes))
+    partes.append(f"Atualize {name} para a versão corrigida ou aplique o patch do fornecedor.")
+    return titulo, "\n".join(partes)
+
+
+def _lru_get(key: str) -> Optional[Tuple[str, str]]:
+    with _lock:
+        hit = _lru.get(key)
+        if hit is None:
+            return None
+        expires, titulo, descricao = hit
+        if expires < time.monotonic():
+            del _lru[key]
+            return None
+        _lru.move_to_end(key)
+        return titulo, descricao
+
+
+def _lru_put(key: str, titulo: str, descricao: str) -> None:
+    with _lock:
+        _lru[key] = (time.monotonic() + LLM_CACHE_TTL_SECONDS, titulo, descricao)
+        _lru.move_to_end(key)
+        while len(_lru) > LLM_CACHE_MAX_ENTRIES:
+            _lru.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+
+def get_cached(obj: Dict[str, Any], *, collection=None) -> Optional[Tuple[str, str]]:
+    """Consulta as duas camadas; None (e conta um miss) se o texto não existe."""
+    key = cache_key(obj)
+    hit = _lru_get(key)
+    if hit is not None:
+        _count("memory_hits")
+        return hit
+
+    doc = _store(collection).find_one({"_id": key})
+    if doc is not None:
+        _count("store_hits")
+        _lru_put(key, doc["titulo"], doc["descricao"])
+        return doc["titulo"], doc["descricao"]
+
+    _count("misses")
+    return None
+
+
+def put_cached(obj: Dict[str, Any], titulo: str, descricao: str, *, collection=None) -> None:
+    key = cache_key(obj)
+    ensure_indexes(collection)
+    _store(collection).update_one(
+        {"_id": key},
+        {"$set": {
+            "titulo": titulo,
+            "descricao": descricao,
+            "model": LM_MODEL_ID,
+            "prompt_version": PROMPT_VERSION,
+            "created_at": datetime.now(timezone.utc),
+        }},
+        upsert=True,
+    )
+    _lru_put(key, titulo, descricao)
+
+
+def fallback_text(obj: Dict[str, Any]) -> Tuple[str, str]:
+    _count("fallbacks")
+    return template_title_desc(obj)
+
+
+def cached_gen_title_desc(obj: Dict[str, Any], *, fallback: bool = False, collection=None) -> Tuple[str, str]:
+    """
+    Igual a gen_title_desc, mas consulta o cache antes. Com fallback=True,
+    falhas do LLM viram o texto de template_title_desc (que não é cacheado).
+    """
+    hit = get_cached(obj, collection=collection)
+    if hit is not None:
+        return hit
+    try:
+        titulo, descricao = gen_title_desc(obj)
+    except Exception:
+        if not fallback:
+            raise
+        return fallback_text(obj)
+    put_cached(obj, titulo, descricao, collection=collection)
+    return titulo, descricao
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        out = dict(_stats)
+        out["memory_entries"] = len(_lru)
+    lookups = out["memory_hits"] + out["store_hits"] + out["misses"]
+    out["hit_ratio"] = round((out["memory_hits"] + out["store_hits"]) / lookups, 4) if lookups else 0.0
+    return out
+
+
+def clear_memory() -> None:
+    with _lock:
+        _lru.clear()
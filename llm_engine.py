@@ -0,0 +1,202 @@
+"""
+Geração de título/descrição em lote, com streaming.
+
+Vários findings vão em um único prompt (resposta: array JSON com um objeto
+por id) e até LM_SLOTS prompts rodam em paralelo. A resposta chega por SSE
+e um parser incremental entrega cada objeto assim que o '}' dele fecha,
+para que os tickets comecem a ser criados antes do lote terminar.
+"""
+from __future__ import annotations
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import http_client
+from jira_api import LM_STUDIO_URL, LM_MODEL_ID, LM_SLOTS, SYSTEM_PROMPT, gen_title_desc
+
+BATCH_SYSTEM_PROMPT = (
+    SYSTEM_PROMPT
+    + " Você receberá uma LISTA de objetos, cada um com a chave 'id'. Responda APENAS com um array JSON "
+    "contendo um objeto por item, no formato {\"id\": ..., \"titulo\": ..., \"descricao\": ...}, na mesma ordem."
+)
+TOKENS_PER_ITEM = 256
+
+
+class JSONObjectStream:
+    """
+    Parser incremental: recebe pedaços de texto (feed) e devolve os objetos
+    JSON de primeiro nível do array (ou soltos) que já fecharam.
+    """
+
+    def __init__(self):
+        self._buf: List[str] = []
+        self._depth = 0
+        self._base = 0  # 1 depois de abrir o '[' externo
+        self._in_str = False
+        self._esc = False
+        self._capturing = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for ch in chunk:
+            if self._capturing:
+                self._buf.append(ch)
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"':
+                self._in_str = self._capturing
+            elif ch == "[" and self._depth == 0 and not self._capturing:
+                self._base = 1
+                self._depth = 1
+            elif ch == "{":
+                if self._depth == self._base and not self._capturing:
+                    self._capturing = True
+                    self._buf = ["{"]
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._capturing and self._depth == self._base:
+                    self._capturing = False
+                    try:
+                        obj = json.loads("".join(self._buf))
+                    except ValueError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        out.append(obj)
+                    self._buf = []
+            elif ch == "]" and self._depth == 1 and self._base == 1 and not self._capturing:
+                self._depth = 0
+        return out
+
+
+def _stream_chat(messages: List[Dict[str, str]], max_tokens: int, *, timeout: float = 120) -> Iterator[str]:
+    """Chat completion com stream=True; devolve os deltas de conteúdo (SSE)."""
+    payload = {
+        "model": LM_MODEL_ID,
+        "messages": messages,
+        "temperature": 0.4,
+        "top_p": 0.9,
+        "max_tokens": max_tokens,
+        "stream": True,
+    }
+    resp = http_client.request(
+        "POST", LM_STUDIO_URL,
+        endpoint="llm.chat.stream",
+        timeout=(http_client.HTTP_CONNECT_TIMEOUT, timeout),
+        json=payload,
+        stream=True,
+    )
+    with resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            except (ValueError, KeyError, IndexError):
+                continue
+            if delta:
+                yield delta
+
+
+def _result(obj: Dict[str, Any]) -> Tuple[str, str]:
+    return obj.get("titulo") or "Melhoria", obj.get("descricao") or "Sem descrição"
+
+
+def _unwrap(objs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # alguns modelos embrulham o array: {"itens": [{...}, ...]}
+    out: List[Dict[str, Any]] = []
+    for obj in objs:
+        if "id" not in obj and "titulo" not in obj:
+            for v in obj.values():
+                if isinstance(v, list):
+                    out.extend(x for x in v if isinstance(x, dict))
+        else:
+            out.append(obj)
+    return out
+
+
+def _run_pack(pack: List[Tuple[Any, Dict[str, Any]]], emit) -> None:
+    keys = {str(i): i for i, _ in pack}
+    done = set()
+    try:
+        if len(pack) == 1:
+            key, obj = pack[0]
+            messages = [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": "Objeto recebido:\n" + json.dumps(obj, ensure_ascii=False, default=str)},
+            ]
+        else:
+            items = [{"id": str(i), **obj} for i, obj in pack]
+            messages = [
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": "Objetos recebidos:\n" + json.dumps(items, ensure_ascii=False, default=str)},
+            ]
+        parser = JSONObjectStream()
+        for delta in _stream_chat(messages, TOKENS_PER_ITEM * len(pack)):
+            for obj in _unwrap(parser.feed(delta)):
+                key = pack[0][0] if len(pack) == 1 else keys.get(str(obj.get("id")))
+                if key is None or key in done:
+                    continue
+                done.add(key)
+                emit(key, _result(obj), None)
+    except Exception as e:
+        for key, _obj in pack:
+            if key not in done:
+                done.add(key)
+                emit(key, None, f"llm: {e}")
+        return
+    # itens que o modelo pulou no array: uma chamada individual cada
+    for key, obj in pack:
+        if key in done:
+            continue
+        try:
+            emit(key, gen_title_desc(obj), None)
+        except Exception as e:
+            emit(key, None, f"llm: {e}")
+
+
+def generate_stream(
+    items: List[Tuple[Any, Dict[str, Any]]],
+    *,
+    batch_size: int = 4,
+    concurrency: int = LM_SLOTS,
+) -> Iterator[Tuple[Any, Optional[Tuple[str, str]], Optional[str]]]:
+    """
+    Gera textos para [(chave, objeto)] e devolve (chave, (titulo, descricao), erro)
+    na ordem em que ficam prontos. batch_size=1 manda um finding por prompt.
+    """
+    if not items:
+        return
+    size = max(1, int(batch_size))
+    packs = [items[i:i + size] for i in range(0, len(items), size)]
+    out: "queue.Queue" = queue.Queue()
+    remaining = len(items)
+
+    def emit(key, text, err):
+        out.put((key, text, err))
+
+    def _worker(pack):
+        _run_pack(pack, emit)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, int(concurrency)))
+    try:
+        for pack in packs:
+            pool.submit(_worker, pack)
+        # cada chave é emitida exatamente uma vez por _run_pack
+        while remaining > 0:
+            item = out.get()
+            remaining -= 1
+            yield item
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -1,45 +1,249 @@
-from db import vulnerabilities_collection
-
+import argparse
 import json
+import sys
+from typing import Any, Dict, List, Optional
 
-from calculator import batch_score_and_update, weights_to_params
+from db import vulnerabilities_collection
+from calculator import batch_score_and_update
 from calculator_helper import select_top_gravissima
+import instrumentation
 
-weights = {
+# Nada é executado no import: homePage.py importa este módulo apenas
+# pelo process_scores. O batch roda via `python main.py score`.
+DEFAULT_WEIGHTS = {
     "cve": 1,
     "epss": 2,
     "companyCriticality": 1,
     "date_norm": 1
 }
 
-summary = batch_score_and_update(
-    collection=vulnerabilities_collection,
-    weights=weights
-)
 
-# print(json.dumps(summary, ensure_ascii=False, indent=2))
+def process_scores( weights=None, store=None):
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    return batch_score_and_update(collection=vulnerabilities_collection, weights=weights, store=store)
+
 
-res = select_top_gravissima(
-    collection=vulnerabilities_collection,
-    weights=weights,
-    limit=2
-)
+def top_gravissima(weights=None, limit: int = 2, store=None) -> Dict[str, Any]:
+    res = select_top_gravissima(
+        collection=vulnerabilities_collection,
+        weights=weights or DEFAULT_WEIGHTS,
+        limit=limit,
+        store=store,
+    )
+    return {
+        "thresholds_raw": res.get("thresholds_raw"),
+        "selected": res.get("selected", [])
+    }
 
-#print(res)
 
-selected_payload = {
-    "thresholds_raw": res.get("thresholds_raw"),
-    "selected": res.get("selected", [])
-}
+def _parse_weights(raw: Optional[str]) -> Dict[str, float]:
+    if not raw:
+        return dict(DEFAULT_WEIGHTS)
+    return json.loads(raw)
 
 
-def process_scores( weights=None):
-    if weights is None:
-        weights = {
-            "cve": 1,
-            "epss": 2,
-            "companyCriticality": 1,
-            "date_norm": 1
-        }
-    return batch_score_and_update(collection=vulnerabilities_collection, weights=weights)
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Priorização de vulnerabilidades")
+    parser.add_argument("--profile", metavar="ARQUIVO",
+                        help="perfila o comando: relatório do pyinstrument (.html/.txt) se instalado, senão cProfile (.prof)")
+    parser.add_argument("--instrument", metavar="ARQUIVO",
+                        help="liga os spans/contadores e grava o resumo em JSON ao final")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve /metrics (Prometheus) nesta porta enquanto o comando roda")
+    sub = parser.add_subparsers(dest="command")
+
+    p_score = sub.add_parser("score", help="recalcula base_score/priority_class de toda a collection")
+    p_score.add_argument("--weights", help="JSON com os pesos, ex.: '{\"cve\": 1, \"epss\": 2}'")
+    p_score.add_argument("--feature-store", action="store_true", help="lê as features do store local em vez do Mongo")
+
+    p_top = sub.add_parser("top", help="lista as top gravíssimas")
+    p_top.add_argument("--weights", help="JSON com os pesos")
+    p_top.add_argument("--limit", type=int, default=2)
+    p_top.add_argument("--feature-store", action="store_true", help="re-scoreia pelo store local se não houver scores persistidos")
+
+    p_triage = sub.add_parser("triage", help="seleciona os N findings de maior score (capacidade do time)")
+    p_triage.add_argument("--capacity", type=int, help="quantidade de findings que o time consegue tratar")
+    p_triage.add_argument("--ambiente", action="append", help="filtra por ambiente (pode repetir)")
+    p_triage.add_argument("--tipo", action="append", help="filtra por tipo (pode repetir)")
+    p_triage.add_argument("--start-date")
+    p_triage.add_argument("--end-date")
+    p_triage.add_argument("--include-ok", action="store_true", help="não suprime findings marcados como OK")
+    p_triage.add_argument("--teams", help="JSON (ou @arquivo) {time: {capacity, ambientes, tipos, ...}}")
+
+    p_prof = sub.add_parser("profiles", help="perfis de scoring nomeados (scores.<perfil>)")
+    prof_sub = p_prof.add_subparsers(dest="profiles_command")
+    p_pset = prof_sub.add_parser("set", help="cria/atualiza um perfil")
+    p_pset.add_argument("name")
+    p_pset.add_argument("--weights", required=True, help="JSON com os pesos")
+    p_pset.add_argument("--cut-mode", choices=["kmeans", "quantiles"], default="kmeans")
+    p_pdel = prof_sub.add_parser("delete", help="remove um perfil e seus scores")
+    p_pdel.add_argument("name")
+    prof_sub.add_parser("list", help="lista os perfis")
+    p_pscore = prof_sub.add_parser("score", help="recalcula todos os perfis numa única leitura")
+    p_pscore.add_argument("--name", action="append", help="só estes perfis (pode repetir)")
+    p_ptop = prof_sub.add_parser("top", help="top findings de um perfil")
+    p_ptop.add_argument("name")
+    p_ptop.add_argument("--limit", type=int, default=30)
+
+    p_feat = sub.add_parser("features", help="feature store colunar local (numpy memmap)")
+    p_feat.add_argument("action", choices=["build", "info"], help="build reconstrói a partir do Mongo")
+
+    p_exp = sub.add_parser("export", help="exporta a collection scoreada em Parquet (month/priority_class)")
+    p_exp.add_argument("path")
+    p_exp.add_argument("--batch-rows", type=int, default=10000, help="linhas por record batch")
+    p_imp = sub.add_parser("import", help="restaura uma exportação Parquet")
+    p_imp.add_argument("path")
+    p_imp.add_argument("--drop", action="store_true", help="esvazia a collection antes de importar")
+
+    p_dedup = sub.add_parser("dedup", help="mescla findings duplicados entre scanners")
+    p_dedup.add_argument("--dry-run", action="store_true", help="só conta os grupos, sem alterar nada")
+    p_dedup.add_argument("--threshold", type=float, default=None, help="Jaccard mínimo das descrições (MinHash)")
+
+    p_det = sub.add_parser("details", help="campos frios (descrição, payload de origem) em vulnerability_details")
+    p_det.add_argument("action", choices=["migrate", "assets"],
+                       help="migrate: move os campos frios dos documentos existentes; "
+                            "assets: preenche `asset` a partir do documento de origem")
+    p_det.add_argument("--dry-run", action="store_true", help="só conta os documentos pendentes")
+
+    p_arch = sub.add_parser("archive", help="move resolvidos, OK e substituídos para vulnerability_archive")
+    p_arch.add_argument("--dry-run", action="store_true", help="só conta por motivo, sem mover nada")
+    p_arch.add_argument("--reasons", default=None, help="motivos separados por vírgula (resolved,ok,superseded)")
+    p_arch.add_argument("--retention-days", type=int, default=None, help="TTL do arquivo em dias (0 = sem expiração)")
+    return parser
+
+
+def _store(enabled: bool):
+    if not enabled:
+        return None
+    from feature_store import open_store
+    store = open_store(vulnerabilities_collection)
+    if not store.exists:
+        raise SystemExit("feature store não encontrado: rode `python main.py features build`")
+    return store
+
+
+def _features(args) -> Dict[str, Any]:
+    from feature_store import open_store
+    store = open_store(vulnerabilities_collection)
+    if args.action == "build":
+        return store.build(vulnerabilities_collection)
+    return {"path": store.path, "exists": store.exists, **store.meta}
+
+
+def _triage(args) -> Dict[str, Any]:
+    from triage import triage, triage_teams
+    if args.teams:
+        raw = args.teams
+        if raw.startswith("@"):
+            with open(raw[1:], encoding="utf-8") as f:
+                raw = f.read()
+        return triage_teams(json.loads(raw), suppress_ok=not args.include_ok)
+    if not args.capacity:
+        raise SystemExit("informe --capacity ou --teams")
+    return triage(
+        args.capacity,
+        ambientes=args.ambiente,
+        tipos=args.tipo,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        suppress_ok=not args.include_ok,
+    )
+
+
+def _profiles(args) -> Any:
+    import scoring_profiles as sp
+    cmd = args.profiles_command
+    if cmd == "set":
+        return sp.save_profile(args.name, json.loads(args.weights), cut_mode=args.cut_mode,
+                               collection=vulnerabilities_collection)
+    if cmd == "delete":
+        return {"deleted": sp.delete_profile(args.name, collection=vulnerabilities_collection)}
+    if cmd == "score":
+        return sp.score_profiles(collection=vulnerabilities_collection, names=args.name)
+    if cmd == "top":
+        return sp.top_for_profile(args.name, limit=args.limit, collection=vulnerabilities_collection)
+    return sp.list_profiles(collection=vulnerabilities_collection)
+
+
+def _run_profiled(fn, path: str):
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return fn()
+        finally:
+            profiler.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html() if path.endswith(".html") else profiler.output_text())
+    import cProfile
+    import pstats
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn)
+    finally:
+        prof.dump_stats(path)
+        pstats.Stats(prof, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.instrument or args.metrics_port:
+        instrumentation.enable(True)
+        if args.metrics_port:
+            instrumentation.start_metrics_server(args.metrics_port)
+    try:
+        if args.profile:
+            return _run_profiled(lambda: _run(args), args.profile)
+        return _run(args)
+    finally:
+        if args.instrument:
+            instrumentation.export_json(args.instrument)
+
+
+def _run(args) -> int:
+    if args.command == "score":
+        out = process_scores(_parse_weights(args.weights), store=_store(args.feature_store))
+    elif args.command == "top":
+        out = top_gravissima(_parse_weights(args.weights), limit=args.limit, store=_store(args.feature_store))
+    elif args.command == "triage":
+        out = _triage(args)
+    elif args.command == "profiles":
+        out = _profiles(args)
+    elif args.command == "features":
+        out = _features(args)
+    elif args.command == "export":
+        from parquet_io import export_parquet
+        out = export_parquet(args.path, collection=vulnerabilities_collection, batch_rows=args.batch_rows)
+    elif args.command == "import":
+        from parquet_io import import_parquet
+        out = import_parquet(args.path, collection=vulnerabilities_collection, drop=args.drop)
+    elif args.command == "dedup":
+        from dedup import DEDUP_THRESHOLD, dedup
+        threshold = args.threshold if args.threshold is not None else DEDUP_THRESHOLD
+        out = dedup(vulnerabilities_collection, threshold=threshold, dry_run=args.dry_run)
+    elif args.command == "details":
+        from details import backfill_assets, migrate
+        action = backfill_assets if args.action == "assets" else migrate
+        out = action(vulnerabilities_collection, dry_run=args.dry_run)
+    elif args.command == "archive":
+        from lifecycle import ARCHIVE_RETENTION_DAYS, REASONS, archive
+        reasons = [r.strip() for r in args.reasons.split(",") if r.strip()] if args.reasons else REASONS
+        retention = args.retention_days if args.retention_days is not None else ARCHIVE_RETENTION_DAYS
+        out = archive(vulnerabilities_collection, reasons=reasons, dry_run=args.dry_run, retention_days=retention)
+    else:
+        # comportamento antigo do script: re-score + top 2
+        weights = dict(DEFAULT_WEIGHTS)
+        process_scores(weights)
+        out = top_gravissima(weights, limit=2)
+    print(json.dumps(out, ensure_ascii=False, indent=2, default=str))
+    return 0
+
 
+if __name__ == "__main__":
+    sys.exit(main())
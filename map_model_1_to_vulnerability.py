@@ -1,8 +1,14 @@
 from db import vulnerabilities_collection, modelo1
-from vulnerability import Vulnerability
+from vulnerability import Vulnerability, extract_asset
+from rollups import RollupDelta
+from details import save_details, split_doc
+import feature_store
+import order_stats
 
 def map_model_1_to_vulnerability():
     cursor = modelo1.find({})
+    delta = RollupDelta(vulnerabilities_collection)
+    pending = []
     for doc in cursor:
         # Mapeia os dados do modelo 1 para a estrutura de vulnerabilidade
         vulnerability: Vulnerability = Vulnerability(
@@ -13,7 +19,24 @@ def map_model_1_to_vulnerability():
             cve_id = doc.get("vulnerability_ids"),
             environments = [],
             epss = None,
-            family = None
+            family = None,
+            asset = extract_asset(doc),
+            source = {"model": "modelo1", "id": str(doc.get("_id"))}
         )
 
-        vulnerabilities_collection.insert_one(vulnerability.__dict__)
+        # descrição e documento de origem vão para vulnerability_details
+        record = {**vulnerability.__dict__, "raw": doc}
+        hot, _ = split_doc(record)
+        vulnerabilities_collection.insert_one(hot)
+        record["_id"] = hot["_id"]
+        delta.add(hot)
+        pending.append(record)
+        if len(pending) >= 1000:
+            save_details(vulnerabilities_collection, pending)
+            feature_store.sync(vulnerabilities_collection, pending)
+            pending = []
+
+    delta.flush()
+    save_details(vulnerabilities_collection, pending)
+    feature_store.sync(vulnerabilities_collection, pending)
+    order_stats.invalidate(vulnerabilities_collection)
@@ -1,6 +1,10 @@
 from db import vulnerabilities_collection, modelo2
 from db import modelo2
-from vulnerability import Vulnerability
+from vulnerability import ASSET_SUBKEYS, Vulnerability, extract_asset, extract_cve_ids
+from rollups import RollupDelta
+from details import save_details, split_doc
+import feature_store
+import order_stats
 
 def safe_int(value, default=0):
     try:
@@ -10,6 +14,8 @@ def safe_int(value, default=0):
 
 def map_model_2_to_vulnerability():
     cursor = modelo2.find({})
+    delta = RollupDelta(vulnerabilities_collection)
+    pending = []
 
     for doc in cursor:
         vulnerability: Vulnerability = Vulnerability(
@@ -18,9 +24,27 @@ def map_model_2_to_vulnerability():
             companyCriticality = safe_int(doc.get("asset", {}).get("criticality", 0)),
             date = doc.get("definition", {}).get("name"),
             cve_id = doc.get("cve", [None])[0] if isinstance(doc.get("cve"), list) else None,
+            cve_ids = extract_cve_ids(doc.get("cve")),
             environments = doc.get("asset", {}).get("tags", []),
             epss = doc.get("definition", {}).get("epss_score"),
-            family = doc.get("definition", {}).get("family")
+            family = doc.get("definition", {}).get("family"),
+            asset = extract_asset(doc.get("asset"), ASSET_SUBKEYS),
+            source = {"model": "modelo2", "id": str(doc.get("_id"))}
         )
 
-        vulnerabilities_collection.insert_one(vulnerability.__dict__)
+        # descrição e documento de origem vão para vulnerability_details
+        record = {**vulnerability.__dict__, "raw": doc}
+        hot, _ = split_doc(record)
+        vulnerabilities_collection.insert_one(hot)
+        record["_id"] = hot["_id"]
+        delta.add(hot)
+        pending.append(record)
+        if len(pending) >= 1000:
+            save_details(vulnerabilities_collection, pending)
+            feature_store.sync(vulnerabilities_collection, pending)
+            pending = []
+
+    delta.flush()
+    save_details(vulnerabilities_collection, pending)
+    feature_store.sync(vulnerabilities_collection, pending)
+    order_stats.invalidate(vulnerabilities_collection)
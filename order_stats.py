@@ -0,0 +1,547 @@
+"""
+Estatísticas de ordem incrementais para o scoring de um finding só.
+
+O score de um finding depende da mediana e do MAD de cada campo na
+população inteira e dos cortes (k-means / quantis) sobre os scores de
+todos. Em vez de reler a collection (ou uma amostra) a cada documento,
+OrderStats mantém um multiset ordenado por campo (features 0..10) e um
+dos scores persistidos. Cada multiset é uma lista de blocos ordenados
+(array) com índices Fenwick de contagem e soma por bloco: inserção,
+remoção, k-ésimo valor e posto em O(log n); mediana e quantis saem por
+posição, o MAD por seleção sobre as distâncias à mediana em O(log² n) e
+o k-means 1D por bisect + somas prefixadas, como _kmeans_1d_thresholds.
+
+Os resultados são exatamente os do cálculo em lote (mesma mediana, MAD,
+robust-z e percentis); as médias do k-means usam somas inteiras em
+micro-unidades de score (scores são arredondados a 6 casas).
+
+O snapshot fica em `order_stats` (cabeçalho) e `order_stats_chunks` (um
+documento por bloco): só os blocos alterados são regravados. O snapshot
+vale para a versão dos scores, os pesos com que foram calculados e o mês
+de referência em que foi montado; com outros pesos a série de scores não
+serve e o chamador usa o cálculo completo (weights_match).
+Um re-score em lote ou a ingestão (invalidate) o tornam obsoleto e ele é
+remontado numa varredura na próxima consulta.
+"""
+from __future__ import annotations
+import math
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import Binary
+from pymongo import DeleteOne, ReplaceOne
+
+from calculator_helper import (
+    CLASSES,
+    ScoringPlan,
+    _get_path,
+    _kmeans_1d_thresholds,
+    clamp,
+)
+from score_meta import get_score_meta, score_fields
+import instrumentation
+
+STATS_COLLECTION = "order_stats"
+CHUNKS_COLLECTION = "order_stats_chunks"
+SCORE_SERIES = "__score__"
+# scores têm 6 casas: a série de scores guarda inteiros (somas exatas)
+SCORE_SCALE = 1_000_000
+BLOCK_SIZE = int(os.environ.get("ORDER_STATS_BLOCK", "512"))
+
+_cache: Dict[str, "OrderStats"] = {}
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+# ---- multiset ordenado ----
+
+def _fw_build(values: List[int]) -> List[int]:
+    tree = [0] + list(values)
+    for i in range(1, len(tree)):
+        j = i + (i & -i)
+        if j < len(tree):
+            tree[j] += tree[i]
+    return tree
+
+
+def _fw_add(tree: List[int], i: int, delta: int) -> None:
+    i += 1
+    while i < len(tree):
+        tree[i] += delta
+        i += i & -i
+
+
+def _fw_prefix(tree: List[int], i: int) -> int:
+    """Soma dos i primeiros blocos."""
+    s = 0
+    while i > 0:
+        s += tree[i]
+        i -= i & -i
+    return s
+
+
+class SortedMultiset:
+    """
+    Multiset ordenado em blocos de até 2*block valores. typecode 'd' (floats)
+    ou 'q' (inteiros, com somas prefixadas). Os blocos têm id estável para a
+    persistência incremental (dirty / removed).
+    """
+
+    def __init__(self, typecode: str = "d", values: Iterable = (), *, block: int = BLOCK_SIZE,
+                 blocks: Optional[List[Tuple[int, array]]] = None):
+        self.typecode = typecode
+        self.block = max(8, int(block))
+        self.dirty: set = set()
+        self.removed: set = set()
+        self._blocks: List[array] = []
+        self._ids: List[int] = []
+        if blocks is not None:
+            for bid, b in blocks:
+                self._ids.append(bid)
+                self._blocks.append(b)
+        else:
+            xs = array(typecode, values)
+            for start in range(0, len(xs), self.block):
+                self._ids.append(len(self._ids))
+                self._blocks.append(xs[start:start + self.block])
+            self.dirty.update(self._ids)
+        self._next_id = max(self._ids) + 1 if self._ids else 0
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._maxes = [b[-1] for b in self._blocks]
+        self._counts = _fw_build([len(b) for b in self._blocks])
+        self._sums = _fw_build([sum(b) for b in self._blocks]) if self.typecode == "q" else None
+        self._len = sum(len(b) for b in self._blocks)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        for b in self._blocks:
+            yield from b
+
+    def blocks(self) -> Iterator[Tuple[int, array]]:
+        return zip(self._ids, self._blocks)
+
+    def add(self, v) -> None:
+        if not self._blocks:
+            bid = self._next_id
+            self._next_id += 1
+            self._ids.append(bid)
+            self._blocks.append(array(self.typecode, [v]))
+            self.dirty.add(bid)
+            self._reindex()
+            return
+        i = bisect_left(self._maxes, v)
+        if i == len(self._blocks):
+            i -= 1
+        b = self._blocks[i]
+        b.insert(bisect_right(b, v), v)
+        self._maxes[i] = b[-1]
+        self.dirty.add(self._ids[i])
+        self._len += 1
+        if len(b) > 2 * self.block:
+            half = len(b) // 2
+            bid = self._next_id
+            self._next_id += 1
+            self._blocks[i:i + 1] = [b[:half], b[half:]]
+            self._ids.insert(i + 1, bid)
+            self.dirty.add(bid)
+            self._reindex()
+            return
+        _fw_add(self._counts, i, 1)
+        if self._sums is not None:
+            _fw_add(self._sums, i, v)
+
+    def discard(self, v) -> bool:
+        """Remove uma ocorrência de v; False se não houver."""
+        i = bisect_left(self._maxes, v)
+        if i == len(self._blocks):
+            return False
+        b = self._blocks[i]
+        j = bisect_left(b, v)
+        if j == len(b) or b[j] != v:
+            return False
+        del b[j]
+        self._len -= 1
+        if not b:
+            self.removed.add(self._ids[i])
+            self.dirty.discard(self._ids[i])
+            del self._blocks[i]
+            del self._ids[i]
+            self._reindex()
+            return True
+        self._maxes[i] = b[-1]
+        self.dirty.add(self._ids[i])
+        _fw_add(self._counts, i, -1)
+        if self._sums is not None:
+            _fw_add(self._sums, i, -v)
+        return True
+
+    def _locate(self, k: int) -> Tuple[int, int]:
+        """(bloco, posição no bloco) do k-ésimo menor valor (0-based)."""
+        pos, rem = 0, k
+        step = 1 << (len(self._blocks).bit_length())
+        while step:
+            nxt = pos + step
+            if nxt <= len(self._blocks) and self._counts[nxt] <= rem:
+                pos = nxt
+                rem -= self._counts[nxt]
+            step >>= 1
+        return pos, rem
+
+    def select(self, k: int):
+        if not 0 <= k < self._len:
+            raise IndexError(k)
+        i, j = self._locate(k)
+        return self._blocks[i][j]
+
+    def count_lt(self, v) -> int:
+        i = bisect_left(self._maxes, v)
+        return _fw_prefix(self._counts, i) + (bisect_left(self._blocks[i], v) if i < len(self._blocks) else 0)
+
+    def count_le(self, v) -> int:
+        i = bisect_right(self._maxes, v)
+        return _fw_prefix(self._counts, i) + (bisect_right(self._blocks[i], v) if i < len(self._blocks) else 0)
+
+    def prefix_sum(self, k: int) -> int:
+        """Soma dos k menores valores (só typecode 'q')."""
+        if k <= 0:
+            return 0
+        if k >= self._len:
+            return _fw_prefix(self._sums, len(self._blocks))
+        i, j = self._locate(k)
+        return _fw_prefix(self._sums, i) + sum(self._blocks[i][:j])
+
+
+# ---- estatísticas exatas (mesmas contas de _robust_z_list / _percentile) ----
+
+def percentile(ms: SortedMultiset, q: float, get: Optional[Callable[[int], float]] = None) -> float:
+    n = len(ms)
+    if not n:
+        return 0.0
+    get = get or ms.select
+    idx = clamp(q, 0.0, 1.0) * (n - 1)
+    lo_i, hi_i = int(math.floor(idx)), int(math.ceil(idx))
+    if lo_i == hi_i:
+        return get(lo_i)
+    frac = idx - lo_i
+    return get(lo_i) * (1 - frac) + get(hi_i) * frac
+
+
+def median(ms: SortedMultiset) -> float:
+    n = len(ms)
+    if n % 2:
+        return ms.select(n // 2)
+    return 0.5 * (ms.select(n // 2 - 1) + ms.select(n // 2))
+
+
+def _kth_of_two(a: Callable[[int], float], la: int, b: Callable[[int], float], lb: int, k: int) -> float:
+    """k-ésimo menor (0-based) da união de duas sequências crescentes acessadas por índice."""
+    lo, hi = max(0, k + 1 - lb), min(k + 1, la)
+    while lo <= hi:
+        i = (lo + hi) // 2
+        j = k + 1 - i
+        if i < la and j > 0 and b(j - 1) > a(i):
+            lo = i + 1
+        elif i > 0 and j < lb and a(i - 1) > b(j):
+            hi = i - 1
+        else:
+            return max(a(i - 1) if i > 0 else -math.inf, b(j - 1) if j > 0 else -math.inf)
+    raise AssertionError("seleção inconsistente")
+
+
+def mad(ms: SortedMultiset, med: Optional[float] = None) -> float:
+    """MAD exato: percentil 50 de |v - mediana|, sem materializar as distâncias."""
+    n = len(ms)
+    if not n:
+        return 1e-9
+    if med is None:
+        med = median(ms)
+    left = ms.count_le(med)
+    # distâncias crescentes à esquerda (valores <= mediana, do maior ao menor) e à direita
+    a = lambda i: med - ms.select(left - 1 - i)
+    b = lambda j: ms.select(left + j) - med
+    return percentile(ms, 0.5, get=lambda k: _kth_of_two(a, left, b, n - left, k)) or 1e-9
+
+
+def robust_z(v: float, med: float, mad_: float, cap: float = 3.0) -> float:
+    return clamp((v - med) / (1.4826 * mad_), -cap, cap)
+
+
+def _to_score(q: int) -> float:
+    return q / SCORE_SCALE
+
+
+def _from_score(s: float) -> int:
+    return int(round(float(s) * SCORE_SCALE))
+
+
+def score_count_le(ms: SortedMultiset, x: float) -> int:
+    """Quantos scores s (série inteira) têm s <= x, com a comparação feita em float como no lote."""
+    q = int(math.floor(x * SCORE_SCALE))
+    if _to_score(q + 1) <= x:
+        q += 1
+    elif _to_score(q) > x:
+        q -= 1
+    return ms.count_le(q)
+
+
+def kmeans_thresholds(ms: SortedMultiset, k: int = 4, max_iter: int = 100) -> Tuple[float, float, float]:
+    """_kmeans_1d_thresholds sobre a série de scores, sem materializar a lista."""
+    n = len(ms)
+    get = lambda i: _to_score(ms.select(i))
+    if n < k or ms.select(0) == ms.select(n - 1):
+        return (percentile(ms, 0.50, get), percentile(ms, 0.80, get), percentile(ms, 0.95, get))
+    centers = [get(int((i + 1) * n / (k + 1))) for i in range(k)]
+    for _ in range(max_iter):
+        if not all(centers[j] < centers[j + 1] for j in range(k - 1)):
+            # caso raro (centros empatados): cálculo em lote
+            return _kmeans_1d_thresholds([_to_score(q) for q in ms], k=k, max_iter=max_iter)
+        bounds = [0] + [score_count_le(ms, 0.5 * (centers[j] + centers[j + 1])) for j in range(k - 1)] + [n]
+        new_centers = [
+            (_to_score(ms.prefix_sum(bounds[i + 1]) - ms.prefix_sum(bounds[i])) / (bounds[i + 1] - bounds[i])
+             if bounds[i + 1] > bounds[i] else centers[i])
+            for i in range(k)
+        ]
+        if all(abs(a - b) < 1e-9 for a, b in zip(new_centers, centers)):
+            centers = new_centers
+            break
+        centers = new_centers
+    centers.sort()
+    return (0.5 * (centers[0] + centers[1]), 0.5 * (centers[1] + centers[2]), 0.5 * (centers[2] + centers[3]))
+
+
+# ---- estado por collection ----
+
+class OrderStats:
+    """Multisets das features (por campo) e dos scores persistidos de uma collection."""
+
+    def __init__(self, features: Dict[str, SortedMultiset], scores: SortedMultiset, header: Dict[str, Any]):
+        self.features = features
+        self.scores = scores
+        self.header = header
+        self.drift = False
+
+    @classmethod
+    def build(cls, collection, plan: ScoringPlan, fields: Dict[str, str], header: Dict[str, Any]) -> "OrderStats":
+        cols: Dict[str, array] = {f: array("d") for f in plan.fields}
+        scores = array("q")
+        proj = {"_id": 0, fields["score"]: 1, **{f: 1 for f in source_fields(plan)}}
+        with instrumentation.span("order_stats.build") as sp:
+            cursor = collection.find({}, proj, batch_size=5000)
+            try:
+                for doc in cursor:
+                    plan.append(cols, doc)
+                    s = _get_path(doc, fields["score"])
+                    if isinstance(s, (int, float)):
+                        scores.append(_from_score(s))
+            finally:
+                cursor.close()
+            sp.set(n=len(scores))
+            features = {f: SortedMultiset("d", sorted(c)) for f, c in cols.items()}
+            return cls(features, SortedMultiset("q", sorted(scores)), header)
+
+    def feature_values(self, plan: ScoringPlan, doc: Dict[str, Any]) -> Dict[str, float]:
+        return {f: plan._raw_feature(doc, f) for f in plan.fields}
+
+    def replace_doc(self, plan: ScoringPlan, old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> None:
+        """Troca as features de `old` (documento persistido, se houver) pelas de `new`."""
+        if old is not None:
+            for f, v in self.feature_values(plan, old).items():
+                if not self.features[f].discard(v):
+                    self.drift = True
+        for f, v in self.feature_values(plan, new).items():
+            self.features[f].add(v)
+
+    def replace_score(self, old: Optional[float], new: float) -> None:
+        if isinstance(old, (int, float)) and not self.scores.discard(_from_score(old)):
+            self.drift = True
+        self.scores.add(_from_score(new))
+
+    def score(self, plan: ScoringPlan, doc: Dict[str, Any]) -> float:
+        """_raw_score de `doc` contra a população atual (a mesma soma de ScoringPlan.combine)."""
+        s = 0.0
+        for f, v in self.feature_values(plan, doc).items():
+            ms = self.features[f]
+            med = median(ms)
+            s = s + robust_z(v, med, mad(ms, med)) * plan.weights[f]
+        return round(s, 6)
+
+    def thresholds(self, plan: ScoringPlan) -> Dict[str, float]:
+        n = len(self.scores)
+        if not n or self.scores.select(0) == self.scores.select(n - 1):
+            s0 = _to_score(self.scores.select(0)) if n else 0.0
+            return {"t1": s0, "t2": s0, "t3": s0}
+        if plan.cut_mode == "kmeans":
+            t1, t2, t3 = kmeans_thresholds(self.scores)
+        else:
+            get = lambda i: _to_score(self.scores.select(i))
+            t1, t2, t3 = (percentile(self.scores, q, get) for q in plan.quantile_cuts)
+        return {"t1": round(t1, 6), "t2": round(t2, 6), "t3": round(t3, 6)}
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for f, ms in self.features.items():
+            med = median(ms) if len(ms) else 0.0
+            out[f] = {"n": len(ms), "median": med, "mad": mad(ms, med)}
+        return out
+
+
+def classify(score: float, thresholds: Dict[str, float]) -> str:
+    baixa, media, alta, grav = CLASSES
+    if score <= thresholds["t1"]:
+        return baixa
+    if score <= thresholds["t2"]:
+        return media
+    return alta if score <= thresholds["t3"] else grav
+
+
+# ---- snapshot ----
+
+def source_fields(plan: ScoringPlan) -> List[str]:
+    """Campos do documento de onde saem as features de `plan`."""
+    out = ["cvss", "cve", "epss", "companyCriticality", "date"]
+    out.extend(f for f in plan.fields if f not in ("cve", "date_norm") and f not in out)
+    return out
+
+
+def _weights_key(weights: Optional[Dict[str, float]]) -> Optional[List[List[Any]]]:
+    if not weights:
+        return None
+    try:
+        validated = ScoringPlan(weights=weights).weights
+    except ValueError:
+        return None
+    return [[f, validated[f]] for f in sorted(validated)]
+
+
+def weights_match(collection, plan: ScoringPlan) -> bool:
+    """Os scores persistidos foram calculados com os pesos de `plan`?"""
+    key = _weights_key(get_score_meta(collection).get("weights"))
+    return key is not None and key == [[f, plan.weights[f]] for f in sorted(plan.weights)]
+
+
+def _series(stats: OrderStats) -> Dict[str, SortedMultiset]:
+    return {**stats.features, SCORE_SERIES: stats.scores}
+
+
+def _expected_header(collection, plan: ScoringPlan) -> Dict[str, Any]:
+    meta = get_score_meta(collection)
+    return {
+        "score_version": int(meta.get("version", 0)),
+        "score_field": score_fields(meta=meta)["score"],
+        "weights": _weights_key(meta.get("weights")),
+        "ref": [plan.ref_year, plan.ref_month],
+    }
+
+
+def _valid(header: Optional[Dict[str, Any]], expected: Dict[str, Any], plan: ScoringPlan) -> bool:
+    if not header or header.get("stale"):
+        return False
+    if any(header.get(k) != v for k, v in expected.items()):
+        return False
+    return set(plan.fields) <= set(header.get("fields") or [])
+
+
+def save(collection, stats: OrderStats) -> bool:
+    """
+    Grava os blocos alterados e o cabeçalho. O cabeçalho só avança se ninguém
+    gravou desde a leitura (seq); em conflito, ou se uma remoção não achou o
+    valor esperado, o snapshot é marcado obsoleto e remontado na próxima vez.
+    """
+    name = collection.name
+    chunks = collection.database[CHUNKS_COLLECTION]
+    ops: List[Any] = []
+    for series, ms in _series(stats).items():
+        for bid, b in ms.blocks():
+            if bid in ms.dirty:
+                ops.append(ReplaceOne(
+                    {"_id": f"{name}:{series}:{bid}"},
+                    {"stats": name, "series": series, "block": bid, "typecode": ms.typecode,
+                     "values": Binary(b.tobytes())},
+                    upsert=True,
+                ))
+        ops.extend(DeleteOne({"_id": f"{name}:{series}:{bid}"}) for bid in ms.removed)
+    if ops:
+        chunks.bulk_write(ops, ordered=False)
+    for ms in _series(stats).values():
+        ms.dirty.clear()
+        ms.removed.clear()
+    seq = int(stats.header.get("seq", 0))
+    header = {**stats.header, "seq": seq + 1, "stale": stats.drift, "n": len(stats.scores),
+              "fields": sorted(stats.features), "updated_at": datetime.now(timezone.utc)}
+    meta = collection.database[STATS_COLLECTION]
+    if seq == 0:
+        meta.replace_one({"_id": name}, header, upsert=True)
+    elif meta.replace_one({"_id": name, "seq": seq}, header).matched_count == 0:
+        invalidate(collection)
+        return False
+    stats.header = header
+    if stats.drift:
+        _cache.pop(name, None)
+    return True
+
+
+def _load(collection, header: Dict[str, Any]) -> OrderStats:
+    by_series: Dict[str, List[Tuple[int, array]]] = {}
+    typecodes: Dict[str, str] = {}
+    for c in collection.database[CHUNKS_COLLECTION].find({"stats": collection.name}):
+        b = array(c["typecode"])
+        b.frombytes(bytes(c["values"]))
+        if len(b):
+            by_series.setdefault(c["series"], []).append((int(c["block"]), b))
+            typecodes[c["series"]] = c["typecode"]
+    series: Dict[str, SortedMultiset] = {}
+    for name in list(header.get("fields") or []) + [SCORE_SERIES]:
+        # blocos são disjuntos e ordenados: (primeiro, último) recupera a ordem
+        blocks = sorted(by_series.get(name, []), key=lambda t: (t[1][0], t[1][-1]))
+        series[name] = SortedMultiset(typecodes.get(name, "q" if name == SCORE_SERIES else "d"), blocks=blocks)
+    scores = series.pop(SCORE_SERIES)
+    return OrderStats(series, scores, header)
+
+
+def get_stats(collection=None, plan: Optional[ScoringPlan] = None) -> OrderStats:
+    """
+    Estatísticas em dia para `plan` (campos e mês de referência): do cache do
+    processo, do snapshot ou de uma varredura, nessa ordem.
+    """
+    coll = collection if collection is not None else _default_collection()
+    if plan is None:
+        raise ValueError("plan é obrigatório")
+    expected = _expected_header(coll, plan)
+    header = coll.database[STATS_COLLECTION].find_one({"_id": coll.name})
+    if _valid(header, expected, plan):
+        cached = _cache.get(coll.name)
+        if cached is not None and cached.header.get("seq") == header.get("seq"):
+            return cached
+        with instrumentation.span("order_stats.load"):
+            stats = _load(coll, header)
+    else:
+        ensure_stats_indexes(coll)
+        coll.database[CHUNKS_COLLECTION].delete_many({"stats": coll.name})
+        fields = {"score": expected["score_field"]}
+        stats = OrderStats.build(coll, plan, fields, {"_id": coll.name, **expected, "seq": 0})
+        coll.database[STATS_COLLECTION].delete_one({"_id": coll.name})
+        save(coll, stats)
+    _cache[coll.name] = stats
+    return stats
+
+
+def invalidate(collection=None) -> None:
+    """Marca o snapshot como obsoleto (ingestão / enriquecimento em lote)."""
+    coll = collection if collection is not None else _default_collection()
+    coll.database[STATS_COLLECTION].update_one({"_id": coll.name}, {"$set": {"stale": True}})
+    _cache.pop(coll.name, None)
+
+
+def ensure_stats_indexes(collection=None) -> None:
+    coll = collection if collection is not None else _default_collection()
+    coll.database[CHUNKS_COLLECTION].create_index([("stats", 1), ("series", 1)])
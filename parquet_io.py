@@ -0,0 +1,371 @@
+"""
+Exportação / importação da população scoreada em Parquet.
+
+export_parquet lê a collection em streaming e grava um dataset particionado
+no estilo Hive (month=YYYY-MM/priority_class=<classe>/part-0.parquet),
+em record batches de tamanho fixo: a memória fica limitada pelos buffers
+das partições (MAX_BUFFERED_ROWS), não pelo tamanho da base. Cada linha
+leva o score/classe da geração corrente, as features normalizadas 0..10 e
+os campos do documento; o que não cabe no schema vai em `extra`
+(JSON estendido do bson), para a importação devolver os mesmos
+documentos (campos nulos e ausentes ficam indistintos).
+
+import_parquet faz o caminho inverso (restauração / seed de ambientes de
+teste): grava os documentos em lotes (descrição em vulnerability_details), coloca os scores numa geração nova
+com os pesos/cortes do manifesto e reconstrói os rollups.
+
+    python main.py export DIR [--batch-rows 10000]
+    python main.py import DIR [--drop]
+"""
+from __future__ import annotations
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from bson import ObjectId, json_util
+from pymongo import InsertOne, ReplaceOne
+
+from calculator_helper import ScoringPlan
+from details import attach_details, save_details, split_doc
+from rollups import _month_key
+from score_meta import (
+    GENERATIONS_FIELD,
+    allocate_generation,
+    bump_score_version,
+    gc_generations,
+    generation_fields,
+    get_score_meta,
+    resolve_scores,
+    score_fields,
+)
+import instrumentation
+
+SCHEMA_VERSION = 2
+# exportações v1 não têm _id_type: o tipo do _id é deduzido do texto
+SUPPORTED_SCHEMA_VERSIONS = (1, 2)
+BATCH_ROWS = int(os.environ.get("PARQUET_BATCH_ROWS", "10000"))
+# teto de linhas em buffer somando todas as partições; acima disso a maior é descarregada
+MAX_BUFFERED_ROWS = int(os.environ.get("PARQUET_MAX_BUFFERED_ROWS", "200000"))
+MANIFEST = "_manifest.json"
+
+SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("_id_type", pa.string()),
+    ("name", pa.string()),
+    ("description", pa.string()),
+    ("cve_id", pa.string()),
+    ("cve_ids", pa.list_(pa.string())),
+    ("family", pa.string()),
+    ("date", pa.string()),
+    ("cvss", pa.float64()),
+    ("epss", pa.float64()),
+    ("companyCriticality", pa.float64()),
+    ("base_score", pa.float64()),
+    ("feat_cve", pa.float64()),
+    ("feat_epss", pa.float64()),
+    ("feat_criticality", pa.float64()),
+    ("feat_date_norm", pa.float64()),
+    ("environments", pa.string()),
+    ("tags", pa.string()),
+    ("extra", pa.string()),
+])
+# colunas de partição (vão no caminho, não no arquivo)
+PARTITION_SCHEMA = pa.schema([("month", pa.string()), ("priority_class", pa.string())])
+
+_SCALARS = ("name", "description", "family", "date")
+_NUMBERS = ("cvss", "epss", "companyCriticality")
+_KNOWN = set(SCHEMA.names) | {"priority_class", GENERATIONS_FIELD}
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def _num(v: Any) -> Optional[float]:
+    try:
+        return None if v is None else float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _str(v: Any) -> Optional[str]:
+    return None if v is None else str(v)
+
+
+def _encode_id(_id: Any) -> Tuple[str, str]:
+    """(texto, tipo) do _id; tipos fora de ObjectId/int/str vão em JSON estendido."""
+    if isinstance(_id, ObjectId):
+        return str(_id), "objectid"
+    if isinstance(_id, int) and not isinstance(_id, bool):
+        return str(_id), "int"
+    if isinstance(_id, str):
+        return _id, "str"
+    return json_util.dumps(_id), "json"
+
+
+def _to_row(
+    doc: Dict[str, Any], plan: ScoringPlan, months: Dict[Any, str],
+) -> Tuple[Tuple[str, str], Dict[str, Any]]:
+    norm = plan.normalize(doc)
+    extra = {k: v for k, v in doc.items() if k not in _KNOWN}
+    cve_id = doc.get("cve_id")
+    if cve_id is not None and not isinstance(cve_id, str):
+        extra["cve_id"] = cve_id  # formato original (ex.: lista) preservado
+        cve_id = ", ".join(str(c) for c in cve_id) if isinstance(cve_id, (list, tuple)) else str(cve_id)
+    for k in _NUMBERS:
+        v = doc.get(k)
+        if v is not None and _num(v) is None:
+            extra[k] = v
+    pc = doc.get("priority_class") or "unscored"
+    _id, id_type = _encode_id(doc.get("_id"))
+    row = {
+        "_id": _id,
+        "_id_type": id_type,
+        **{k: _str(doc.get(k)) for k in _SCALARS},
+        "cve_id": cve_id,
+        "cve_ids": [str(c) for c in doc.get("cve_ids") or []],
+        **{k: _num(doc.get(k)) for k in _NUMBERS},
+        "base_score": _num(doc.get("base_score")),
+        "feat_cve": norm["cve"],
+        "feat_epss": norm.get("epss", 0.0),
+        "feat_criticality": norm["companyCriticality"],
+        "feat_date_norm": norm["date_norm"],
+        "environments": json_util.dumps(doc.get("environments")) if "environments" in doc else None,
+        "tags": json_util.dumps(doc.get("tags")) if "tags" in doc else None,
+        "extra": json_util.dumps(extra) if extra else None,
+    }
+    date = doc.get("date")
+    month = months.get(date) if isinstance(date, str) else None
+    if month is None:
+        month = _month_key(date)
+        if isinstance(date, str) and len(months) < 100_000:
+            months[date] = month
+    return (month, pc), row
+
+
+class _PartitionWriter:
+    """Buffers por partição e um ParquetWriter aberto por partição."""
+
+    def __init__(self, root: str, batch_rows: int, compression: str):
+        self.root = root
+        self.batch_rows = batch_rows
+        self.compression = compression
+        self.buffers: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self.writers: Dict[Tuple[str, str], pq.ParquetWriter] = {}
+        self.counts: Dict[Tuple[str, str], int] = {}
+        self.buffered = 0
+        self.batches = 0
+
+    def add(self, key: Tuple[str, str], row: Dict[str, Any]) -> None:
+        buf = self.buffers.setdefault(key, [])
+        buf.append(row)
+        self.buffered += 1
+        if len(buf) >= self.batch_rows:
+            self._flush(key)
+        elif self.buffered >= MAX_BUFFERED_ROWS:
+            self._flush(max(self.buffers, key=lambda k: len(self.buffers[k])))
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        rows = self.buffers.pop(key, [])
+        if not rows:
+            return
+        writer = self.writers.get(key)
+        if writer is None:
+            month, pc = key
+            path = os.path.join(self.root, f"month={month}", f"priority_class={pc}")
+            os.makedirs(path, exist_ok=True)
+            writer = self.writers[key] = pq.ParquetWriter(
+                os.path.join(path, "part-0.parquet"), SCHEMA, compression=self.compression,
+            )
+        writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=SCHEMA))
+        self.buffered -= len(rows)
+        self.counts[key] = self.counts.get(key, 0) + len(rows)
+        self.batches += 1
+
+    def close(self) -> None:
+        for key in list(self.buffers):
+            self._flush(key)
+        for writer in self.writers.values():
+            writer.close()
+
+
+def export_parquet(
+    path: str,
+    *,
+    collection=None,
+    query: Optional[Dict[str, Any]] = None,
+    batch_rows: int = BATCH_ROWS,
+    compression: str = "zstd",
+    cursor_batch_size: int = 5000,
+) -> Dict[str, Any]:
+    """
+    Exporta `query` (padrão: tudo) para `path`. Retorna o manifesto gravado
+    em path/_manifest.json (linhas por partição, versão/pesos/cortes dos scores).
+    """
+    coll = collection if collection is not None else _default_collection()
+    if os.path.exists(os.path.join(path, MANIFEST)):
+        raise ValueError(f"{path} já contém uma exportação")
+    os.makedirs(path, exist_ok=True)
+    meta = get_score_meta(coll)
+    fields = score_fields(meta=meta)
+    plan = ScoringPlan(weights={"date_norm": 1})
+    out = _PartitionWriter(path, batch_rows, compression)
+    months: Dict[Any, str] = {}
+    rows = 0
+    with instrumentation.span("parquet.export") as sp:
+        cursor = coll.find(query or {}, batch_size=cursor_batch_size)
+        batch: List[Dict[str, Any]] = []
+
+        def _drain() -> int:
+            # descrição migrada para vulnerability_details volta para a linha exportada
+            for doc in attach_details(batch, coll):
+                key, row = _to_row(resolve_scores(doc, fields), plan, months)
+                out.add(key, row)
+            n = len(batch)
+            batch.clear()
+            return n
+
+        try:
+            for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= cursor_batch_size:
+                    rows += _drain()
+            rows += _drain()
+        finally:
+            cursor.close()
+            out.close()
+        sp.set(rows=rows, partitions=len(out.counts), batches=out.batches)
+    manifest = {
+        "schema_version": SCHEMA_VERSION,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "collection": coll.name,
+        "rows": rows,
+        "batch_rows": batch_rows,
+        "partitions": {f"{m}/{pc}": n for (m, pc), n in sorted(out.counts.items())},
+        "score": {
+            "version": meta.get("version", 0),
+            "weights": meta.get("weights"),
+            "thresholds_raw": meta.get("thresholds_raw"),
+        },
+    }
+    with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def read_dataset(path: str) -> ds.Dataset:
+    """Dataset particionado (month, priority_class) para leitura direta (pyarrow / pandas / duckdb)."""
+    return ds.dataset(path, format="parquet", partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"))
+
+
+def _decode_id(s: str, id_type: Optional[str]) -> Any:
+    if id_type == "objectid":
+        return ObjectId(s)
+    if id_type == "int":
+        return int(s)
+    if id_type == "str":
+        return s
+    if id_type == "json":
+        return json_util.loads(s)
+    return _parse_id(s)
+
+
+def _parse_id(s: str) -> Any:
+    """Só para exportações v1, sem _id_type."""
+    if ObjectId.is_valid(s) and len(s) == 24:
+        return ObjectId(s)
+    if s.lstrip("-").isdigit():
+        return int(s)
+    return s
+
+
+def _to_doc(row: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[float], Optional[str]]:
+    doc: Dict[str, Any] = {"_id": _decode_id(row["_id"], row.get("_id_type"))}
+    for k in _SCALARS + ("cve_id",) + _NUMBERS:
+        if row.get(k) is not None:
+            doc[k] = row[k]
+    doc["cve_ids"] = list(row.get("cve_ids") or [])
+    for k in ("environments", "tags"):
+        if row.get(k) is not None:
+            doc[k] = json_util.loads(row[k])
+    if row.get("extra"):
+        doc.update(json_util.loads(row["extra"]))
+    pc = row.get("priority_class")
+    return doc, row.get("base_score"), (None if pc in (None, "unscored") else pc)
+
+
+def iter_docs(path: str, batch_rows: int = BATCH_ROWS) -> Iterator[Tuple[Dict[str, Any], Optional[float], Optional[str]]]:
+    for batch in read_dataset(path).to_batches(batch_size=batch_rows):
+        for row in batch.to_pylist():
+            yield _to_doc(row)
+
+
+def import_parquet(
+    path: str,
+    *,
+    collection=None,
+    drop: bool = False,
+    batch_rows: int = 5000,
+    rollups: bool = True,
+) -> Dict[str, Any]:
+    """
+    Restaura uma exportação em `collection`: insert em lotes numa collection
+    vazia, replace/upsert por _id caso contrário; os
+    scores vão para uma geração nova, ativada com os pesos/cortes do
+    manifesto; rollups são reconstruídos e o feature store (se existir)
+    sincronizado. `drop` esvazia a collection antes; `rollups=False` deixa a
+    reconstrução dos rollups para depois (cargas em várias etapas).
+    """
+    from calculator_helper import ensure_score_indexes
+    from rollups import rebuild_rollups
+    import feature_store
+
+    coll = collection if collection is not None else _default_collection()
+    with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("schema_version") not in SUPPORTED_SCHEMA_VERSIONS:
+        raise ValueError(f"schema_version {manifest.get('schema_version')} não suportada")
+    if drop:
+        coll.delete_many({})
+    # collection vazia: insert puro, sem o lookup por _id de cada upsert
+    fresh = coll.find_one({}, {"_id": 1}) is None
+    generation = allocate_generation(coll)
+    fields = generation_fields(generation)
+    rows = 0
+    ops: List[Any] = []
+    docs: List[Dict[str, Any]] = []
+
+    def _flush() -> None:
+        if ops:
+            coll.bulk_write(ops, ordered=False)
+            save_details(coll, docs)
+            feature_store.sync(coll, docs)
+            ops.clear()
+            docs.clear()
+
+    with instrumentation.span("parquet.import") as sp:
+        for doc, score, pc in iter_docs(path, batch_rows):
+            full, _ = split_doc(doc)
+            if score is not None and pc:
+                full[GENERATIONS_FIELD] = {f"g{generation}": {"base_score": score, "priority_class": pc}}
+            ops.append(InsertOne(full) if fresh else ReplaceOne({"_id": doc["_id"]}, full, upsert=True))
+            docs.append(doc)
+            rows += 1
+            if len(ops) >= batch_rows:
+                _flush()
+        _flush()
+        sp.set(rows=rows)
+    ensure_score_indexes(coll, fields)
+    score = manifest.get("score") or {}
+    version = bump_score_version(
+        coll, weights=score.get("weights"), thresholds_raw=score.get("thresholds_raw"), generation=generation,
+    )
+    if rollups:
+        rebuild_rollups(coll)
+    gc_generations(coll)
+    return {"rows": rows, "generation": generation, "score_version": version}
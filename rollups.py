@@ -0,0 +1,295 @@
+from __future__ import annotations
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from calculator_helper import parse_year_month
+from score_meta import bump_data_version, score_fields
+
+# Collections materializadas (no mesmo database da collection de vulnerabilidades)
+ROLLUP_COLLECTION = "vulnerability_rollup"
+HISTOGRAM_COLLECTION = "vulnerability_histogram"
+
+EPSS_BUCKET = 0.05
+SCORE_BUCKET = 0.5
+
+# Campos necessários para calcular as chaves dos rollups de um documento
+ROLLUP_PROJECTION = {
+    "_id": 1,
+    "family": 1,
+    "environments": 1,
+    "tags": 1,
+    "companyCriticality": 1,
+    "date": 1,
+    "cve_id": 1,
+    "epss": 1,
+}
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def _companion(collection, name: str):
+    return collection.database[name]
+
+
+def _month_key(date_str: Any) -> str:
+    ym = parse_year_month(date_str)
+    if ym is None:
+        return "N/A"
+    return f"{ym[0]:04d}-{ym[1]:02d}"
+
+
+def _environment_of(doc: Dict[str, Any]) -> str:
+    for key in ("environments", "tags"):
+        arr = doc.get(key) or []
+        if isinstance(arr, str):
+            return arr.upper()
+        if not isinstance(arr, list):
+            continue
+        for t in arr:
+            if isinstance(t, str) and key == "environments":
+                return t.upper()
+            if isinstance(t, dict):
+                if t.get("category") not in (None, "AMBIENTE"):
+                    continue
+                v = t.get("value") or t.get("name")
+                if isinstance(v, str) and v:
+                    return v.upper()
+    return "N/A"
+
+
+def _criticality_of(doc: Dict[str, Any]) -> int:
+    try:
+        return int(float(doc.get("companyCriticality") or 0))
+    except Exception:
+        return 0
+
+
+def _epss_of(doc: Dict[str, Any]) -> Optional[float]:
+    v = doc.get("epss")
+    if v is None:
+        return None
+    try:
+        x = float(v)
+    except Exception:
+        return None
+    return max(0.0, min(1.0, x))
+
+
+def _has_cve(doc: Dict[str, Any]) -> bool:
+    c = doc.get("cve_id")
+    if isinstance(c, list):
+        return any(isinstance(x, str) and x for x in c)
+    return isinstance(c, str) and bool(c.strip())
+
+
+def rollup_key(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Chave família x ambiente x criticidade x mês de um documento."""
+    return {
+        "family": doc.get("family") or "N/A",
+        "environment": _environment_of(doc),
+        "criticality": _criticality_of(doc),
+        "month": _month_key(doc.get("date")),
+    }
+
+
+def epss_bucket(epss: float) -> float:
+    b = min(math.floor(epss / EPSS_BUCKET), int(round(1 / EPSS_BUCKET)) - 1)
+    return round(b * EPSS_BUCKET, 2)
+
+
+def score_bucket(score: float) -> float:
+    return round(math.floor(score / SCORE_BUCKET) * SCORE_BUCKET, 6)
+
+
+def _hist_key(metric: str, bucket: Any) -> Dict[str, Any]:
+    return {"metric": metric, "bucket": bucket}
+
+
+def _freeze(key: Dict[str, Any]) -> Tuple:
+    return tuple(key.items())
+
+
+class RollupDelta:
+    """
+    Acumula deltas ($inc) dos rollups para um lote de documentos inseridos,
+    removidos ou alterados, e aplica tudo em um único bulk_write no flush().
+    Os documentos devem vir com base_score/priority_class já resolvidos para
+    a geração corrente (score_meta.resolve_scores).
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection if collection is not None else _default_collection()
+        self._rollup: Dict[Tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._hist: Dict[Tuple, float] = defaultdict(float)
+
+    def _apply(self, doc: Dict[str, Any], sign: int) -> None:
+        acc = self._rollup[_freeze(rollup_key(doc))]
+        acc["count"] += sign
+        if _has_cve(doc):
+            acc["with_cve"] += sign
+        epss = _epss_of(doc)
+        if epss is not None:
+            acc["epss_sum"] += sign * epss
+            acc["epss_n"] += sign
+            self._hist[_freeze(_hist_key("epss", epss_bucket(epss)))] += sign
+        pc = doc.get("priority_class")
+        if isinstance(pc, str) and pc:
+            self._hist[_freeze(_hist_key("priority_class", pc))] += sign
+        bs = doc.get("base_score")
+        if isinstance(bs, (int, float)) and isinstance(pc, str) and pc:
+            self._hist[_freeze(_hist_key("base_score", score_bucket(float(bs))))] += sign
+
+    def add(self, doc: Dict[str, Any]) -> None:
+        self._apply(doc, +1)
+
+    def remove(self, doc: Dict[str, Any]) -> None:
+        self._apply(doc, -1)
+
+    def change(self, old: Dict[str, Any], new: Dict[str, Any]) -> None:
+        self._apply(old, -1)
+        self._apply(new, +1)
+
+    def flush(self) -> Dict[str, int]:
+        rollup_ops: List[UpdateOne] = []
+        for key, acc in self._rollup.items():
+            inc = {k: v for k, v in acc.items() if v}
+            if inc:
+                rollup_ops.append(UpdateOne({"_id": dict(key)}, {"$inc": inc}, upsert=True))
+        hist_ops: List[UpdateOne] = [
+            UpdateOne({"_id": dict(key)}, {"$inc": {"count": v}}, upsert=True)
+            for key, v in self._hist.items() if v
+        ]
+        rollups = _companion(self.collection, ROLLUP_COLLECTION)
+        hist = _companion(self.collection, HISTOGRAM_COLLECTION)
+        if rollup_ops:
+            rollups.bulk_write(rollup_ops, ordered=False)
+            rollups.delete_many({"count": {"$lte": 0}})
+        if hist_ops:
+            hist.bulk_write(hist_ops, ordered=False)
+            hist.delete_many({"count": {"$lte": 0}})
+        self._rollup.clear()
+        self._hist.clear()
+        if rollup_ops or hist_ops:
+            bump_data_version(self.collection)
+        return {"rollup_ops": len(rollup_ops), "histogram_ops": len(hist_ops)}
+
+
+def refresh_score_rollups(collection=None, fields: Optional[Dict[str, str]] = None) -> None:
+    """
+    Recalcula no servidor (aggregation $group) os histogramas de base_score e
+    priority_class; só os buckets agregados voltam ao cliente e são gravados
+    por upsert. Usado pelo scorer, que reescreve todos os scores de uma vez.
+    Buckets que sumiram são removidos pelo carimbo refreshed_at.
+    `fields` são os campos da geração de score (padrão: a corrente).
+    """
+    coll = collection if collection is not None else _default_collection()
+    if fields is None:
+        fields = score_fields(coll)
+    f_score, f_class = fields["score"], fields["class"]
+    stamp = datetime.now(timezone.utc)
+    scored = {f_score: {"$type": "number"}, f_class: {"$nin": [None, ""]}}
+    groups = list(coll.aggregate([
+        {"$match": scored},
+        {"$group": {
+            "_id": {
+                "metric": "base_score",
+                "bucket": {"$multiply": [{"$floor": {"$divide": [f"${f_score}", SCORE_BUCKET]}}, SCORE_BUCKET]},
+            },
+            "count": {"$sum": 1},
+        }},
+    ]))
+    groups += coll.aggregate([
+        {"$match": scored},
+        {"$group": {"_id": {"metric": "priority_class", "bucket": f"${f_class}"}, "count": {"$sum": 1}}},
+    ])
+    # sem $merge: funciona em qualquer versão do servidor (e no mongomock)
+    hist = _companion(coll, HISTOGRAM_COLLECTION)
+    ops = []
+    for g in groups:
+        key = dict(g["_id"])
+        if key["metric"] == "base_score":
+            key["bucket"] = round(float(key["bucket"]), 6)
+        ops.append(UpdateOne({"_id": key}, {"$set": {"count": int(g["count"]), "refreshed_at": stamp}}, upsert=True))
+    if ops:
+        hist.bulk_write(ops, ordered=False)
+    hist.delete_many({
+        "_id.metric": {"$in": ["base_score", "priority_class"]},
+        "refreshed_at": {"$ne": stamp},
+    })
+    bump_data_version(coll)
+
+
+def rebuild_rollups(collection=None, batch_size: int = 5000) -> Dict[str, int]:
+    """
+    Reconstrução completa (uma varredura) dos rollups e do histograma de EPSS.
+    Só é necessária na carga inicial ou para corrigir deriva; o dia a dia
+    é mantido por RollupDelta e refresh_score_rollups.
+    """
+    coll = collection if collection is not None else _default_collection()
+    stamp = datetime.now(timezone.utc)
+    delta = RollupDelta(coll)
+    cursor = coll.find({}, ROLLUP_PROJECTION, batch_size=batch_size)
+    scanned = 0
+    try:
+        for doc in cursor:
+            delta.add(doc)
+            scanned += 1
+    finally:
+        cursor.close()
+
+    rollups = _companion(coll, ROLLUP_COLLECTION)
+    hist = _companion(coll, HISTOGRAM_COLLECTION)
+    rollup_ops = [
+        UpdateOne({"_id": dict(key)}, {"$set": {
+            "count": acc["count"],
+            "with_cve": acc["with_cve"],
+            "epss_sum": acc["epss_sum"],
+            "epss_n": acc["epss_n"],
+            "refreshed_at": stamp,
+        }}, upsert=True)
+        for key, acc in delta._rollup.items()
+    ]
+    hist_ops = [
+        UpdateOne({"_id": dict(key)}, {"$set": {"count": v, "refreshed_at": stamp}}, upsert=True)
+        for key, v in delta._hist.items()
+    ]
+    if rollup_ops:
+        rollups.bulk_write(rollup_ops, ordered=False)
+    if hist_ops:
+        hist.bulk_write(hist_ops, ordered=False)
+    rollups.delete_many({"refreshed_at": {"$ne": stamp}})
+    hist.delete_many({"_id.metric": "epss", "refreshed_at": {"$ne": stamp}})
+    refresh_score_rollups(coll)
+    return {"scanned": scanned, "rollup_rows": len(rollup_ops), "histogram_rows": len(hist_ops)}
+
+
+def load_rollups(collection=None) -> List[Dict[str, Any]]:
+    """Linhas achatadas do rollup família x ambiente x criticidade x mês."""
+    coll = collection if collection is not None else _default_collection()
+    out: List[Dict[str, Any]] = []
+    for r in _companion(coll, ROLLUP_COLLECTION).find({}):
+        row = dict(r["_id"])
+        row["count"] = int(r.get("count", 0))
+        row["with_cve"] = int(r.get("with_cve", 0))
+        row["epss_sum"] = float(r.get("epss_sum", 0.0))
+        row["epss_n"] = int(r.get("epss_n", 0))
+        out.append(row)
+    return out
+
+
+def load_histogram(metric: str, collection=None) -> List[Dict[str, Any]]:
+    """Buckets de um histograma ('epss', 'base_score' ou 'priority_class')."""
+    coll = collection if collection is not None else _default_collection()
+    rows = [
+        {"bucket": r["_id"]["bucket"], "count": int(r.get("count", 0))}
+        for r in _companion(coll, HISTOGRAM_COLLECTION).find({"_id.metric": metric})
+    ]
+    rows.sort(key=lambda r: (str(type(r["bucket"])), r["bucket"]))
+    return rows
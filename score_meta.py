@@ -0,0 +1,168 @@
+from __future__ import annotations
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+# Um documento por collection de vulnerabilidades, com o carimbo de versão
+# dos scores persistidos (base_score / priority_class).
+META_COLLECTION = "score_meta"
+
+# Gerações de score (blue/green): cada re-score grava em
+# gen_scores.g<N>.base_score / .priority_class e só no fim vira a geração
+# corrente, junto com o incremento da versão, num único update do meta.
+# Sem geração corrente (bases antigas) valem os campos de topo.
+GENERATIONS_FIELD = "gen_scores"
+LEGACY_SCORE_FIELDS = {"score": "base_score", "class": "priority_class"}
+# gerações anteriores mantidas além da corrente (rollback / leitores atrasados)
+SCORE_GENERATIONS_KEEP = int(os.environ.get("SCORE_GENERATIONS_KEEP", "1"))
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def _meta(collection):
+    return collection.database[META_COLLECTION]
+
+
+def get_score_meta(collection=None) -> Dict[str, Any]:
+    coll = collection if collection is not None else _default_collection()
+    return _meta(coll).find_one({"_id": coll.name}) or {"_id": coll.name, "version": 0}
+
+
+def get_score_version(collection=None) -> int:
+    return int(get_score_meta(collection).get("version", 0))
+
+
+def get_versions(collection=None) -> Tuple[int, int]:
+    """(versão dos scores, versão dos dados) numa leitura: chave dos caches da UI."""
+    meta = get_score_meta(collection)
+    return int(meta.get("version", 0)), int(meta.get("data_version", 0))
+
+
+def bump_data_version(collection=None) -> None:
+    """
+    Incrementa a versão dos dados: findings inseridos, enriquecidos, mesclados
+    ou arquivados mudam o que a UI mostra sem mudar a versão dos scores.
+    Chamado pelas escritas dos rollups e do feature store.
+    """
+    coll = collection if collection is not None else _default_collection()
+    _meta(coll).update_one({"_id": coll.name}, {"$inc": {"data_version": 1}}, upsert=True)
+
+
+def bump_score_version(
+    collection=None,
+    *,
+    weights: Optional[Dict[str, float]] = None,
+    thresholds_raw: Optional[Dict[str, float]] = None,
+    generation: Optional[int] = None,
+) -> int:
+    """
+    Incrementa a versão após um re-score; leitores em cache usam a versão como chave.
+    Com `generation`, a mesma escrita troca a geração corrente (switchover atômico).
+    """
+    coll = collection if collection is not None else _default_collection()
+    fields: Dict[str, Any] = {
+        "weights": weights,
+        "thresholds_raw": thresholds_raw,
+        "updated_at": datetime.now(timezone.utc),
+    }
+    update: Dict[str, Any] = {"$inc": {"version": 1}, "$set": fields}
+    if generation is not None:
+        fields["current_generation"] = int(generation)
+        update["$push"] = {"activated_generations": {"$each": [int(generation)], "$slice": -10}}
+    doc = _meta(coll).find_one_and_update(
+        {"_id": coll.name},
+        update,
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(doc.get("version", 0))
+
+
+def generation_fields(generation: int) -> Dict[str, str]:
+    base = f"{GENERATIONS_FIELD}.g{int(generation)}"
+    return {"score": f"{base}.base_score", "class": f"{base}.priority_class"}
+
+
+def score_fields(collection=None, *, meta: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """Nomes dos campos de score/classe da geração corrente: {'score': ..., 'class': ...}."""
+    if meta is None:
+        meta = get_score_meta(collection)
+    g = meta.get("current_generation")
+    return generation_fields(g) if g is not None else dict(LEGACY_SCORE_FIELDS)
+
+
+def score_projection(fields: Dict[str, str]) -> Dict[str, int]:
+    return {fields["score"]: 1, fields["class"]: 1}
+
+
+def map_score_field(name: str, fields: Dict[str, str]) -> str:
+    """'base_score' / 'priority_class' -> campo físico da geração; outros nomes passam direto."""
+    return {"base_score": fields["score"], "priority_class": fields["class"]}.get(name, name)
+
+
+def map_projection(projection: Dict[str, int], fields: Dict[str, str]) -> Dict[str, int]:
+    return {map_score_field(k, fields): v for k, v in projection.items()}
+
+
+def resolve_scores(doc: Dict[str, Any], fields: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Copia o score/classe da geração corrente para base_score / priority_class
+    do documento lido (in place) e descarta o subdocumento de gerações.
+    Documentos lidos sem os campos de score ficam como estão.
+    """
+    gens = doc.pop(GENERATIONS_FIELD, None)
+    if fields == LEGACY_SCORE_FIELDS:
+        return doc
+    if gens is None and "base_score" not in doc and "priority_class" not in doc:
+        return doc
+    cur = (gens or {}).get(fields["score"].split(".")[1]) or {}
+    doc["base_score"] = cur.get("base_score")
+    doc["priority_class"] = cur.get("priority_class")
+    return doc
+
+
+def allocate_generation(collection=None) -> int:
+    """Reserva o número da próxima geração (atômico: dois re-scores nunca colidem)."""
+    coll = collection if collection is not None else _default_collection()
+    doc = _meta(coll).find_one_and_update(
+        {"_id": coll.name},
+        {"$inc": {"next_generation": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    g = int(doc["next_generation"])
+    _meta(coll).update_one({"_id": coll.name}, {"$addToSet": {"generations": g}})
+    return g
+
+
+def gc_generations(collection=None, *, keep: int = SCORE_GENERATIONS_KEEP) -> List[int]:
+    """
+    Remove dos documentos (e os índices) as gerações fora da corrente e das
+    `keep` que foram correntes antes dela, incluindo as de re-scores que
+    caíram antes do switchover. Retorna as gerações removidas.
+    """
+    coll = collection if collection is not None else _default_collection()
+    meta = get_score_meta(coll)
+    current = meta.get("current_generation")
+    if current is None:
+        return []
+    gens = sorted(int(g) for g in meta.get("generations") or [])
+    # gerações acima da corrente podem ser de um re-score ainda em andamento
+    activated = [int(g) for g in meta.get("activated_generations") or [] if int(g) != current]
+    kept = set(activated[-keep:]) if keep > 0 else set()
+    stale = [g for g in gens if g < current and g not in kept]
+    if not stale:
+        return []
+    paths = {f"{GENERATIONS_FIELD}.g{g}": "" for g in stale}
+    coll.update_many({"$or": [{p: {"$exists": True}} for p in paths]}, {"$unset": paths})
+    prefixes = tuple(f"{p}." for p in paths)
+    for name, info in coll.index_information().items():
+        if any(k.startswith(prefixes) for k, _ in info.get("key", [])):
+            coll.drop_index(name)
+    _meta(coll).update_one({"_id": coll.name}, {"$pull": {"generations": {"$in": stale}}})
+    return stale
@@ -0,0 +1,220 @@
+"""
+Perfis de scoring nomeados (ex.: appsec, infra, compliance).
+
+Cada perfil é um vetor de pesos + modo de corte guardado em
+`scoring_profiles`. As colunas robust-z não dependem dos pesos, então
+score_profiles lê a base uma vez, calcula as colunas uma vez e cada perfil
+custa só a soma ponderada + cortes. O resultado vai para
+`scores.<perfil>` = {'score', 'class'} em cada finding, sem tocar em
+base_score / priority_class.
+"""
+from __future__ import annotations
+import re
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from calculator_helper import ScoringPlan, weights_to_params
+from order_stats import source_fields
+import instrumentation
+
+PROFILES_COLLECTION = "scoring_profiles"
+
+# o nome vira parte do caminho do campo: nada de '.', '$' ou espaços
+PROFILE_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def _profiles(collection):
+    return collection.database[PROFILES_COLLECTION]
+
+
+def score_field(name: str) -> str:
+    return f"scores.{name}"
+
+
+def _plan(profile: Dict[str, Any]) -> ScoringPlan:
+    return ScoringPlan(
+        weights_to_params(profile["weights"]),
+        cut_mode=profile.get("cut_mode", "kmeans"),
+        quantile_cuts=tuple(profile.get("quantile_cuts") or (0.50, 0.80, 0.95)),
+    )
+
+
+def save_profile(
+    name: str,
+    weights: Dict[str, float],
+    *,
+    cut_mode: str = "kmeans",
+    quantile_cuts=(0.50, 0.80, 0.95),
+    collection=None,
+) -> Dict[str, Any]:
+    """Cria/atualiza um perfil. Pesos e cortes são validados pelo ScoringPlan (ValueError)."""
+    if not isinstance(name, str) or not PROFILE_NAME_RE.match(name):
+        raise ValueError(f"nome de perfil inválido: {name!r}")
+    coll = collection if collection is not None else _default_collection()
+    doc = {
+        "weights": {k: float(v) for k, v in (weights or {}).items()},
+        "cut_mode": cut_mode,
+        "quantile_cuts": [float(q) for q in quantile_cuts],
+    }
+    _plan(doc)
+    doc["updated_at"] = datetime.now(timezone.utc)
+    _profiles(coll).update_one({"_id": name}, {"$set": doc}, upsert=True)
+    return {"_id": name, **doc}
+
+
+def get_profile(name: str, *, collection=None) -> Optional[Dict[str, Any]]:
+    coll = collection if collection is not None else _default_collection()
+    return _profiles(coll).find_one({"_id": name})
+
+
+def list_profiles(*, collection=None) -> List[Dict[str, Any]]:
+    coll = collection if collection is not None else _default_collection()
+    return list(_profiles(coll).find({}).sort("_id", 1))
+
+
+def _index_keys(name: str):
+    f = score_field(name)
+    return ([(f"{f}.class", 1), (f"{f}.score", -1)], [(f"{f}.score", -1)])
+
+
+def ensure_profile_indexes(name: str, *, collection=None) -> None:
+    """Mesmos índices de SCORE_INDEXES, sobre scores.<perfil>."""
+    coll = collection if collection is not None else _default_collection()
+    for keys in _index_keys(name):
+        coll.create_index(keys)
+
+
+def delete_profile(name: str, *, collection=None, unset_scores: bool = True) -> bool:
+    """Remove o perfil, seus índices e (por padrão) os scores.<perfil> gravados."""
+    coll = collection if collection is not None else _default_collection()
+    res = _profiles(coll).delete_one({"_id": name})
+    if not res.deleted_count:
+        return False
+    existing = {tuple(v.get("key", [])) for v in coll.index_information().values()}
+    for keys in _index_keys(name):
+        if tuple(keys) in existing:
+            coll.drop_index(keys)
+    if unset_scores:
+        coll.update_many({score_field(name): {"$exists": True}}, {"$unset": {score_field(name): ""}})
+    return True
+
+
+def score_profiles(
+    *,
+    collection=None,
+    names: Optional[List[str]] = None,
+    query: Optional[Dict[str, Any]] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    write_batch_size: int = 1000,
+) -> Dict[str, Any]:
+    """
+    Re-score de todos os perfis (ou de `names`) numa única leitura da base.
+    Para cada perfil o score é o mesmo que batch_score_and_update daria com
+    aqueles pesos. Retorna {'updated', 'total', 'profiles': {nome: thresholds_raw}}.
+    """
+    coll = collection if collection is not None else _default_collection()
+    q = query or {}
+    profiles = list_profiles(collection=coll)
+    if names is not None:
+        wanted = set(names)
+        missing = wanted - {p["_id"] for p in profiles}
+        if missing:
+            raise ValueError(f"perfis inexistentes: {sorted(missing)}")
+        profiles = [p for p in profiles if p["_id"] in wanted]
+    if not profiles:
+        return {"updated": 0, "total": 0, "profiles": {}}
+    plans = {p["_id"]: _plan(p) for p in profiles}
+
+    def _report(stage: str, processed: int, written: int) -> None:
+        if progress is not None:
+            progress({"stage": stage, "processed": processed, "written": written, "total": total})
+
+    # um plano com a união dos campos monta as colunas compartilhadas
+    union: List[str] = []
+    for plan in plans.values():
+        union.extend(f for f in plan.fields if f not in union)
+    shared = ScoringPlan({"fields": {f: {"weight": 1.0} for f in union}})
+    # projeção a partir dos campos dos perfis: um campo extra não pode ser lido como 0
+    projection = {"_id": 1, **{f: 1 for f in source_fields(shared)}}
+
+    with instrumentation.span("profiles.batch", profiles=len(plans)) as root:
+        total = coll.count_documents(q)
+        columns = shared.new_columns()
+        ids: List[Any] = []
+        cursor = coll.find(q, projection, no_cursor_timeout=True)
+        try:
+            with instrumentation.span("profiles.read"):
+                for doc in cursor:
+                    ids.append(doc.get("_id"))
+                    shared.append(columns, doc)
+                    if len(ids) % write_batch_size == 0:
+                        _report("reading", len(ids), 0)
+        finally:
+            cursor.close()
+        root.set(total=total, read=len(ids))
+        if not ids:
+            return {"updated": 0, "total": total, "profiles": {}}
+
+        _report("scoring", len(ids), 0)
+        rz = shared.robust_columns(columns)
+        del columns
+        results: Dict[str, Any] = {}
+        thresholds: Dict[str, Dict[str, float]] = {}
+        for name, plan in plans.items():
+            with instrumentation.span("profiles.score", profile=name):
+                scores = plan.combine(rz, len(ids))
+                thresholds[name], classes = plan.classify(scores)
+            results[name] = (scores, classes)
+        del rz
+
+        updated = 0
+        ops: List[UpdateOne] = []
+        with instrumentation.span("profiles.write"):
+            for i, _id in enumerate(ids):
+                fields = {
+                    score_field(name): {"score": float(scores[i]), "class": classes[i]}
+                    for name, (scores, classes) in results.items()
+                }
+                ops.append(UpdateOne({"_id": _id}, {"$set": fields}))
+                if len(ops) >= write_batch_size:
+                    coll.bulk_write(ops, ordered=False)
+                    updated += len(ops)
+                    ops = []
+                    _report("writing", len(ids), updated)
+            if ops:
+                coll.bulk_write(ops, ordered=False)
+                updated += len(ops)
+        _report("writing", len(ids), updated)
+
+    now = datetime.now(timezone.utc)
+    for name in plans:
+        ensure_profile_indexes(name, collection=coll)
+        _profiles(coll).update_one(
+            {"_id": name},
+            {"$set": {"thresholds_raw": thresholds[name], "scored_at": now, "scored_count": len(ids)}},
+        )
+    instrumentation.count("profiles.updated", updated)
+    return {"updated": updated, "total": total, "profiles": thresholds}
+
+
+def top_for_profile(
+    name: str,
+    *,
+    limit: int = 30,
+    priority_class: Optional[str] = "gravissima",
+    projection: Optional[Dict[str, int]] = None,
+    collection=None,
+) -> List[Dict[str, Any]]:
+    """Top `limit` pelo score persistido do perfil (consulta coberta pelos índices do perfil)."""
+    coll = collection if collection is not None else _default_collection()
+    f = score_field(name)
+    q = {f"{f}.class": priority_class} if priority_class else {f"{f}.score": {"$type": "number"}}
+    proj = projection or {"_id": 1, "name": 1, "cve_id": 1, "date": 1, "epss": 1, "companyCriticality": 1, f: 1}
+    return list(coll.find(q, proj).sort(f"{f}.score", -1).limit(int(limit)))
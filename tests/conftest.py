@@ -0,0 +1,46 @@
+"""
+Fixtures compartilhadas: Mongo em memória (mongomock), feature store numa
+pasta temporária e o stub do Jira. Os módulos do projeto ficam na raiz.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+mongomock = pytest.importorskip("mongomock")
+
+from bench_scoring import synth_population  # noqa: E402
+
+
+@pytest.fixture
+def coll():
+    return mongomock.MongoClient().db.vulnerability
+
+
+@pytest.fixture
+def population(coll):
+    docs = list(synth_population(600, seed=7))
+    coll.insert_many([dict(d) for d in docs])
+    return docs
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    import feature_store
+    monkeypatch.setattr(feature_store, "FEATURE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(feature_store, "_sync_stores", {})
+    return tmp_path
+
+
+@pytest.fixture
+def jira(monkeypatch):
+    import jira_api
+    import jira_stub
+    server, url = jira_stub.start_stub()
+    monkeypatch.setattr(jira_api, "JIRA_URL", url)
+    monkeypatch.setattr(jira_api, "JIRA_EMAIL", "stub")
+    monkeypatch.setattr(jira_api, "JIRA_TOKEN", "stub")
+    yield server
+    server.shutdown()
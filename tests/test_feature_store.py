@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import calculator
+import feature_store
+import score_meta
+from calculator_helper import ScoringPlan, select_top_gravissima, weights_to_params
+
+W = {"cve": 1, "epss": 2, "companyCriticality": 1, "date_norm": 1}
+
+
+@pytest.fixture
+def store(coll, population, store_dir):
+    st = feature_store.open_store(coll)
+    st.build(coll)
+    return st
+
+
+def _persisted(coll):
+    fields = score_meta.score_fields(coll)
+    return {
+        d["_id"]: (d.get("base_score"), d.get("priority_class"))
+        for d in (score_meta.resolve_scores(d, fields) for d in coll.find({}, score_meta.score_projection(fields)))
+    }
+
+
+def test_score_store_matches_plan(coll, population, store):
+    plan = ScoringPlan(weights_to_params(W), cut_mode="kmeans")
+    res = feature_store.score_store(plan, store)
+    scores = plan.score_batch(plan.columns(population))
+    thresholds, classes = plan.classify(scores)
+    ids = store.ids_at(res["rows"])
+    by_id = {d["_id"]: i for i, d in enumerate(population)}
+    assert res["scores"].tolist() == pytest.approx([scores[by_id[i]] for i in ids])
+    assert res["thresholds_raw"] == pytest.approx(thresholds)
+    assert [feature_store.CLASSES[c] for c in res["classes"].tolist()] == [classes[by_id[i]] for i in ids]
+
+
+def test_batch_from_store_matches_mongo(coll, population, store):
+    from_store = calculator.batch_score_and_update(collection=coll, weights=W, store=store)
+    via_store = _persisted(coll)
+    from_mongo = calculator.batch_score_and_update(collection=coll, weights=W)
+    assert from_store["thresholds_raw"] == pytest.approx(from_mongo["thresholds_raw"])
+    via_mongo = _persisted(coll)
+    assert via_store.keys() == via_mongo.keys()
+    for k, (score, cls) in via_mongo.items():
+        assert via_store[k][0] == pytest.approx(score)
+        assert via_store[k][1] == cls
+
+
+def test_top_from_store_matches_full_scan(coll, population, store):
+    fast = select_top_gravissima(collection=coll, weights=W, limit=10, use_persisted=False, store=store)
+    slow = select_top_gravissima(collection=coll, weights=W, limit=10, use_persisted=False)
+    assert fast["source"] == "feature_store"
+    assert [x["_id"] for x in fast["selected"]] == [x["_id"] for x in slow["selected"]]
+
+
+def test_sync_partial_updates_only_known_rows(coll, population, store):
+    n = store.n
+    feature_store.sync(coll, [{"_id": population[0]["_id"], "epss": 1.0}, {"_id": 10**9, "epss": 1.0}], insert=False)
+    st = feature_store.open_store(coll)
+    assert st.n == n
+    row = st.ids_at(range(st.n)).index(population[0]["_id"])
+    assert st.arrays()["epss"][row] == 10.0
+
+
+def test_deleted_row_is_not_revived_by_partial_doc(coll, population, store):
+    _id = population[0]["_id"]
+    store.delete([_id])
+    assert store.upsert([{"_id": _id, "epss": 1.0}], insert=False) == {"inserted": 0, "updated": 0}
+    row = store.ids_at(range(store.n)).index(_id)
+    assert store.arrays()["live"][row] == 0
+    # com insert=True a linha volta inteira: o que não veio no documento fica zerado
+    assert store.upsert([{"_id": _id, "epss": 1.0}]) == {"inserted": 1, "updated": 0}
+    arr = store.arrays()
+    assert (arr["live"][row], arr["cve"][row], arr["month"][row]) == (1, 0.0, -1)
+    assert np.count_nonzero(arr["live"]) == len(population)
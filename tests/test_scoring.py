@@ -0,0 +1,84 @@
+import pytest
+
+import calculator
+import score_meta
+from calculator_helper import ScoringPlan, compute_scores_and_clusters_free, normalize_item, weights_to_params
+
+W = {"cve": 1, "epss": 2, "companyCriticality": 1, "date_norm": 1}
+W2 = {"cve": 3, "epss": 1, "companyCriticality": 1, "date_norm": 0.5}
+
+
+def _scores(coll):
+    fields = score_meta.score_fields(coll)
+    return {
+        d["_id"]: (d.get("base_score"), d.get("priority_class"))
+        for d in (score_meta.resolve_scores(d, fields) for d in coll.find({}, score_meta.score_projection(fields)))
+    }
+
+
+def _reference(docs, weights):
+    items = [normalize_item(d) for d in docs]
+    res = compute_scores_and_clusters_free(items, params=weights_to_params(weights), cut_mode="kmeans")
+    return res["thresholds_raw"], {it["_id"]: (it["_raw_score"], it["_class"]) for it in res["items"]}
+
+
+# ---- ScoringPlan ----
+
+@pytest.mark.parametrize("cut_mode", ["kmeans", "quantiles"])
+def test_plan_raw_docs_match_normalized_items(population, cut_mode):
+    plan = ScoringPlan(weights_to_params(W), cut_mode=cut_mode)
+    raw = plan.score_batch(plan.columns(population))
+    norm = plan.score_batch(plan.columns([normalize_item(d, plan) for d in population], normalized=True))
+    assert raw == pytest.approx(norm)
+    assert plan.classify(raw) == plan.classify(norm)
+
+
+def test_batch_scores_match_reference(coll, population):
+    out = calculator.batch_score_and_update(collection=coll, weights=W)
+    thresholds, ref = _reference(population, W)
+    assert out["thresholds_raw"] == thresholds
+    got = _scores(coll)
+    assert got.keys() == ref.keys()
+    for _id, (score, cls) in ref.items():
+        assert got[_id][0] == pytest.approx(score)
+        assert got[_id][1] == cls
+
+
+# ---- gerações ----
+
+def test_switchover_only_after_activation(coll, population):
+    first = calculator.batch_score_and_update(collection=coll, weights=W)
+    before = _scores(coll)
+    # geração reservada e escrita mas nunca ativada (re-score interrompido)
+    g = score_meta.allocate_generation(coll)
+    coll.update_many({}, {"$set": {score_meta.generation_fields(g)["score"]: 99.0}})
+    assert _scores(coll) == before
+    second = calculator.batch_score_and_update(collection=coll, weights=W2)
+    assert second["generation"] > g > first["generation"]
+    assert score_meta.get_score_meta(coll)["current_generation"] == second["generation"]
+    assert score_meta.get_score_version(coll) > first["score_version"]
+    _, ref = _reference(population, W2)
+    assert {k: v[1] for k, v in _scores(coll).items()} == {k: v[1] for k, v in ref.items()}
+
+
+def test_partial_rescore_carries_the_rest(coll, population):
+    calculator.batch_score_and_update(collection=coll, weights=W)
+    before = _scores(coll)
+    coll.update_many({"companyCriticality": 5}, {"$set": {"epss": 0.99}})
+    out = calculator.batch_score_and_update(collection=coll, weights=W, query={"companyCriticality": 5})
+    assert not out["query_ignored"]
+    after = _scores(coll)
+    inside = {d["_id"] for d in population if d["companyCriticality"] == 5}
+    assert out["updated"] == len(inside)
+    assert all(after[k] == before[k] for k in before if k not in inside)
+    assert all(after[k][0] is not None for k in inside)
+
+
+def test_partial_rescore_with_new_weights_is_full(coll, population):
+    calculator.batch_score_and_update(collection=coll, weights=W)
+    out = calculator.batch_score_and_update(collection=coll, weights=W2, query={"companyCriticality": 5})
+    assert out["query_ignored"]
+    assert out["updated"] == len(population)
+    _, ref = _reference(population, W2)
+    got = _scores(coll)
+    assert all(got[k][0] == pytest.approx(ref[k][0]) for k in ref)
@@ -0,0 +1,49 @@
+import pytest
+
+import ticketing
+
+
+def _fake_stream(items, **_kwargs):
+    # texto determinístico no lugar do LLM; o stub do Jira rejeita summaries com "FAIL"
+    for w, obj in items:
+        yield w, (f"Corrigir {obj['name']}", f"Atualizar {obj['name']}."), None
+
+
+@pytest.fixture
+def findings(coll, monkeypatch):
+    monkeypatch.setattr(ticketing, "generate_stream", _fake_stream)
+    docs = [
+        {"name": "openssl", "cve_id": "CVE-2024-0001", "asset": "srv-1", "description": "x"},
+        {"name": "zlib", "cve_id": "CVE-2024-0002", "asset": "srv-1", "description": "x"},
+        {"name": "FAIL-lib", "cve_id": "CVE-2024-0003", "asset": "srv-2", "description": "x"},
+        {"name": "openssl", "cve_id": "CVE-2024-0001", "asset": "srv-3", "description": "x"},
+    ]
+    return coll.insert_many(docs).inserted_ids
+
+
+def test_bulk_create_with_per_item_failure(coll, jira, findings):
+    out = ticketing.create_issues_batch(findings, collection=coll)
+    res = out["results"]
+    assert [r.get("status") for r in res] == ["created", "created", None, "created"]
+    assert "error" in res[2]
+    # mesma CVE: uma issue só para os dois findings
+    assert res[0]["jira_key"] == res[3]["jira_key"]
+    assert (out["created"], out["failed"], out["jira_issues"]) == (3, 1, 2)
+    assert len(jira.issues) == 2
+
+
+def test_second_run_links_through_ledger(coll, jira, findings):
+    ticketing.create_issues_batch(findings, collection=coll)
+    first = len(jira.issues)
+    out = ticketing.create_issues_batch(findings, collection=coll)
+    res = out["results"]
+    assert [r.get("status") for r in res] == ["linked", "linked", None, "linked"]
+    assert out["llm_generations"] == 0
+    assert len(jira.issues) == first
+
+
+def test_unknown_and_invalid_ids(coll, jira, findings):
+    from bson import ObjectId
+    out = ticketing.create_issues_batch([ObjectId(), "nao-e-id"], collection=coll)
+    assert [r["error"] == "not_found" for r in out["results"]] == [True, False]
+    assert out["failed"] == 2 and not jira.issues
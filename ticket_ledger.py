@@ -0,0 +1,134 @@
+"""
+Registro dos tickets já abertos, indexado pela impressão digital do
+finding (cve_id + nome normalizado + ativo). Evita issues duplicadas e
+chamadas repetidas ao LLM.
+"""
+from __future__ import annotations
+import hashlib
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, UpdateMany, UpdateOne
+
+LEDGER_COLLECTION = "ticket_ledger"
+
+_WS = re.compile(r"\s+")
+
+
+def _default_collection():
+    from db import vulnerabilities_collection
+    return vulnerabilities_collection
+
+
+def _ledger(collection=None):
+    coll = collection if collection is not None else _default_collection()
+    return coll.database[LEDGER_COLLECTION]
+
+
+def ensure_indexes(collection=None) -> None:
+    led = _ledger(collection)
+    led.create_index([("cve_id", ASCENDING)])
+    led.create_index([("jira_key", ASCENDING)])
+    led.create_index([("finding_ids", ASCENDING)])
+
+
+def _norm(s: Any) -> str:
+    return _WS.sub(" ", str(s or "")).strip().lower()
+
+
+def normalize_cve(value: Any) -> str:
+    if isinstance(value, list):
+        value = ",".join(str(v) for v in value if v)
+    return _norm(value).upper()
+
+
+def asset_of(doc: Dict[str, Any]) -> str:
+    """Ativo do finding: campo 'asset' se existir; senão os ambientes/tags do ativo."""
+    asset = doc.get("asset")
+    if isinstance(asset, dict):
+        asset = asset.get("id") or asset.get("name") or asset.get("hostname")
+    if asset:
+        return _norm(asset)
+    envs = doc.get("environments") or []
+    if isinstance(envs, str):
+        return _norm(envs)
+    parts = []
+    for t in envs if isinstance(envs, list) else []:
+        v = (t.get("value") or t.get("name")) if isinstance(t, dict) else t
+        if v:
+            parts.append(_norm(v))
+    return ",".join(sorted(parts))
+
+
+def asset_key(doc: Dict[str, Any]) -> str:
+    """
+    Só a identidade explícita do ativo (campo 'asset'); '' quando não há.
+    Ambientes/tags são compartilhados por muitos hosts e não identificam um:
+    quem agrupa findings do mesmo ativo (dedup, lifecycle) não agrupa os sem ativo.
+    """
+    asset = doc.get("asset")
+    if isinstance(asset, dict):
+        asset = asset.get("id") or asset.get("name") or asset.get("hostname")
+    return _norm(asset) if asset else ""
+
+
+def fingerprint(doc: Dict[str, Any]) -> str:
+    raw = "|".join((normalize_cve(doc.get("cve_id")), _norm(doc.get("name")), asset_of(doc)))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def lookup(fingerprints: Iterable[str], collection=None) -> Dict[str, Dict[str, Any]]:
+    fps = list(set(fingerprints))
+    if not fps:
+        return {}
+    return {d["_id"]: d for d in _ledger(collection).find({"_id": {"$in": fps}})}
+
+
+def lookup_by_cve(cves: Iterable[str], collection=None) -> Dict[str, Dict[str, Any]]:
+    """Um ticket existente por CVE (o mais antigo), para agrupar findings novos nele."""
+    wanted = [c for c in set(cves) if c]
+    if not wanted:
+        return {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for d in _ledger(collection).find({"cve_id": {"$in": wanted}}).sort("created_at", ASCENDING):
+        out.setdefault(d["cve_id"], d)
+    return out
+
+
+def record(
+    entries: List[Dict[str, Any]],
+    *,
+    jira_key: str,
+    titulo: str,
+    descricao: str,
+    collection=None,
+) -> None:
+    """Grava/atualiza no ledger os findings (com 'fingerprint', 'cve_id', '_id') ligados a jira_key."""
+    now = datetime.now(timezone.utc)
+    ops = [
+        UpdateOne(
+            {"_id": e["fingerprint"]},
+            {
+                "$set": {"jira_key": jira_key, "titulo": titulo, "descricao": descricao, "cve_id": e.get("cve_id") or "", "updated_at": now},
+                "$setOnInsert": {"created_at": now},
+                "$addToSet": {"finding_ids": e["_id"]},
+            },
+            upsert=True,
+        )
+        for e in entries
+    ]
+    if ops:
+        _ledger(collection).bulk_write(ops, ordered=False)
+
+
+def remap_findings(mapping: Dict[Any, Any], collection=None) -> int:
+    """Troca ids de findings mesclados pelo do sobrevivente em finding_ids ({antigo: novo})."""
+    ops = []
+    for old, new in mapping.items():
+        # $addToSet e $pull no mesmo campo não cabem num update só; a ordem do bulk garante a sequência
+        ops.append(UpdateMany({"finding_ids": old}, {"$addToSet": {"finding_ids": new}}))
+        ops.append(UpdateMany({"finding_ids": old}, {"$pull": {"finding_ids": old}}))
+    if not ops:
+        return 0
+    return _ledger(collection).bulk_write(ops, ordered=True).modified_count
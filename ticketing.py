@@ -0,0 +1,203 @@
+"""
+Criação de tickets em lote: uma consulta $in no Mongo, geração de texto
+em lote/streaming (llm_engine.py) e envio pelo endpoint bulk do Jira.
+
+Findings que já têm ticket no ledger (ticket_ledger.py) não geram issue
+nova, e findings do lote que compartilham a mesma CVE viram uma única issue.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import vulnerabilities_collection
+from details import attach_details
+from functions import _to_oid, _extract_for_llm
+from jira_api import JIRA_BULK_MAX, LM_SLOTS, create_issues_bulk, update_issue
+from llm_cache import get_cached, put_cached, fallback_text
+from llm_engine import generate_stream
+import ticket_ledger
+import instrumentation
+
+LLM_BATCH_SIZE = 4
+
+
+def _group_extra(group_docs: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if len(group_docs) < 2:
+        return None
+    names = sorted({str(d.get("name")) for d in group_docs if d.get("name")})
+    return {"findings_afetados": len(group_docs), "componentes": names[:20]}
+
+
+def create_issues_batch(
+    ids: List[Any],
+    project_key: str = "MFLP",
+    issue_type: str = "Task",
+    *,
+    collection=None,
+    max_workers: int = LM_SLOTS,
+    llm_batch_size: int = LLM_BATCH_SIZE,
+    on_existing: str = "skip",  # "skip" | "update"
+    group_by_cve: bool = True,
+    template_fallback: bool = False,
+) -> Dict[str, Any]:
+    """
+    Retorna {'results': [...], 'created': n, 'linked': n, 'updated': n, 'failed': n}.
+    'results' tem um item por id de entrada, na mesma ordem, com 'status'
+    ('created' | 'linked' | 'updated') e 'jira_key', ou 'error'.
+
+    on_existing="skip" só associa o finding ao ticket já registrado;
+    "update" regenera o texto e edita a issue existente (uma vez por issue).
+    template_fallback=True usa um texto padrão quando o LLM falha.
+    llm_batch_size findings vão por prompt e até max_workers prompts em paralelo.
+    """
+    coll = collection if collection is not None else vulnerabilities_collection
+    oids: List[Any] = []
+    results: List[Dict[str, Any]] = []
+    for x in ids:
+        try:
+            oid = _to_oid(x)
+        except Exception as e:
+            oids.append(None)
+            results.append({"_id": str(x), "error": str(e)})
+            continue
+        oids.append(oid)
+        results.append({"_id": str(oid)})
+
+    wanted = list({o for o in oids if o is not None})
+    with instrumentation.span("tickets.load", n=len(wanted)):
+        docs = {d["_id"]: d for d in coll.find({"_id": {"$in": wanted}})} if wanted else {}
+        attach_details(list(docs.values()), coll)
+
+    pending: List[int] = []
+    for i, oid in enumerate(oids):
+        if oid is None:
+            continue
+        if oid not in docs:
+            results[i]["error"] = "not_found"
+            continue
+        doc = docs[oid]
+        results[i]["fingerprint"] = ticket_ledger.fingerprint(doc)
+        results[i]["cve_id"] = ticket_ledger.normalize_cve(doc.get("cve_id"))
+        pending.append(i)
+
+    # 1) o que já tem ticket: pela impressão digital ou (agrupando) pela CVE
+    with instrumentation.span("tickets.ledger_lookup", n=len(pending)):
+        ticket_ledger.ensure_indexes(coll)
+        known = ticket_ledger.lookup((results[i]["fingerprint"] for i in pending), collection=coll)
+        by_cve = ticket_ledger.lookup_by_cve((results[i]["cve_id"] for i in pending), collection=coll) if group_by_cve else {}
+    existing: Dict[str, List[int]] = {}
+    groups: Dict[str, List[int]] = {}
+    for i in pending:
+        entry = known.get(results[i]["fingerprint"]) or by_cve.get(results[i]["cve_id"])
+        if entry is not None:
+            results[i]["jira_key"] = entry["jira_key"]
+            existing.setdefault(entry["jira_key"], []).append(i)
+            continue
+        gkey = ("cve:" + results[i]["cve_id"]) if group_by_cve and results[i]["cve_id"] else ("fp:" + results[i]["fingerprint"])
+        groups.setdefault(gkey, []).append(i)
+
+    # 2) uma geração de texto por issue nova (e por issue a atualizar):
+    #    cache primeiro; o resto vai ao motor em lote/streaming e cada texto
+    #    pronto já segue para o Jira, sem esperar o lote inteiro
+    work: List[tuple] = [("new", members) for members in groups.values()]
+    if on_existing == "update":
+        work += [("update", members) for members in existing.values()]
+    objs: List[Dict[str, Any]] = []
+    for _kind, members in work:
+        group_docs = [docs[oids[i]] for i in members]
+        obj = _extract_for_llm(group_docs[0])
+        obj.update(_group_extra(group_docs) or {})
+        objs.append(obj)
+
+    to_create: List[tuple] = []
+    jira_issues = 0
+
+    def _record(members: List[int], key: str, titulo: str, descricao: str) -> None:
+        ticket_ledger.record(
+            [{"fingerprint": results[i]["fingerprint"], "cve_id": results[i]["cve_id"], "_id": oids[i]} for i in members],
+            jira_key=key, titulo=titulo, descricao=descricao, collection=coll,
+        )
+
+    def _flush() -> None:
+        nonlocal jira_issues
+        if not to_create:
+            return
+        with instrumentation.span("tickets.jira_bulk", n=len(to_create)):
+            jira_out = create_issues_bulk([
+                {"project_key": project_key, "summary": titulo, "description": descricao, "issue_type": issue_type}
+                for _members, (titulo, descricao) in to_create
+            ])
+        for (members, (titulo, descricao)), res in zip(to_create, jira_out):
+            if "error" in res:
+                for i in members:
+                    results[i]["error"] = res["error"]
+                continue
+            jira_issues += 1
+            key = (res.get("jira") or {}).get("key")
+            for i in members:
+                results[i].update({"jira": res["jira"], "jira_key": key, "status": "created"})
+            _record(members, key, titulo, descricao)
+        to_create.clear()
+
+    def _handle(w: int, text: Optional[Tuple[str, str]], err: Optional[str]) -> None:
+        kind, members = work[w]
+        if text is None:
+            if not template_fallback:
+                for i in members:
+                    results[i]["error"] = err
+                return
+            text = fallback_text(objs[w])
+        titulo, descricao = text
+        for i in members:
+            results[i].update({"titulo": titulo, "descricao": descricao})
+        if kind == "new":
+            to_create.append((members, text))
+            if len(to_create) >= JIRA_BULK_MAX:
+                _flush()
+            return
+        key = results[members[0]]["jira_key"]
+        try:
+            update_issue(key, titulo, descricao)
+        except Exception as e:
+            for i in members:
+                results[i]["error"] = f"jira: {e}"
+            return
+        for i in members:
+            results[i]["status"] = "updated"
+        _record(members, key, titulo, descricao)
+
+    misses: List[tuple] = []
+    for w, obj in enumerate(objs):
+        hit = get_cached(obj, collection=coll)
+        if hit is not None:
+            _handle(w, hit, None)
+        else:
+            misses.append((w, obj))
+    instrumentation.count("tickets.llm_cache_hits", len(objs) - len(misses))
+    # inclui o envio ao Jira dos lotes que fecham durante o streaming
+    with instrumentation.span("tickets.generate", n=len(misses)):
+        for w, text, err in generate_stream(misses, batch_size=llm_batch_size, concurrency=max_workers):
+            if text is not None:
+                put_cached(objs[w], text[0], text[1], collection=coll)
+            _handle(w, text, err)
+        _flush()
+
+    if on_existing != "update":
+        for key, members in existing.items():
+            for i in members:
+                results[i]["status"] = "linked"
+            first = known.get(results[members[0]]["fingerprint"]) or by_cve.get(results[members[0]]["cve_id"]) or {}
+            _record(members, key, first.get("titulo", ""), first.get("descricao", ""))
+
+    summary = {
+        "created": 0, "linked": 0, "updated": 0, "failed": 0,
+        "llm_generations": len(misses),
+        "jira_issues": jira_issues,
+    }
+    for r in results:
+        if "error" in r:
+            summary["failed"] += 1
+        else:
+            summary[r["status"]] += 1
+    for k in ("created", "linked", "updated", "failed"):
+        instrumentation.count(f"tickets.{k}", summary[k])
+    return {"results": results, **summary}
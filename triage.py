@@ -0,0 +1,149 @@
+"""
+Triagem por capacidade sobre os scores persistidos.
+
+Mesma regra de triage_select_raw (os `capacity` findings de maior score,
+sem os marcados como OK), mas sem carregar a população nem re-scorear:
+o limiar de capacidade sai do histograma de base_score e os findings vêm
+de uma consulta ordenada pelo índice de base_score, parando assim que a
+capacidade é preenchida.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional
+
+from db import vulnerabilities_collection
+from calculator_helper import has_ok_tag
+from functions import build_filter_query, in_date_range, _parse_date_any
+from rollups import load_histogram
+from score_meta import get_score_meta, map_projection, resolve_scores, score_fields
+import instrumentation
+
+TRIAGE_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "date": 1,
+    "cve_id": 1,
+    "cvss": 1,
+    "epss": 1,
+    "companyCriticality": 1,
+    "base_score": 1,
+    "priority_class": 1,
+    "environments": 1,
+    "tags": 1,
+    "family": 1,
+}
+
+
+def capacity_threshold(capacity: int, *, collection=None) -> Optional[float]:
+    """
+    Limite inferior do bucket do histograma de base_score em que a contagem
+    acumulada (do maior para o menor) alcança `capacity`. Vale para a
+    população inteira; None se o histograma não chega a `capacity`.
+    """
+    hist = load_histogram("base_score", collection=collection)
+    acc = 0
+    for row in sorted(hist, key=lambda r: r["bucket"], reverse=True):
+        acc += int(row.get("count", 0))
+        if acc >= capacity:
+            return float(row["bucket"])
+    return None
+
+
+def _ranked(
+    coll, q: Dict[str, Any], bound: Optional[float], batch_size: int, fields: Dict[str, str],
+) -> Iterator[Dict[str, Any]]:
+    """Findings em ordem de score desc; com `bound`, primeiro a faixa >= bound e depois o resto."""
+    ranges = [{"$gte": bound}, {"$lt": bound}] if bound is not None else [{"$type": "number"}]
+    f_score = fields["score"]
+    proj = map_projection(TRIAGE_PROJECTION, fields)
+    for rng in ranges:
+        cur = coll.find({**q, f_score: rng}, proj).sort(f_score, -1).batch_size(batch_size)
+        try:
+            for doc in cur:
+                yield resolve_scores(doc, fields)
+        finally:
+            cur.close()
+
+
+def triage(
+    capacity: int,
+    *,
+    ambientes: Optional[List[str] | str] = None,
+    tipos: Optional[List[str] | str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    suppress_ok: bool = True,
+    exclude_ids: Optional[set] = None,
+    collection=None,
+) -> Dict[str, Any]:
+    """
+    Retorna {'selected', 'threshold_capacity', 't3', 'cutoff_score', 'scanned', 'unscored'}.
+    'selected' tem exatamente `capacity` findings (ou todos os elegíveis, se houver menos).
+    'threshold_capacity' é a estimativa pelo histograma (só sem filtros) e
+    'cutoff_score' o score do último selecionado.
+    """
+    coll = collection if collection is not None else vulnerabilities_collection
+    if capacity <= 0:
+        return {"selected": [], "threshold_capacity": None, "t3": None, "cutoff_score": None, "scanned": 0, "unscored": False}
+
+    meta = get_score_meta(coll)
+    fields = score_fields(meta=meta)
+    with instrumentation.span("triage.select", capacity=capacity) as sp:
+        q = build_filter_query(ambientes=ambientes, tipos=tipos)
+        filtered = bool(q) or bool(start_date or end_date) or bool(exclude_ids)
+        # sem filtros, o histograma limita a faixa lida; com filtros a
+        # varredura ordenada pelo índice já para cedo
+        bound = None if filtered else capacity_threshold(capacity, collection=coll)
+        sd = _parse_date_any(start_date) if start_date else None
+        ed = _parse_date_any(end_date) if end_date else None
+
+        selected: List[Dict[str, Any]] = []
+        scanned = 0
+        for doc in _ranked(coll, q, bound, min(max(capacity * 2, 100), 5000), fields):
+            scanned += 1
+            if exclude_ids and doc["_id"] in exclude_ids:
+                continue
+            if suppress_ok and has_ok_tag(doc):
+                continue
+            if (sd or ed) and not in_date_range(doc, sd, ed):
+                continue
+            selected.append(doc)
+            if len(selected) >= capacity:
+                break
+        sp.set(scanned=scanned, selected=len(selected))
+
+    t3 = (meta.get("thresholds_raw") or {}).get("t3")
+    unscored = coll.find_one({fields["class"]: {"$in": [None, ""]}}, {"_id": 1}) is not None
+    return {
+        "selected": selected,
+        "threshold_capacity": bound,
+        "t3": t3,
+        "cutoff_score": float(selected[-1]["base_score"]) if selected else None,
+        "scanned": scanned,
+        # findings ingeridos depois do último re-score ainda não entram na ordem
+        "unscored": unscored,
+    }
+
+
+def triage_teams(teams: Dict[str, Dict[str, Any]], *, suppress_ok: bool = True, collection=None) -> Dict[str, Any]:
+    """
+    Divide a triagem entre times/projetos. `teams` mapeia o nome para
+    {'capacity': n, 'ambientes'?, 'tipos'?, 'start_date'?, 'end_date'?}; os
+    times são atendidos na ordem dada e um finding vai para um único time.
+    """
+    taken: set = set()
+    out: Dict[str, Any] = {}
+    for name, spec in teams.items():
+        res = triage(
+            int(spec.get("capacity", 0)),
+            ambientes=spec.get("ambientes"),
+            tipos=spec.get("tipos"),
+            start_date=spec.get("start_date"),
+            end_date=spec.get("end_date"),
+            suppress_ok=suppress_ok,
+            exclude_ids=taken,
+            collection=collection,
+        )
+        taken.update(d["_id"] for d in res["selected"])
+        out[name] = res
+    return {"teams": out, "total": len(taken)}
+
@@ -1,12 +1,64 @@
+import re
+
+CVE_RE = re.compile(r"CVE-\d{4}-\d{4,}", re.IGNORECASE)
+
+
+def extract_cve_ids(value) -> list[str]:
+    """CVEs normalizados (maiúsculas, sem repetição, na ordem) de uma string, lista ou 'a, b'."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        parts = [str(v) for v in value if v]
+    else:
+        parts = [str(value)]
+    out: list[str] = []
+    for p in parts:
+        for m in CVE_RE.findall(p):
+            cve = m.upper()
+            if cve not in out:
+                out.append(cve)
+    return out
+
+
+# campos de identidade do ativo nos documentos de origem, em ordem de preferência
+ASSET_KEYS = ("asset", "asset_id", "asset_name", "hostname", "host", "ip", "ip_address", "target")
+# dentro de um subdocumento de ativo (modelo2: doc['asset'])
+ASSET_SUBKEYS = ("id", "name", "hostname", "host", "ip", "ip_address")
+
+
+def _asset_value(value) -> str | None:
+    if isinstance(value, dict):
+        return extract_asset(value, ASSET_SUBKEYS)
+    if isinstance(value, (str, int)) and not isinstance(value, bool):
+        return str(value).strip() or None
+    return None
+
+
+def extract_asset(doc, keys=ASSET_KEYS) -> str | None:
+    """Identidade do ativo (host, ip, id) num documento de scanner; None se não houver."""
+    if not isinstance(doc, dict):
+        return None
+    for key in keys:
+        found = _asset_value(doc.get(key))
+        if found:
+            return found
+    return None
+
+
 class Vulnerability:
-    def __init__(self, name: str, description: str, cve_id: str, family: str | None, epss: float | None, date: str, environments: list[str], companyCriticality: int, base_score: float = 0, priority_class: str = "" ):
+    def __init__(self, name: str, description: str, cve_id: str, family: str | None, epss: float | None, date: str, environments: list[str], companyCriticality: int, base_score: float = 0, priority_class: str = "", cve_ids: list[str] | None = None, source: dict | None = None, asset: str | None = None):
         self.name = name
         self.description = description
         self.cve_id = cve_id
+        self.cve_ids = cve_ids if cve_ids is not None else extract_cve_ids(cve_id)
         self.family = family
         self.epss = epss
         self.date = date
         self.environments = environments
         self.companyCriticality = companyCriticality
         self.base_score = base_score 
-        self.priority_class = priority_class
\ No newline at end of file
+        self.priority_class = priority_class
+        # scanner de origem: {'model': 'modelo1' | 'modelo2', 'id': _id no modelo}
+        self.source = source
+        # host/ip/id do ativo; sem ele o finding não é comparado a nenhum outro
+        self.asset = asset
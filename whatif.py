@@ -0,0 +1,214 @@
+"""
+Simulação "what-if" de pesos sem gravar no Mongo.
+
+As colunas robust-z (mediana + MAD, cap [-3,3]) não dependem dos pesos,
+então são calculadas uma vez por base (build_feature_columns) e cada vetor
+de pesos custa só o produto escalar + cortes sobre os scores.
+"""
+from __future__ import annotations
+import heapq
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+from calculator import normalize_item, weights_to_params
+from calculator_helper import (
+    ScoringPlan,
+    clamp,
+    _robust_z_list,
+    _extract_fields_cfg,
+    _kmeans_1d_thresholds,
+    _percentile,
+)
+
+FEATURE_FIELDS = ["cve", "epss", "companyCriticality", "date_norm"]
+
+WHATIF_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "date": 1,
+    "cve_id": 1,
+    "cvss": 1,
+    "cve": 1,
+    "epss": 1,
+    "companyCriticality": 1,
+}
+
+
+def _to_010(v: Any) -> float:
+    try:
+        x = float(v if v is not None else 0)
+    except Exception:
+        x = 0.0
+    return clamp(x, 0.0, 10.0)
+
+
+def build_feature_columns(
+    collection=None,
+    *,
+    query: Optional[Dict[str, Any]] = None,
+    fields: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Lê a base uma vez e devolve {'ids', 'labels', 'rz': {campo: [z...]}, 'n'}.
+    Mesmo contrato de compute_raw_scores_dynamic: valores em 0..10 e robust-z por campo.
+    """
+    if collection is None:
+        from db import vulnerabilities_collection as collection
+    fields = fields or FEATURE_FIELDS
+    ids: List[Any] = []
+    labels: List[Dict[str, Any]] = []
+    cols: Dict[str, List[float]] = {f: [] for f in fields}
+    for doc in collection.find(query or {}, WHATIF_PROJECTION):
+        it = normalize_item(doc)
+        ids.append(doc.get("_id"))
+        labels.append({"name": doc.get("name"), "cve_id": doc.get("cve_id"), "date": doc.get("date")})
+        for f in fields:
+            cols[f].append(_to_010(it.get(f, 0)))
+    rz = {f: _robust_z_list(cols[f], cap=3.0) for f in fields}
+    return {"ids": ids, "labels": labels, "rz": rz, "n": len(ids)}
+
+
+def build_feature_columns_from_store(
+    store,
+    *,
+    collection=None,
+    fields: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Como build_feature_columns, mas a partir do feature store local: colunas
+    numpy sem ler o Mongo. Os labels (name/cve_id/date) são buscados só para
+    o top-N de cada what_if.
+    """
+    from feature_store import robust_z
+
+    if collection is None:
+        from db import vulnerabilities_collection as collection
+    fields = fields or FEATURE_FIELDS
+    plan = ScoringPlan({"fields": {f: {"weight": 1.0} for f in fields}})
+    live = store.live_rows()
+    rows = None if len(live) == store.n else live
+    cols = store.feature_columns(plan, rows)
+    rz = {f: robust_z(cols[f]) for f in fields}
+    return {"ids": None, "labels": None, "rz": rz, "n": len(live), "rows": live, "store": store, "collection": collection}
+
+
+def score_columns(columns: Dict[str, Any], weights: Dict[str, float]) -> List[float]:
+    """Produto escalar pesos x colunas robust-z (pesos limitados a [-2,2])."""
+    names, ws = _extract_fields_cfg(weights_to_params(weights))
+    n = columns["n"]
+    if columns.get("store") is not None:
+        import numpy as np
+        acc = np.zeros(n)
+        for f in names:
+            col = columns["rz"].get(f)
+            if col is not None and ws[f]:
+                acc += col * ws[f]
+        return np.round(acc, 6)
+    scores = [0.0] * n
+    for f in names:
+        col = columns["rz"].get(f)
+        w = ws[f]
+        if col is None or not w:
+            # campo sem coluna equivale a uma coluna constante: robust-z 0
+            continue
+        scores = [s + z * w for s, z in zip(scores, col)]
+    return [round(s, 6) for s in scores]
+
+
+def what_if(
+    columns: Dict[str, Any],
+    weights: Dict[str, float],
+    *,
+    top_n: int = 20,
+    cut_mode: str = "kmeans",
+    quantile_cuts=(0.50, 0.80, 0.95),
+) -> Dict[str, Any]:
+    """Ranking top-N e contagem por classe para um vetor de pesos, sem escrita."""
+    scores = score_columns(columns, weights)
+    n = len(scores)
+    if not n:
+        return {"thresholds_raw": {"t1": 0.0, "t2": 0.0, "t3": 0.0}, "counts": {}, "top": [], "population": 0}
+    if columns.get("store") is not None:
+        return _what_if_arrays(columns, scores, top_n=top_n, cut_mode=cut_mode, quantile_cuts=quantile_cuts)
+
+    xs = sorted(scores)
+    if xs[0] == xs[-1]:
+        t1 = t2 = t3 = xs[0]
+        counts = {"baixa": 0, "media": n, "alta": 0, "gravissima": 0}
+    else:
+        if cut_mode == "kmeans":
+            t1, t2, t3 = _kmeans_1d_thresholds(xs, k=4)
+        else:
+            t1, t2, t3 = (_percentile(xs, q) for q in quantile_cuts)
+        c1, c2, c3 = bisect_right(xs, t1), bisect_right(xs, t2), bisect_right(xs, t3)
+        counts = {"baixa": c1, "media": c2 - c1, "alta": c3 - c2, "gravissima": n - c3}
+
+    def _cls(s: float) -> str:
+        if xs[0] == xs[-1]:
+            return "media"
+        if s <= t1:
+            return "baixa"
+        if s <= t2:
+            return "media"
+        if s <= t3:
+            return "alta"
+        return "gravissima"
+
+    top_idx = heapq.nlargest(max(0, int(top_n)), range(n), key=scores.__getitem__)
+    top = [
+        {"_id": columns["ids"][i], **columns["labels"][i], "_raw_score": scores[i], "_class": _cls(scores[i])}
+        for i in top_idx
+    ]
+    return {
+        "thresholds_raw": {"t1": round(t1, 6), "t2": round(t2, 6), "t3": round(t3, 6)},
+        "counts": counts,
+        "top": top,
+        "population": n,
+    }
+
+
+def _what_if_arrays(columns: Dict[str, Any], scores, *, top_n: int, cut_mode: str, quantile_cuts) -> Dict[str, Any]:
+    """what_if vetorizado para colunas vindas do feature store."""
+    import numpy as np
+    from feature_store import _percentile_sorted, kmeans_thresholds, top_rows
+
+    n = len(scores)
+    xs = np.sort(scores)
+    if xs[0] == xs[-1]:
+        t1 = t2 = t3 = float(xs[0])
+        counts = {"baixa": 0, "media": n, "alta": 0, "gravissima": 0}
+    else:
+        if cut_mode == "kmeans":
+            t1, t2, t3 = kmeans_thresholds(xs, k=4)
+        else:
+            t1, t2, t3 = (_percentile_sorted(xs, q) for q in quantile_cuts)
+        c1, c2, c3 = np.searchsorted(xs, [t1, t2, t3], side="right").tolist()
+        counts = {"baixa": c1, "media": c2 - c1, "alta": c3 - c2, "gravissima": n - c3}
+
+    def _cls(s: float) -> str:
+        if xs[0] == xs[-1]:
+            return "media"
+        if s <= t1:
+            return "baixa"
+        if s <= t2:
+            return "media"
+        if s <= t3:
+            return "alta"
+        return "gravissima"
+
+    pos = top_rows(scores, top_n)
+    ids = columns["store"].ids_at(columns["rows"][pos])
+    labels = {
+        d["_id"]: {"name": d.get("name"), "cve_id": d.get("cve_id"), "date": d.get("date")}
+        for d in columns["collection"].find({"_id": {"$in": ids}}, {"_id": 1, "name": 1, "cve_id": 1, "date": 1})
+    }
+    top = [
+        {"_id": _id, **labels.get(_id, {}), "_raw_score": float(scores[p]), "_class": _cls(float(scores[p]))}
+        for _id, p in zip(ids, pos.tolist())
+    ]
+    return {
+        "thresholds_raw": {"t1": round(t1, 6), "t2": round(t2, 6), "t3": round(t3, 6)},
+        "counts": counts,
+        "top": top,
+        "population": n,
+    }